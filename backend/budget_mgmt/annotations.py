@@ -0,0 +1,87 @@
+"""
+Correlated-subquery annotations for BudgetEntry responses.
+
+Comment status (count, latest type, unresolved REQUEST/QUESTION) and the
+summary list detail count are computed in SQL per entry instead of scanning
+prefetched comment rows in the serializer, so the cost of a grid row does
+not grow with the length of its discussion thread.
+"""
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import BudgetDetail, BudgetEntry, SubmissionComment
+
+COMMENT_STATUS_FIELDS = ('comment_count', 'latest_comment_type', 'has_unresolved_request', 'has_unresolved_question')
+
+
+def count_subquery(queryset):
+    """COUNT(*) of a queryset correlated on ``entry_id`` (0 when empty)."""
+    counted = queryset.order_by().values('entry_id').annotate(n=Count('id')).values('n')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def unresolved_comment_exists(comment_type, resolver_type):
+    """
+    A top-level ``comment_type`` comment without a ``resolver_type`` reply and
+    with no newer top-level DONE/ANSWER comment (which resolves everything
+    before it).
+    """
+    visible = SubmissionComment.objects.filter(is_deleted=False)
+    resolved_reply = visible.filter(parent_id=OuterRef('pk'), comment_type=resolver_type)
+    resolved_later = visible.filter(
+        entry_id=OuterRef('entry_id'),
+        parent__isnull=True,
+        comment_type__in=('DONE', 'ANSWER'),
+        created_at__gt=OuterRef('created_at'),
+    )
+    return Exists(
+        visible.filter(entry_id=OuterRef('pk'), parent__isnull=True, comment_type=comment_type)
+        .exclude(Exists(resolved_reply))
+        .exclude(Exists(resolved_later))
+    )
+
+
+def comment_status_annotations():
+    latest_comment = (
+        SubmissionComment.objects
+        .filter(entry_id=OuterRef('pk'), is_deleted=False, parent__isnull=True)
+        .order_by('-created_at', '-id')
+    )
+    return {
+        'comment_count': count_subquery(SubmissionComment.objects.filter(entry_id=OuterRef('pk'), is_deleted=False)),
+        'latest_comment_type': Subquery(latest_comment.values('comment_type')[:1]),
+        'has_unresolved_request': unresolved_comment_exists('REQUEST', 'DONE'),
+        'has_unresolved_question': unresolved_comment_exists('QUESTION', 'ANSWER'),
+    }
+
+
+def entry_summary_annotations():
+    """Comment status plus detail count for ``?view=summary``."""
+    return {
+        **comment_status_annotations(),
+        'detail_count': count_subquery(BudgetDetail.objects.filter(entry_id=OuterRef('pk'))),
+    }
+
+
+def ensure_comment_status(entry):
+    """Fill comment status on an entry that was not loaded with the annotations (one query)."""
+    if hasattr(entry, 'has_unresolved_request'):
+        return entry
+    row = {}
+    if entry.pk is not None:
+        row = (
+            BudgetEntry.objects.filter(pk=entry.pk)
+            .annotate(**comment_status_annotations())
+            .values(*COMMENT_STATUS_FIELDS)
+            .first()
+        ) or {}
+    entry.comment_count = row.get('comment_count', 0)
+    entry.latest_comment_type = row.get('latest_comment_type')
+    entry.has_unresolved_request = bool(row.get('has_unresolved_request'))
+    entry.has_unresolved_question = bool(row.get('has_unresolved_question'))
+    return entry
+
+
+def unresolved_types(entry):
+    flags = (('REQUEST', entry.has_unresolved_request), ('QUESTION', entry.has_unresolved_question))
+    return [comment_type for comment_type, unresolved in flags if unresolved]
@@ -1,6 +1,25 @@
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def repair_search_triggers(sender, using, **kwargs):
+    # Altering ApprovalLog on SQLite rebuilds the table and drops the FTS sync triggers.
+    from .audit_search import repair_sqlite_triggers
+
+    repair_sqlite_triggers(connections[using])
 
 
 class BudgetMgmtConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'budget_mgmt'
+
+    def ready(self):
+        post_migrate.connect(repair_search_triggers, sender=self)
+        if settings.BUDGET_BOOK_TEMPLATE_WARMUP:
+            from .services.budget_book_template import warm_template_cache
+
+            threading.Thread(target=warm_template_cache, daemon=True, name='budget-book-template-warmup').start()
@@ -1,6 +1,11 @@
 import logging
 
-from .models import ApprovalLog
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import ApprovalLog, BudgetEntry
 
 logger = logging.getLogger(__name__)
 
@@ -46,10 +51,9 @@ def write_audit_log(
                 user_agent = user_agent[:255]
 
         payload = metadata if isinstance(metadata, dict) else {}
-
-        ApprovalLog.objects.create(
-            entry=entry,
-            actor=actor_obj,
+        record = dict(
+            entry_id=getattr(entry, 'pk', None),
+            actor_id=getattr(actor_obj, 'pk', None),
             log_type=log_type or 'SYSTEM',
             action=action or 'EVENT',
             from_status=from_status,
@@ -63,6 +67,132 @@ def write_audit_log(
             ip_address=get_client_ip(request),
             user_agent=user_agent,
             metadata=payload,
+            created_at=timezone.now(),
         )
+
+        if entry is None and settings.AUDIT_LOG_ASYNC:
+            # Entry-bound logs stay synchronous: they drive the entry's activity fields.
+            transaction.on_commit(lambda: _submit_buffered(record))
+            return
+
+        # The post_save receiver updates the entry's activity fields in the same transaction.
+        with transaction.atomic():
+            ApprovalLog.objects.create(**record)
     except Exception:
         logger.exception('write_audit_log failed')
+
+
+def _submit_buffered(record):
+    try:
+        from .audit_writer import audit_writer
+
+        buffered = audit_writer.submit(record)
+    except Exception:
+        logger.exception('audit log buffer unavailable, writing directly')
+        buffered = False
+    if buffered:
+        return
+    try:
+        ApprovalLog.objects.create(**record)  # buffer full or no spool: write through
+    except Exception:
+        logger.exception('write_audit_log failed')
+
+
+def _is_submit_transition(log):
+    return log.to_status == 'PENDING' or (log.from_status == 'DRAFT' and log.to_status != 'DRAFT')
+
+
+# SQL form of _is_submit_transition (exclude() keeps NULL to_status, like the Python check)
+SUBMIT_TRANSITION_Q = Q(to_status='PENDING') | (Q(from_status='DRAFT') & ~Q(to_status='DRAFT'))
+
+
+def _order(log):
+    return (log.created_at, log.pk or 0)
+
+
+def record_entry_activity(logs):
+    """
+    Copy freshly written entry logs onto BudgetEntry.latest_action_* and
+    submitted_*. Runs from the ApprovalLog post_save receiver; callers that
+    bulk_create logs call it themselves in the same transaction.
+    submitted_* follows the latest PENDING transition, else the first
+    transition out of DRAFT, else the entry's oldest log.
+    """
+    latest, pending, first_transition, oldest = {}, {}, {}, {}
+    for log in logs:
+        entry_id = log.entry_id
+        if not entry_id:
+            continue
+        if entry_id not in latest or _order(log) >= _order(latest[entry_id]):
+            latest[entry_id] = log
+        if log.to_status == 'PENDING' and (entry_id not in pending or _order(log) >= _order(pending[entry_id])):
+            pending[entry_id] = log
+        if _is_submit_transition(log) and (entry_id not in first_transition or _order(log) < _order(first_transition[entry_id])):
+            first_transition[entry_id] = log
+        if entry_id not in oldest or _order(log) < _order(oldest[entry_id]):
+            oldest[entry_id] = log
+    if not latest:
+        return
+
+    BudgetEntry.objects.bulk_update(
+        [
+            BudgetEntry(pk=entry_id, latest_action_at=log.created_at, latest_action_by_id=log.actor_id)
+            for entry_id, log in latest.items()
+        ],
+        ['latest_action_at', 'latest_action_by'],
+    )
+
+    submits = dict(pending)
+    rest = [entry_id for entry_id in latest if entry_id not in submits]
+    transitions = [entry_id for entry_id in rest if entry_id in first_transition]
+    if transitions:
+        # An earlier transition (or any PENDING log) already decided submitted_*.
+        settled = set(
+            ApprovalLog.objects.filter(SUBMIT_TRANSITION_Q, entry_id__in=transitions)
+            .exclude(pk__in=[log.pk for log in logs if log.pk])
+            .values_list('entry_id', flat=True)
+        )
+        submits.update({entry_id: first_transition[entry_id] for entry_id in transitions if entry_id not in settled})
+    fallbacks = [entry_id for entry_id in rest if entry_id not in submits]
+    if fallbacks:
+        unsubmitted = BudgetEntry.objects.filter(id__in=fallbacks, submitted_at__isnull=True).values_list('id', flat=True)
+        submits.update({entry_id: oldest[entry_id] for entry_id in unsubmitted})
+    if submits:
+        BudgetEntry.objects.bulk_update(
+            [
+                BudgetEntry(pk=entry_id, submitted_at=log.created_at, submitted_by_id=log.actor_id)
+                for entry_id, log in submits.items()
+            ],
+            ['submitted_at', 'submitted_by'],
+        )
+
+
+def rebuild_entry_activity(entries, logs):
+    """
+    Recompute the activity fields of an entry queryset from ``logs`` (an
+    ApprovalLog queryset/manager) with correlated-subquery UPDATEs.
+    """
+    entry_logs = logs.filter(entry_id=OuterRef('pk'))
+    latest = entry_logs.order_by('-created_at', '-id')
+    pending = entry_logs.filter(to_status='PENDING').order_by('-created_at', '-id')
+    first_transition = entry_logs.filter(SUBMIT_TRANSITION_Q).order_by('created_at', 'id')
+    oldest = entry_logs.order_by('created_at', 'id')
+    entries.update(submitted_at=None, submitted_by=None, latest_action_at=None, latest_action_by=None)
+    entries.filter(Exists(latest)).update(
+        latest_action_at=Subquery(latest.values('created_at')[:1]),
+        latest_action_by=Subquery(latest.values('actor_id')[:1]),
+    )
+    for source in (pending, first_transition, oldest):
+        entries.filter(submitted_at__isnull=True).filter(Exists(source)).update(
+            submitted_at=Subquery(source.values('created_at')[:1]),
+            submitted_by=Subquery(source.values('actor_id')[:1]),
+        )
+
+
+def backfill_entry_activity(queryset=None, *, batch_size=1000):
+    """Populate activity fields for existing entries in id batches. Returns entries processed."""
+    queryset = BudgetEntry.objects.all() if queryset is None else queryset
+    ids = list(queryset.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), batch_size):
+        rebuild_entry_activity(BudgetEntry.objects.filter(id__in=ids[start:start + batch_size]), ApprovalLog.objects.all())
+    return len(ids)
@@ -0,0 +1,110 @@
+"""
+Indexed keyword/actor search for ApprovalLog (/api/logs/ ``q`` and ``actor``).
+
+On SQLite, migration 0039 creates an FTS5 trigram table over reason, path,
+resource_type and resource_id, with ApprovalLog as its external content and
+triggers that keep it in sync on every insert, update and delete (bulk ones
+included). Rebuilding ApprovalLog (SQLite's way of altering a column)
+drops those triggers, so ``fts_available`` requires them and a post_migrate
+hook puts them back with ``repair_sqlite_triggers``. A quoted trigram phrase is a case-insensitive substring match,
+so ``icontains`` semantics are unchanged; keywords under three characters
+cannot use trigrams and fall back to the scan.
+
+Actor names are matched against the users table (small) and applied as an
+``actor_id IN`` filter, so renamed users are found under their current
+name exactly as the join did. On PostgreSQL the migration adds pg_trgm GIN
+indexes that serve the plain ``icontains`` predicates directly.
+"""
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+LOG_TABLE = 'budget_mgmt_approvallog'
+SEARCH_TABLE = 'budget_mgmt_approvallog_search'
+TRIGGER_NAMES = tuple(f'{SEARCH_TABLE}_{suffix}' for suffix in ('ai', 'ad', 'au'))
+SEARCH_COLUMNS = ('reason', 'path', 'resource_type', 'resource_id')
+MIN_TRIGRAM_LENGTH = 3
+
+_fts_tables = {}
+
+
+def _sqlite_search_objects(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE (type = 'table' AND name = %s) OR (type = 'trigger' AND tbl_name = %s)",
+            [SEARCH_TABLE, LOG_TABLE],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def fts_available(conn=None):
+    """True when the FTS table exists and its sync triggers are still attached to ApprovalLog."""
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return False
+    name = conn.settings_dict['NAME']
+    if name not in _fts_tables:
+        _fts_tables[name] = {SEARCH_TABLE, *TRIGGER_NAMES} <= _sqlite_search_objects(conn)
+    return _fts_tables[name]
+
+
+def repair_sqlite_triggers(conn=None):
+    """Recreate missing sync triggers and re-index the FTS table. Returns True if anything was repaired."""
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return False
+    _fts_tables.pop(conn.settings_dict['NAME'], None)
+    existing = _sqlite_search_objects(conn)
+    if SEARCH_TABLE not in existing or set(TRIGGER_NAMES) <= existing:
+        return False
+    with conn.cursor() as cursor:
+        for trigger in TRIGGER_NAMES:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        for statement in sqlite_trigger_sql():
+            cursor.execute(statement)
+        # Rows written while the triggers were gone are not indexed yet
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def _phrase(keyword):
+    return '"' + keyword.replace('"', '""') + '"'
+
+
+def actor_q(term):
+    """Logs whose actor's username or first name contains ``term``."""
+    actors = User.objects.filter(Q(username__icontains=term) | Q(first_name__icontains=term)).values('id')
+    return Q(actor_id__in=actors)
+
+
+def keyword_q(keyword):
+    """Logs with ``keyword`` in reason, path, resource_type, resource_id or the actor's names."""
+    if len(keyword) >= MIN_TRIGRAM_LENGTH and fts_available():
+        matches = RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [_phrase(keyword)])
+        return Q(id__in=matches) | actor_q(keyword)
+    return (
+        Q(reason__icontains=keyword) |
+        Q(path__icontains=keyword) |
+        Q(resource_type__icontains=keyword) |
+        Q(resource_id__icontains=keyword) |
+        actor_q(keyword)
+    )
+
+
+def _columns(prefix=''):
+    return ', '.join(f'{prefix}{column}' for column in SEARCH_COLUMNS)
+
+
+def sqlite_trigger_sql():
+    """The sync triggers as created by migration 0039."""
+    columns = _columns()
+    return [
+        f"CREATE TRIGGER {SEARCH_TABLE}_ai AFTER INSERT ON {LOG_TABLE} BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES (new.id, {_columns('new.')}); END",
+        f"CREATE TRIGGER {SEARCH_TABLE}_ad AFTER DELETE ON {LOG_TABLE} BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {_columns('old.')}); END",
+        f"CREATE TRIGGER {SEARCH_TABLE}_au AFTER UPDATE OF {columns} ON {LOG_TABLE} BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {_columns('old.')}); "
+        f"INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES (new.id, {_columns('new.')}); END",
+    ]
@@ -0,0 +1,274 @@
+"""
+Buffered ApprovalLog writer for request-level audit records.
+
+With AUDIT_LOG_ASYNC on, ``write_audit_log`` hands records that are not
+tied to an entry to ``audit_writer`` once the surrounding transaction
+commits. Each record is appended to this process's spool segment (a local
+NDJSON file) and to a bounded in-memory batch. A daemon flusher
+bulk_creates the batch once AUDIT_LOG_BATCH_SIZE records are waiting or
+AUDIT_LOG_FLUSH_INTERVAL seconds have passed, then deletes the segment.
+
+Segments are named ``audit-<pid>-<token>-<seq>.open`` (the random token
+keeps a reused PID from reopening a dead process's segment). The writer
+holds an exclusive ``flock`` on its segment from creation until the batch is
+inserted and the file unlinked (or renamed to ``.ready`` when the insert
+fails); the lock goes away with the process, whatever PID comes next. The
+next flush in any process and ``manage.py flush_audit_spool`` replay every
+segment they can lock, holding the lock while they insert it
+(at-least-once: a crash between insert and unlink replays it again).
+
+Every appended record is fsync'ed before ``submit`` returns: until the
+batch is inserted the segment is its only copy. Without ``fcntl``
+(Windows) segments cannot be locked, so ``submit`` declines and callers
+write their record directly.
+
+Backpressure: when AUDIT_LOG_MAX_BUFFER records are waiting, callers block
+up to AUDIT_LOG_BLOCK_TIMEOUT seconds and then write their record directly.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.utils.dateparse import parse_datetime
+
+from .models import ApprovalLog, BudgetEntry
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, records are written directly
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_RE = re.compile(r'^(audit-[0-9a-f-]+)\.(open|ready|replay-\d+)$')
+INSERT_BATCH_SIZE = 500
+
+
+def _encode(record):
+    data = dict(record)
+    data['created_at'] = data['created_at'].isoformat()
+    return json.dumps(data, ensure_ascii=False, default=str) + '\n'
+
+
+def _decode(line):
+    data = json.loads(line)
+    data['created_at'] = parse_datetime(data['created_at'])
+    return data
+
+
+def insert_records(records):
+    """bulk_create ApprovalLog rows from record dicts; references deleted since are dropped."""
+    if not records:
+        return 0
+    actor_ids = {r['actor_id'] for r in records if r.get('actor_id')}
+    entry_ids = {r['entry_id'] for r in records if r.get('entry_id')}
+    live_actors = set(User.objects.filter(id__in=actor_ids).values_list('id', flat=True)) if actor_ids else set()
+    live_entries = set(BudgetEntry.objects.filter(id__in=entry_ids).values_list('id', flat=True)) if entry_ids else set()
+    logs = []
+    for record in records:
+        fields = dict(record)
+        if fields.get('actor_id') not in live_actors:
+            fields['actor_id'] = None
+        if fields.get('entry_id') not in live_entries:
+            fields['entry_id'] = None
+        logs.append(ApprovalLog(**fields))
+    ApprovalLog.objects.bulk_create(logs, batch_size=INSERT_BATCH_SIZE)
+    return len(logs)
+
+
+def _try_lock(fh):
+    try:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _replay_segment(path, stem):
+    """Insert one segment unless its writer (or another replayer) still holds it. Returns records inserted."""
+    try:
+        fh = path.open(encoding='utf-8')
+    except FileNotFoundError:
+        return 0
+    with fh:
+        if not _try_lock(fh):
+            return 0  # still being written or replayed
+        try:
+            if os.stat(path).st_ino != os.fstat(fh.fileno()).st_ino:
+                return 0
+        except FileNotFoundError:
+            return 0  # flushed and unlinked before we got the lock
+        try:
+            records = [_decode(line) for line in fh if line.strip()]
+            inserted = insert_records(records)
+        except Exception:  # noqa: BLE001
+            logger.exception('audit spool replay failed: %s', path)
+            if not path.name.endswith('.ready'):
+                path.rename(path.with_name(f'{stem}.ready'))
+            return 0
+        path.unlink(missing_ok=True)
+        return inserted
+
+
+def spool_supported():
+    return fcntl is not None
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def replay_spool(spool_dir=None):
+    """Insert ready segments and segments no live writer holds. Returns records inserted."""
+    spool_dir = Path(spool_dir or settings.AUDIT_LOG_SPOOL_DIR)
+    if not spool_supported() or not spool_dir.is_dir():
+        return 0
+    inserted = 0
+    for path in sorted(spool_dir.iterdir()):
+        match = SEGMENT_RE.match(path.name)
+        if match is not None:
+            inserted += _replay_segment(path, match.group(1))
+    return inserted
+
+
+class AuditLogWriter:
+    def __init__(self, autostart=True):
+        self._autostart = autostart  # False: no flusher thread, flush() is called explicitly
+        self._cond = threading.Condition()
+        self._pid = None
+        self._thread = None
+        self._pending = []
+        self._segment = None
+        self._segment_path = None
+        self._token = None
+        self._seq = 0
+        self._last_flush = time.monotonic()
+
+    def _reset_if_forked(self):
+        if self._pid != os.getpid():
+            if self._segment is not None:
+                self._segment.close()  # the parent keeps its lock through its own descriptor
+            self._pid = os.getpid()
+            self._token = uuid.uuid4().hex[:8]
+            self._thread = None
+            self._pending = []
+            self._segment = None
+            self._segment_path = None
+
+    def _ensure_started(self):
+        self._reset_if_forked()
+        if self._autostart and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, daemon=True, name='audit-log-flusher')
+            self._thread.start()
+
+    def _open_segment(self):
+        spool_dir = Path(settings.AUDIT_LOG_SPOOL_DIR)
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        self._seq += 1
+        stem = f'audit-{os.getpid()}-{self._token}-{self._seq:08d}'
+        # Lock under a name replay ignores, then publish it; the lock moves with the inode.
+        staging = spool_dir / f'.{stem}.new'
+        segment = staging.open('a', encoding='utf-8')
+        fcntl.flock(segment.fileno(), fcntl.LOCK_EX)
+        self._segment_path = staging.rename(spool_dir / f'{stem}.open')
+        _fsync_dir(spool_dir)
+        self._segment = segment
+
+    def submit(self, record):
+        """Buffer one record. Returns False when the buffer stayed full or there is no spool (caller writes it directly)."""
+        if not spool_supported():
+            return False
+        line = _encode(record)
+        deadline = time.monotonic() + settings.AUDIT_LOG_BLOCK_TIMEOUT
+        with self._cond:
+            self._ensure_started()
+            while len(self._pending) >= settings.AUDIT_LOG_MAX_BUFFER:
+                self._cond.notify_all()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            if self._segment is None:
+                self._open_segment()
+            self._segment.write(line)
+            self._segment.flush()
+            os.fsync(self._segment.fileno())
+            self._pending.append(record)
+            if len(self._pending) >= settings.AUDIT_LOG_BATCH_SIZE:
+                self._cond.notify_all()
+        return True
+
+    def _take_batch(self):
+        # The segment stays open (and locked) until _write_batch is done with it.
+        if self._segment is None:
+            return None, []
+        batch = (self._segment, self._segment_path)
+        records = self._pending
+        self._segment = None
+        self._segment_path = None
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._cond.notify_all()
+        return batch, records
+
+    @staticmethod
+    def _write_batch(batch, records):
+        segment, path = batch
+        with segment:
+            try:
+                insert_records(records)
+            except Exception:  # noqa: BLE001
+                logger.exception('audit log batch insert failed; kept for replay: %s', path)
+                path.rename(path.with_suffix('.ready'))
+                return 0
+            path.unlink(missing_ok=True)
+        return len(records)
+
+    def flush(self):
+        """Write everything buffered in this process now. Returns records written."""
+        with self._cond:
+            self._reset_if_forked()
+            batch, records = self._take_batch()
+        if batch is None:
+            return 0
+        return self._write_batch(batch, records)
+
+    def _run(self):
+        replay_due = 0.0
+        while True:
+            with self._cond:
+                while True:
+                    waited = time.monotonic() - self._last_flush
+                    interval = settings.AUDIT_LOG_FLUSH_INTERVAL
+                    if len(self._pending) >= settings.AUDIT_LOG_BATCH_SIZE or (self._pending and waited >= interval):
+                        break
+                    self._cond.wait(max(0.05, interval - waited) if self._pending else interval)
+                    if not self._pending:
+                        break
+                batch, records = self._take_batch()
+            close_old_connections()
+            try:
+                if batch is not None:
+                    self._write_batch(batch, records)
+                if time.monotonic() >= replay_due:
+                    replay_spool()
+                    replay_due = time.monotonic() + settings.AUDIT_LOG_REPLAY_INTERVAL
+            except Exception:  # noqa: BLE001
+                logger.exception('audit log flusher error')
+
+
+audit_writer = AuditLogWriter()
+atexit.register(audit_writer.flush)
@@ -0,0 +1,186 @@
+"""
+Cached, per-device token authentication.
+
+Each login issues its own AuthToken (only the SHA-256 digest is stored) with
+an expiry (AUTH_TOKEN_TTL) and a revocation time, so several devices stay
+signed in side by side. ``CachedTokenAuthentication`` keeps the resolved
+user (with its profile) and token in the shared cache for
+AUTH_TOKEN_CACHE_TIMEOUT seconds, so an authenticated request normally runs
+no auth queries at all; the organization scope is cached separately by
+scope.py.
+
+Cached sessions are tagged with a per-user generation. User and UserProfile
+saves/deletes (role assignment, password change, deactivation, withdrawal)
+bump it through ``invalidate_user_auth``; revoking a token also drops its
+cache entry. A per-process cache (LocMemCache, REDIS_URL unset) only sees
+the changes made by its own worker, so there a cache hit is re-checked with
+one primary-key query on the token, its user and profile (AUTH_STATE_FIELDS)
+and reloaded when anything differs.
+"""
+import hashlib
+import math
+import secrets
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .audit import get_client_ip
+from .models import AuthToken
+
+TOKEN_CACHE_PREFIX = 'auth-token:'
+GENERATION_PREFIX = 'auth-user-gen:'
+# Re-read on cache hits when the cache is not shared between processes
+AUTH_STATE_FIELDS = (
+    'revoked_at', 'expires_at', 'user__is_active', 'user__is_staff', 'user__is_superuser', 'user__password',
+    'user__profile__role', 'user__profile__organization_id', 'user__profile__team_id',
+)
+
+
+def token_digest(key):
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _generation_key(user_id):
+    return f'{GENERATION_PREFIX}{user_id}'
+
+
+def _generation(user_id):
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        if not cache.add(key, generation, None):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def _bump_generation(user_id):
+    cache.set(_generation_key(user_id), uuid.uuid4().hex, None)
+
+
+def invalidate_user_auth(user_id, using=None):
+    """Drop every cached session of the user, now and again once the transaction commits."""
+    if user_id is None:
+        return
+    _bump_generation(user_id)
+    transaction.on_commit(lambda: _bump_generation(user_id), using=using)
+
+
+def issue_token(user, request=None, name=''):
+    """Create a device token for ``user``. Returns (AuthToken, raw key); the key is not stored."""
+    key = secrets.token_hex(20)
+    user_agent = request.META.get('HTTP_USER_AGENT', '') if request is not None else ''
+    ttl = settings.AUTH_TOKEN_TTL
+    token = AuthToken.objects.create(
+        user=user,
+        digest=token_digest(key),
+        key_prefix=key[:8],
+        name=str(name or user_agent or '')[:100],
+        ip_address=get_client_ip(request),
+        expires_at=timezone.now() + timedelta(seconds=ttl) if ttl > 0 else None,
+    )
+    _prune_tokens(user)
+    return token, key
+
+
+def _prune_tokens(user):
+    """Delete dead tokens and revoke the oldest beyond AUTH_TOKEN_MAX_PER_USER."""
+    AuthToken.objects.filter(user=user).filter(Q(revoked_at__isnull=False) | Q(expires_at__lte=timezone.now())).delete()
+    limit = settings.AUTH_TOKEN_MAX_PER_USER
+    if limit > 0:
+        surplus = list(AuthToken.objects.filter(user=user).order_by('-created_at', '-id').values_list('id', flat=True)[limit:])
+        if surplus:
+            revoke_tokens(AuthToken.objects.filter(id__in=surplus))
+
+
+def _drop_cached(digests):
+    cache.delete_many([TOKEN_CACHE_PREFIX + digest for digest in digests])
+
+
+def revoke_tokens(queryset):
+    """Revoke the active tokens in ``queryset``. Returns the number revoked."""
+    active = queryset.filter(revoked_at__isnull=True)
+    digests = list(active.values_list('digest', flat=True))
+    revoked = active.update(revoked_at=timezone.now())
+    _drop_cached(digests)
+    transaction.on_commit(lambda: _drop_cached(digests))
+    return revoked
+
+
+def revoke_user_tokens(user, keep=None):
+    """Revoke every token of ``user`` except ``keep``."""
+    queryset = AuthToken.objects.filter(user=user)
+    if keep is not None:
+        queryset = queryset.exclude(pk=keep.pk)
+    return revoke_tokens(queryset)
+
+
+def _per_process_cache():
+    return isinstance(caches['default'], LocMemCache)
+
+
+def _auth_state(token, user):
+    profile = getattr(user, 'profile', None)
+    return (
+        token.revoked_at, token.expires_at, user.is_active, user.is_staff, user.is_superuser, user.password,
+        getattr(profile, 'role', None), getattr(profile, 'organization_id', None), getattr(profile, 'team_id', None),
+    )
+
+
+def _check_token(token):
+    if token.revoked_at is not None:
+        raise exceptions.AuthenticationFailed(_('Invalid token.'))
+    if token.expires_at is not None and token.expires_at <= timezone.now():
+        raise exceptions.AuthenticationFailed(_('Token has expired.'))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """``Authorization: Token <key>`` against AuthToken, resolved from the cache when possible."""
+
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        digest = token_digest(key)
+        cached = cache.get(TOKEN_CACHE_PREFIX + digest)
+        if cached is not None:
+            user, token, generation, state = cached
+            if cache.get(_generation_key(user.pk)) == generation and (
+                not _per_process_cache()
+                or AuthToken.objects.filter(pk=token.pk).values_list(*AUTH_STATE_FIELDS).first() == state
+            ):
+                _check_token(token)
+                return user, token
+
+        user_id = AuthToken.objects.filter(digest=digest).values_list('user_id', flat=True).first()
+        if user_id is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        generation = _generation(user_id)  # read before loading so a concurrent change is not cached as current
+        token = AuthToken.objects.select_related('user__profile').filter(digest=digest).first()
+        if token is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        _check_token(token)
+        user = token.user
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        now = timezone.now()
+        AuthToken.objects.filter(pk=token.pk).update(last_used_at=now)
+        snapshot = AuthToken(
+            pk=token.pk, user_id=user.pk, key_prefix=token.key_prefix, name=token.name,
+            created_at=token.created_at, last_used_at=now, expires_at=token.expires_at,
+        )
+        timeout = settings.AUTH_TOKEN_CACHE_TIMEOUT
+        if token.expires_at is not None:
+            timeout = min(timeout, math.ceil((token.expires_at - now).total_seconds()))
+        if timeout > 0:
+            cache.set(TOKEN_CACHE_PREFIX + digest, (user, snapshot, generation, _auth_state(token, user)), timeout)
+        return user, snapshot
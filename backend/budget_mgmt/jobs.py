@@ -0,0 +1,445 @@
+"""
+Local background job queue.
+
+Jobs are ``Job`` rows. ``enqueue_job(kind, params)`` stores one and
+``process_jobs`` claims PENDING rows with a conditional UPDATE, so any
+number of worker threads or processes can share the table without an
+external broker. It runs in the ``run_jobs`` management command when
+BUDGET_JOBS_EXTERNAL_WORKER is set; otherwise each enqueue (after commit)
+starts a daemon thread in the web process that drains the queue and exits.
+Handlers are registered per kind with ``@job_handler('kind')`` and receive a ``JobContext`` for progress reports,
+cooperative cancellation and result artifacts (stored under MEDIA_ROOT/jobs/).
+
+Each claim stamps ``started_at``; progress reports and the final status are
+written only while the job is still RUNNING with that stamp, so a runner
+whose job was requeued (stale heartbeat, resume) stops with ``JobSuperseded``
+instead of racing the new one. Handlers registered ``resumable=True`` keep
+their checkpoint in ``Job.result`` (``ctx.progress(..., state=...)``) and can
+be restarted from it with ``resume_job``.
+
+``defer_request(request)`` is how heavy API endpoints go asynchronous: the
+request is stored as an ``api_request`` job and replayed by the worker as the
+same user, so permissions, scope checks and validation stay in the view.
+The view call itself cannot be interrupted: a replayed request honours
+cancellation before it starts and between the chunks of a streamed response.
+With BUDGET_JOBS_ASYNC off, jobs run inline at enqueue time.
+"""
+import json
+import logging
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from importlib import import_module
+from urllib.parse import unquote, urlencode
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Modules that register handlers on import (loaded lazily by get_handler).
+HANDLER_MODULES = (
+    'budget_mgmt.services.budget_import',
+    'budget_mgmt.services.version_clone',
+)
+CLAIM_BATCH = 10
+# Seconds between cancel checks while a replayed request streams its response
+REPLAY_CANCEL_CHECK_INTERVAL = 1.0
+
+_handlers = {}
+_resumable = set()
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler once cancellation of its job was requested."""
+
+
+class JobSuperseded(Exception):
+    """Raised inside a handler whose job was requeued and is no longer owned by this run."""
+
+
+class JobFailed(Exception):
+    """Fail the job with a message and a result payload (e.g. a 4xx response body)."""
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+def job_handler(kind, *, resumable=False):
+    def decorator(func):
+        _handlers[kind] = func
+        if resumable:
+            _resumable.add(kind)
+        return func
+    return decorator
+
+
+def get_handler(kind):
+    if kind not in _handlers:
+        for module in HANDLER_MODULES:
+            import_module(module)
+    return _handlers.get(kind)
+
+
+def is_resumable(kind):
+    get_handler(kind)
+    return kind in _resumable
+
+
+def _owned(job):
+    return Job.objects.filter(pk=job.pk, status='RUNNING', started_at=job.started_at)
+
+
+class JobContext:
+    def __init__(self, job):
+        self.job = job
+
+    def is_cancelled(self):
+        return Job.objects.filter(pk=self.job.pk, cancel_requested=True).exists()
+
+    def check_cancelled(self):
+        if self.is_cancelled():
+            raise JobCancelled()
+
+    def progress(self, percent, message=None, state=None):
+        """
+        Record progress (0-100), and ``state`` as the job's checkpoint (Job.result).
+        Called inside a chunk's transaction, the checkpoint commits with the chunk.
+        Raises JobSuperseded if the job was requeued, JobCancelled if cancellation
+        was requested.
+        """
+        now = timezone.now()
+        fields = {'progress': max(0.0, min(float(percent), 100.0)), 'heartbeat_at': now, 'updated_at': now}
+        if message is not None:
+            fields['message'] = str(message)[:1000]
+        if state is not None:
+            fields['result'] = state
+        if not _owned(self.job).update(**fields):
+            raise JobSuperseded()
+        self.check_cancelled()
+
+    def save_artifact(self, name, content, content_type=''):
+        """Store bytes or a file object as the job's downloadable result."""
+        content = ContentFile(content) if isinstance(content, (bytes, bytearray)) else File(content)
+        self.job.artifact.save(name, content, save=False)
+        Job.objects.filter(pk=self.job.pk).update(
+            artifact=self.job.artifact.name,
+            artifact_name=name[:255],
+            artifact_content_type=content_type[:100],
+            updated_at=timezone.now(),
+        )
+
+
+def _dispatch(job):
+    if not getattr(settings, 'BUDGET_JOBS_ASYNC', True):
+        return run_job(job.pk)
+    if not getattr(settings, 'BUDGET_JOBS_EXTERNAL_WORKER', False):
+        transaction.on_commit(start_local_runner)
+    return job
+
+
+def enqueue_job(kind, params=None, *, user=None):
+    if get_handler(kind) is None:
+        raise ValueError(f'unknown job kind: {kind}')
+    job = Job.objects.create(
+        kind=kind,
+        params=params or {},
+        created_by=user if getattr(user, 'is_authenticated', False) else None,
+    )
+    return _dispatch(job)
+
+
+def resume_job(job, *, force=False, stale_after=None):
+    """
+    Requeue a FAILED or CANCELLED resumable job from its checkpoint with a
+    conditional UPDATE (with ``force``, also a RUNNING job whose heartbeat is
+    older than ``stale_after`` seconds, BUDGET_JOBS_STALE_AFTER). Returns the
+    job, or None when it was not resumable.
+    """
+    if not is_resumable(job.kind):
+        return None
+    now = timezone.now()
+    resumable = Q(status__in=('FAILED', 'CANCELLED'))
+    if force:
+        if stale_after is None:
+            stale_after = settings.BUDGET_JOBS_STALE_AFTER
+        resumable |= Q(status='RUNNING', heartbeat_at__lt=now - timedelta(seconds=stale_after))
+    requeued = Job.objects.filter(resumable, pk=job.pk).update(
+        status='PENDING', cancel_requested=False, worker='', message='', finished_at=None, updated_at=now,
+    )
+    if not requeued:
+        return None
+    return _dispatch(Job.objects.get(pk=job.pk))
+
+
+def _mark_running(queryset, worker):
+    now = timezone.now()
+    return queryset.update(
+        status='RUNNING',
+        worker=worker[:100],
+        attempts=F('attempts') + 1,
+        started_at=now,
+        heartbeat_at=now,
+        updated_at=now,
+    )
+
+
+def claim_next_job(worker, kinds=None):
+    """Claim the oldest PENDING job; a lost race just moves on to the next candidate."""
+    candidates = Job.objects.filter(status='PENDING', cancel_requested=False).order_by('created_at', 'id')
+    if kinds:
+        candidates = candidates.filter(kind__in=kinds)
+    for job_id in candidates.values_list('id', flat=True)[:CLAIM_BATCH]:
+        if _mark_running(Job.objects.filter(pk=job_id, status='PENDING'), worker):
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def cancel_job(job):
+    """Cancel a PENDING job outright; a RUNNING job stops at its next progress report."""
+    now = timezone.now()
+    if Job.objects.filter(pk=job.pk, status='PENDING').update(
+        status='CANCELLED', cancel_requested=True, finished_at=now, updated_at=now, message='Cancelled.',
+    ):
+        return True
+    return bool(Job.objects.filter(pk=job.pk, status='RUNNING').update(cancel_requested=True, updated_at=now))
+
+
+def requeue_stale_jobs(stale_after):
+    """Put RUNNING jobs back in the queue when their worker stopped heartbeating. Returns rows requeued."""
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    stale = Job.objects.filter(status='RUNNING', heartbeat_at__lt=cutoff)
+    stale.filter(cancel_requested=True).update(status='CANCELLED', finished_at=timezone.now(), message='Cancelled.')
+    return stale.filter(cancel_requested=False).update(status='PENDING', worker='', message='Requeued after worker timeout.')
+
+
+def heartbeat(job_ids):
+    if job_ids:
+        Job.objects.filter(pk__in=list(job_ids), status='RUNNING').update(heartbeat_at=timezone.now())
+
+
+def _finish(job, status, *, message='', result=None, progress=None):
+    fields = {'status': status, 'message': message[:1000], 'finished_at': timezone.now(), 'updated_at': timezone.now()}
+    if result is not None:
+        fields['result'] = result
+    if progress is not None:
+        fields['progress'] = progress
+    _owned(job).update(**fields)
+
+
+def run_job(job_id, worker='inline'):
+    """Run a claimed (RUNNING) job, or claim and run a PENDING one. Returns the refreshed job."""
+    job = Job.objects.get(pk=job_id)
+    if job.status == 'PENDING':
+        if not _mark_running(Job.objects.filter(pk=job.pk, status='PENDING', cancel_requested=False), worker):
+            return Job.objects.get(pk=job_id)
+        job.refresh_from_db()
+    if job.status != 'RUNNING':
+        return job
+
+    handler = get_handler(job.kind)
+    try:
+        if handler is None:
+            raise JobFailed(f'unknown job kind: {job.kind}')
+        result = handler(job, JobContext(job))
+    except JobSuperseded:
+        logger.warning('job superseded by another runner: job_id=%s kind=%s', job.pk, job.kind)
+    except JobCancelled:
+        _finish(job, 'CANCELLED', message='Cancelled.')
+    except JobFailed as exc:
+        _finish(job, 'FAILED', message=str(exc), result=exc.result)
+    except Exception as exc:  # noqa: BLE001
+        logger.exception('job failed: job_id=%s kind=%s', job.pk, job.kind)
+        _finish(job, 'FAILED', message=str(exc))
+    else:
+        _finish(job, 'SUCCEEDED', result=result, progress=100.0)
+    job.refresh_from_db()
+    return job
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def process_jobs(worker, *, workers, poll_interval, kinds=None, should_stop=None, on_finished=None):
+    """
+    Requeue stale jobs, then claim and run jobs on a pool of ``workers``
+    threads, heartbeating the running ones. Once the queue is empty and
+    nothing runs, ``should_stop()`` is asked whether to return (None: poll
+    until interrupted). ``on_finished(job_id, future)`` reports each job.
+    """
+    running = {}  # job id -> future
+
+    def execute(job_id):
+        close_old_connections()
+        try:
+            return run_job(job_id, worker=worker)
+        finally:
+            connection.close()
+
+    requeued = requeue_stale_jobs(settings.BUDGET_JOBS_STALE_AFTER)
+    if requeued:
+        logger.warning('requeued %s stale job(s)', requeued)
+
+    last_heartbeat = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job') as pool:
+        try:
+            while True:
+                for job_id, future in list(running.items()):
+                    if future.done():
+                        del running[job_id]
+                        if on_finished is not None:
+                            on_finished(job_id, future)
+                free = workers - len(running)
+
+                claimed = claim_next_job(worker, kinds) if free > 0 else None
+                if claimed is not None:
+                    running[claimed.pk] = pool.submit(execute, claimed.pk)
+                    continue
+
+                if not running and should_stop is not None and should_stop():
+                    break
+                if time.monotonic() - last_heartbeat >= poll_interval:
+                    heartbeat(running.keys())
+                    last_heartbeat = time.monotonic()
+                time.sleep(poll_interval if free > 0 else 0.2)
+        except KeyboardInterrupt:
+            logger.info('stopping; waiting for running jobs')
+    if on_finished is not None:
+        for job_id, future in running.items():
+            on_finished(job_id, future)
+
+
+# In-process runner (no external worker) -------------------------------------
+
+_local_lock = threading.Lock()
+_local_runner = None
+_local_wake = False
+
+
+def _local_runner_idle():
+    # Exit unless a job was enqueued since the last claim attempt.
+    global _local_runner, _local_wake
+    with _local_lock:
+        if _local_wake:
+            _local_wake = False
+            return False
+        _local_runner = None
+        return True
+
+
+def _run_local():
+    global _local_runner
+    try:
+        process_jobs(
+            f'{default_worker_id()}:local',
+            workers=max(1, settings.BUDGET_JOBS_WORKERS),
+            poll_interval=max(0.1, settings.BUDGET_JOBS_POLL_INTERVAL),
+            should_stop=_local_runner_idle,
+        )
+    except Exception:  # noqa: BLE001
+        logger.exception('local job runner crashed')
+        with _local_lock:
+            _local_runner = None
+    finally:
+        connection.close()
+
+
+def start_local_runner():
+    """Drain the queue in a daemon thread of this process (one at a time); a running one is told to look again."""
+    global _local_runner, _local_wake
+    with _local_lock:
+        if _local_runner is not None:
+            _local_wake = True
+            return
+        _local_runner = threading.Thread(target=_run_local, daemon=True, name='job-runner')
+        _local_wake = False
+        _local_runner.start()
+
+
+# Deferred API requests -----------------------------------------------------
+
+def _plain_data(data):
+    if hasattr(data, 'dict'):  # QueryDict (form posts)
+        data = data.dict()
+    if isinstance(data, dict):
+        return {key: value for key, value in data.items() if key != 'background'}
+    return data
+
+
+def defer_request(request):
+    """Queue the current API request (without its ``background`` flag) for the worker."""
+    return enqueue_job('api_request', {
+        'method': request.method,
+        'path': request.path,
+        'query': {key: value for key, value in request.query_params.items() if key != 'background'},
+        'data': _plain_data(request.data),
+    }, user=request.user)
+
+
+def _attachment_name(response):
+    disposition = response.get('Content-Disposition', '')
+    match = re.search(r"filename\*=UTF-8''([^;]+)", disposition) or re.search(r'filename="?([^";]+)"?', disposition)
+    return unquote(match.group(1)) if match else ''
+
+
+@job_handler('api_request')
+def replay_request(job, ctx):
+    from django.urls import resolve
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.test import APIRequestFactory, force_authenticate
+
+    params = job.params
+    factory = APIRequestFactory()
+    method = params['method'].lower()
+    if method == 'get':
+        request = factory.get(params['path'], params.get('query') or {})
+    else:
+        path = params['path']
+        if params.get('query'):
+            path = f"{path}?{urlencode(params['query'])}"
+        request = getattr(factory, method)(path, params.get('data'), format='json')
+    if job.created_by is not None:
+        force_authenticate(request, user=job.created_by)
+
+    ctx.progress(1, f"{params['method']} {params['path']}")
+    match = resolve(params['path'])
+    response = match.func(request, *match.args, **match.kwargs)
+
+    try:
+        result = {
+            'status_code': response.status_code,
+            'headers': {key: value for key, value in response.items() if key.lower().startswith('x-')},
+        }
+        if getattr(response, 'data', None) is not None:
+            result['data'] = json.loads(JSONRenderer().render(response.data))
+        elif 200 <= response.status_code < 300:
+            name = _attachment_name(response) or f'job-{job.pk}'
+            with tempfile.TemporaryFile() as tmp:
+                check_due = time.monotonic() + REPLAY_CANCEL_CHECK_INTERVAL
+                for chunk in (response.streaming_content if response.streaming else [response.content]):
+                    tmp.write(chunk)
+                    if time.monotonic() >= check_due:
+                        ctx.progress(50, f"{params['method']} {params['path']}: {tmp.tell()} bytes")
+                        check_due = time.monotonic() + REPLAY_CANCEL_CHECK_INTERVAL
+                tmp.seek(0)
+                ctx.save_artifact(name, tmp, response.get('Content-Type', ''))
+    finally:
+        response.close()
+    if response.status_code >= 400:
+        data = result.get('data')
+        message = data.get('error') if isinstance(data, dict) else None
+        raise JobFailed(str(message or f'HTTP {response.status_code}'), result)
+    return result
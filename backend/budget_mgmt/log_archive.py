@@ -0,0 +1,506 @@
+"""
+Monthly archival and retention for ApprovalLog.
+
+``archive_closed_months`` moves every (month, log_type) bucket older than
+AUDIT_LOG_HOT_MONTHS out of the table into a gzip NDJSON file under
+AUDIT_LOG_ARCHIVE_DIR, recorded by an ApprovalLogArchive row. Logs bound to
+a BudgetEntry are neither archived nor purged: rebuild_entry_activity
+derives the entry activity fields from them.
+``purge_expired`` drops rows and archive files past the per-log_type
+AUDIT_LOG_RETENTION_MONTHS. ``LogHistory`` serves the hot queryset followed
+by the matching archived rows so /api/logs/ pages over both; archive
+match counts come from each archive's ``summary`` unless the filter needs
+the rows themselves.
+"""
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from itertools import groupby, islice
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .audit_search import actor_q, keyword_q
+from .models import ApprovalLog, ApprovalLogArchive
+
+logger = logging.getLogger(__name__)
+
+LOG_FIELDS = [field.attname for field in ApprovalLog._meta.concrete_fields]
+# Denormalised at archive time so archived rows filter without joins
+RELATED_FIELDS = {
+    'actor_username': F('actor__username'),
+    'actor_first_name': F('actor__first_name'),
+    'entry_year': F('entry__year'),
+    'entry_round': F('entry__supplemental_round'),
+    'entry_org_id': F('entry__organization_id'),
+}
+COUNT_CACHE_SIZE = 512
+# Entry logs feed audit.rebuild_entry_activity, so only unbound logs are archived or purged
+ARCHIVABLE_Q = Q(entry__isnull=True)
+# ApprovalLogArchive.summary counts rows per combination of these
+SUMMARY_FIELDS = ('actor_id', 'auth_user_id', 'entry_id', 'entry_org_id', 'entry_year', 'entry_round')
+# Filters only an archived row itself can answer
+ROW_CRITERIA = ('actions', 'resource_type', 'resource_id', 'method', 'actor', 'status', 'status_code', 'keyword')
+
+
+def _int_list(raw_value):
+    if raw_value is None:
+        return []
+    return [int(token.strip()) for token in str(raw_value).split(',') if token.strip().isdigit()]
+
+
+def _csv_list(raw_value):
+    if raw_value is None:
+        return []
+    return [token.strip() for token in str(raw_value).split(',') if token.strip()]
+
+
+def _contains(value, needle):
+    return needle.casefold() in str(value or '').casefold()
+
+
+def summary_key(row):
+    """The SUMMARY_FIELDS values of an archived row dict."""
+    auth_user_id = row['resource_id'] if row['resource_type'] == 'auth' else None
+    return (row['actor_id'], auth_user_id, row['entry_id'], row['entry_org_id'], row['entry_year'], row['entry_round'])
+
+
+def build_summary(counter):
+    """ApprovalLogArchive.summary from a Counter of summary_key -> rows."""
+    return [[*key, count] for key, count in counter.items()]
+
+
+class LogFilter:
+    """The /api/logs/ query parameters, applicable to a queryset or to archived rows."""
+
+    def __init__(self, params, *, allowed_org_ids=None, user_id=None):
+        self.allowed_org_ids = None if allowed_org_ids is None else set(allowed_org_ids)
+        self.user_id = user_id
+        get = params.get
+        self.entry_id = int(get('entry')) if str(get('entry')).isdigit() else None
+        self.entry_ids = _int_list(get('entry_ids'))
+        self.year = int(get('year')) if str(get('year')).isdigit() else None
+        self.round = int(get('round')) if str(get('round')).isdigit() else None
+        self.org_id = int(get('org_id')) if str(get('org_id')).isdigit() else None
+        self.org_ids = _int_list(get('org_ids'))
+        self.log_types = _csv_list(get('log_type'))
+        self.actions = _csv_list(get('action'))
+        self.resource_type = get('resource_type') or None
+        self.resource_id = str(get('resource_id')) if get('resource_id') else None
+        self.method = get('method') or None
+        self.actor = get('actor') or None
+        self.status = get('status') or None
+        self.status_code = int(get('status_code')) if str(get('status_code')).isdigit() else None
+        self.from_date = get('from_date') or get('from') or None
+        self.to_date = get('to_date') or get('to') or None
+        self.keyword = get('q') or None
+
+    @classmethod
+    def from_request(cls, request, allowed_org_ids):
+        return cls(request.query_params, allowed_org_ids=allowed_org_ids, user_id=getattr(request.user, 'id', None))
+
+    def key(self):
+        return repr(sorted((k, sorted(v) if isinstance(v, set) else v) for k, v in vars(self).items()))
+
+    @property
+    def has_row_criteria(self):
+        """Filters that can only be checked against the archived rows."""
+        return any(getattr(self, name) not in (None, []) for name in ROW_CRITERIA)
+
+    @property
+    def has_summary_criteria(self):
+        """Filters checked against ApprovalLogArchive.summary (archive row_count is exact without them)."""
+        return self.allowed_org_ids is not None or any(
+            value not in (None, [])
+            for value in (self.entry_id, self.entry_ids, self.year, self.round, self.org_id, self.org_ids)
+        )
+
+    def covers_month(self, month):
+        """True when the date range includes every day of ``month`` (a first-of-month date)."""
+        from_day, to_day = parse_date(str(self.from_date or '')), parse_date(str(self.to_date or ''))
+        last_day = (month.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        return (not from_day or from_day <= month) and (not to_day or to_day >= last_day)
+
+    def summary_count(self, archive):
+        """Matching rows of ``archive`` counted without reading it, or None when the rows are needed."""
+        if self.has_row_criteria or not self.covers_month(archive.month):
+            return None
+        if not self.has_summary_criteria:
+            return archive.row_count
+        if archive.summary is None:
+            return None
+        return sum(item[-1] for item in archive.summary if self.matches_summary(item[:-1]))
+
+    def matches_summary(self, key):
+        """``matches`` for the parts of a row captured by summary_key."""
+        actor_id, auth_user_id, entry_id, entry_org_id, entry_year, entry_round = key
+        if self.allowed_org_ids is not None:
+            own = (
+                (self.user_id is not None and actor_id == self.user_id)
+                or (auth_user_id is not None and auth_user_id == str(self.user_id or ''))
+                or (entry_org_id is not None and entry_org_id in self.allowed_org_ids)
+            )
+            if not own:
+                return False
+        if self.entry_id is not None and entry_id != self.entry_id:
+            return False
+        if self.entry_ids and entry_id not in self.entry_ids:
+            return False
+        if self.year is not None and entry_year != self.year:
+            return False
+        if self.round is not None and entry_round != self.round:
+            return False
+        if self.org_id is not None and entry_org_id != self.org_id:
+            return False
+        if self.org_ids and entry_org_id not in self.org_ids:
+            return False
+        return True
+
+    def apply(self, queryset):
+        if self.allowed_org_ids is not None:
+            own = Q(actor_id=self.user_id) | Q(resource_type='auth', resource_id=str(self.user_id or ''))
+            if self.allowed_org_ids:
+                own |= Q(entry__organization_id__in=self.allowed_org_ids)
+            queryset = queryset.filter(own)
+        if self.entry_id is not None:
+            queryset = queryset.filter(entry_id=self.entry_id)
+        if self.entry_ids:
+            queryset = queryset.filter(entry_id__in=self.entry_ids)
+        if self.year is not None:
+            queryset = queryset.filter(entry__year=self.year)
+        if self.round is not None:
+            queryset = queryset.filter(entry__supplemental_round=self.round)
+        if self.org_id is not None:
+            queryset = queryset.filter(entry__organization_id=self.org_id)
+        if self.org_ids:
+            queryset = queryset.filter(entry__organization_id__in=self.org_ids)
+        if self.log_types:
+            queryset = queryset.filter(log_type__in=self.log_types)
+        if self.actions:
+            queryset = queryset.filter(action__in=self.actions)
+        if self.resource_type:
+            queryset = queryset.filter(resource_type=self.resource_type)
+        if self.resource_id:
+            queryset = queryset.filter(resource_id=self.resource_id)
+        if self.method:
+            queryset = queryset.filter(method__iexact=self.method)
+        if self.actor:
+            queryset = queryset.filter(actor_q(self.actor))
+        if self.status:
+            queryset = queryset.filter(Q(from_status__iexact=self.status) | Q(to_status__iexact=self.status))
+        if self.status_code is not None:
+            queryset = queryset.filter(status_code=self.status_code)
+        if self.from_date:
+            queryset = queryset.filter(created_at__date__gte=self.from_date)
+        if self.to_date:
+            queryset = queryset.filter(created_at__date__lte=self.to_date)
+        if self.keyword:
+            queryset = queryset.filter(keyword_q(self.keyword))
+        return queryset
+
+    def matches(self, row):
+        """``apply`` for one archived row dict."""
+        if not self.matches_summary(summary_key(row)):
+            return False
+        if self.log_types and row['log_type'] not in self.log_types:
+            return False
+        if self.actions and row['action'] not in self.actions:
+            return False
+        if self.resource_type and row['resource_type'] != self.resource_type:
+            return False
+        if self.resource_id and row['resource_id'] != self.resource_id:
+            return False
+        if self.method and str(row['method'] or '').upper() != self.method.upper():
+            return False
+        if self.actor and not (_contains(row['actor_username'], self.actor) or _contains(row['actor_first_name'], self.actor)):
+            return False
+        if self.status and self.status.upper() not in (str(row['from_status'] or '').upper(), str(row['to_status'] or '').upper()):
+            return False
+        if self.status_code is not None and row['status_code'] != self.status_code:
+            return False
+        if self.from_date or self.to_date:
+            day = timezone.localtime(row['created_at']).date()
+            from_day, to_day = parse_date(str(self.from_date or '')), parse_date(str(self.to_date or ''))
+            if (from_day and day < from_day) or (to_day and day > to_day):
+                return False
+        if self.keyword:
+            fields = ('reason', 'path', 'resource_type', 'resource_id', 'actor_username', 'actor_first_name')
+            if not any(_contains(row[name], self.keyword) for name in fields):
+                return False
+        return True
+
+    def archives(self):
+        """Archive files that can hold matching rows, newest month first."""
+        archives = ApprovalLogArchive.objects.all()
+        if self.log_types:
+            archives = archives.filter(log_type__in=self.log_types)
+        from_day, to_day = parse_date(str(self.from_date or '')), parse_date(str(self.to_date or ''))
+        if from_day:
+            archives = archives.filter(month__gte=from_day.replace(day=1))
+        if to_day:
+            archives = archives.filter(month__lte=to_day)
+        return list(archives.order_by('-month', 'log_type', '-last_id'))
+
+
+# -- archive files ---------------------------------------------------------
+
+def archive_dir():
+    return Path(settings.AUDIT_LOG_ARCHIVE_DIR)
+
+
+def archive_path(archive):
+    return archive_dir() / archive.file_name
+
+
+def _encode_row(row):
+    row = dict(row)
+    row['created_at'] = row['created_at'].isoformat()
+    return json.dumps(row, ensure_ascii=False, default=str) + '\n'
+
+
+def read_archive(archive):
+    """Archived rows as dicts, newest first."""
+    with gzip.open(archive_path(archive), 'rt', encoding='utf-8') as fh:
+        for line in fh:
+            if line.strip():
+                row = json.loads(line)
+                row['created_at'] = parse_datetime(row['created_at'])
+                yield row
+
+
+def _to_log(row):
+    log = ApprovalLog(**{name: row.get(name) for name in LOG_FIELDS})
+    if row.get('actor_id'):
+        log.actor = User(id=row['actor_id'], username=row.get('actor_username') or '', first_name=row.get('actor_first_name') or '')
+    log.archived = True
+    return log
+
+
+_count_cache = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+
+def archived_match_count(archive, log_filter):
+    count = log_filter.summary_count(archive)
+    if count is not None:
+        return count
+    key = (archive.pk, archive.sha256, log_filter.key())
+    with _count_cache_lock:
+        if key in _count_cache:
+            _count_cache.move_to_end(key)
+            return _count_cache[key]
+    count = sum(1 for row in read_archive(archive) if log_filter.matches(row))
+    with _count_cache_lock:
+        _count_cache[key] = count
+        while len(_count_cache) > COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return count
+
+
+class LogHistory:
+    """
+    A filtered ApprovalLog queryset followed by the matching archived rows
+    (always older), newest first. Supports count() and slicing so it can be
+    handed to the paginator in place of the queryset.
+    """
+    ordered = True
+
+    def __init__(self, queryset, log_filter):
+        self.queryset = queryset
+        self.log_filter = log_filter
+        self._archives = None
+        self._hot_count = None
+
+    @property
+    def archives(self):
+        if self._archives is None:
+            self._archives = self.log_filter.archives()
+        return self._archives
+
+    def hot_count(self):
+        if self._hot_count is None:
+            self._hot_count = self.queryset.count()
+        return self._hot_count
+
+    def count(self):
+        return self.hot_count() + sum(archived_match_count(archive, self.log_filter) for archive in self.archives)
+
+    def __len__(self):
+        return self.count()
+
+    def archived_rows(self, skip=0):
+        """Matching archived row dicts, newest first, after skipping ``skip`` of them."""
+        for _month, group in groupby(self.archives, key=lambda archive: archive.month):
+            group = list(group)
+            matched = sum(archived_match_count(archive, self.log_filter) for archive in group)
+            if matched <= skip:
+                skip -= matched
+                continue
+            rows = heapq.merge(
+                *(read_archive(archive) for archive in group),
+                key=lambda row: (row['created_at'], row['id']),
+                reverse=True,
+            )
+            for row in rows:
+                if not self.log_filter.matches(row):
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                yield row
+
+    def _iter_archived(self, skip=0):
+        return map(_to_log, self.archived_rows(skip))
+
+    def __iter__(self):
+        yield from self.queryset
+        yield from self._iter_archived()
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            items = self[key:key + 1]
+            if not items:
+                raise IndexError(key)
+            return items[0]
+        start, stop = key.start or 0, key.stop
+        hot_count = self.hot_count()
+        items = []
+        if start < hot_count:
+            items.extend(self.queryset[start:hot_count if stop is None else min(stop, hot_count)])
+        if stop is None or stop > hot_count:
+            offset = max(start, hot_count)
+            archived = self._iter_archived(skip=offset - hot_count)
+            items.extend(archived if stop is None else islice(archived, stop - offset))
+        return items
+
+
+# -- archival and retention ------------------------------------------------
+
+def month_start(value):
+    """First instant of value's month in the current time zone."""
+    local = timezone.localtime(value)
+    return timezone.make_aware(datetime(local.year, local.month, 1))
+
+
+def shift_months(start, months):
+    index = start.year * 12 + start.month - 1 + months
+    return timezone.make_aware(datetime(index // 12, index % 12 + 1, 1))
+
+
+def retention_cutoff(log_type, now=None):
+    """Rows of ``log_type`` created before this are expired (None: kept forever)."""
+    months = settings.AUDIT_LOG_RETENTION_MONTHS.get(log_type)
+    if not months:
+        return None
+    return shift_months(month_start(now or timezone.now()), -months)
+
+
+def _write_archive_file(path, rows):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    summary = Counter()
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as fh:
+            written = 0
+            for row in rows:
+                fh.write(_encode_row(row).encode('utf-8'))
+                summary[summary_key(row)] += 1
+                written += 1
+        digest = hashlib.sha256()
+        with open(tmp_name, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+                digest.update(chunk)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return written, digest.hexdigest(), build_summary(summary)
+
+
+def archive_month(month, log_type, *, chunk_size=2000):
+    """Move one (month, log_type) bucket into an archive file. Returns the ApprovalLogArchive or None."""
+    start = timezone.make_aware(datetime(month.year, month.month, 1))
+    rows = ApprovalLog.objects.filter(
+        ARCHIVABLE_Q, log_type=log_type, created_at__gte=start, created_at__lt=shift_months(start, 1),
+    )
+    bounds = rows.aggregate(first_id=Min('id'), last_id=Max('id'))
+    if bounds['last_id'] is None:
+        return None
+    rows = rows.filter(id__lte=bounds['last_id'])
+    file_name = f"{start:%Y-%m}/{log_type.lower()}-{bounds['first_id']}-{bounds['last_id']}.ndjson.gz"
+    path = archive_dir() / file_name
+    ordered = rows.order_by('-created_at', '-id').values(*LOG_FIELDS, **RELATED_FIELDS)
+    row_count, sha256, summary = _write_archive_file(path, ordered.iterator(chunk_size=chunk_size))
+    with transaction.atomic():
+        archive = ApprovalLogArchive.objects.create(
+            month=start.date(),
+            log_type=log_type,
+            file_name=file_name,
+            row_count=row_count,
+            first_id=bounds['first_id'],
+            last_id=bounds['last_id'],
+            size_bytes=path.stat().st_size,
+            sha256=sha256,
+            summary=summary,
+        )
+        rows.delete()
+    return archive
+
+
+def closed_buckets(now=None, hot_months=None):
+    """(month, log_type, rows) buckets older than the hot window, oldest first."""
+    hot_months = settings.AUDIT_LOG_HOT_MONTHS if hot_months is None else hot_months
+    cutoff = shift_months(month_start(now or timezone.now()), -max(0, hot_months))
+    buckets = (
+        ApprovalLog.objects.filter(ARCHIVABLE_Q, created_at__lt=cutoff)
+        .annotate(month=TruncMonth('created_at'))
+        .order_by()
+        .values('month', 'log_type')
+        .annotate(rows=Count('id'))
+        .order_by('month', 'log_type')
+    )
+    return [(timezone.localtime(b['month']).date() if isinstance(b['month'], datetime) else b['month'], b['log_type'], b['rows']) for b in buckets]
+
+
+def archive_closed_months(now=None, hot_months=None):
+    """Archive every closed bucket outside the hot window. Returns the new ApprovalLogArchive rows."""
+    archives = []
+    for month, log_type, _rows in closed_buckets(now, hot_months):
+        archive = archive_month(month, log_type)
+        if archive is not None:
+            archives.append(archive)
+    return archives
+
+
+def purge_expired(now=None, dry_run=False):
+    """Drop rows and archives past their log_type's retention. Returns (rows, archive files)."""
+    rows_deleted = archives_deleted = 0
+    for log_type, _months in settings.AUDIT_LOG_RETENTION_MONTHS.items():
+        cutoff = retention_cutoff(log_type, now)
+        if cutoff is None:
+            continue
+        expired_rows = ApprovalLog.objects.filter(ARCHIVABLE_Q, log_type=log_type, created_at__lt=cutoff)
+        expired_archives = ApprovalLogArchive.objects.filter(log_type=log_type, month__lt=cutoff.date())
+        if dry_run:
+            rows_deleted += expired_rows.count()
+            archives_deleted += expired_archives.count()
+            continue
+        rows_deleted += expired_rows.delete()[0]
+        for archive in expired_archives:
+            archive_path(archive).unlink(missing_ok=True)
+            archive.delete()
+            archives_deleted += 1
+    return rows_deleted, archives_deleted
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from budget_mgmt.log_archive import archive_month, closed_buckets, purge_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Move closed months of ApprovalLog into compressed archive files and apply "
+        "per-log_type retention (AUDIT_LOG_RETENTION_MONTHS)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hot-months", type=int, help="Months kept in the table (defaults to AUDIT_LOG_HOT_MONTHS)")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be archived or purged")
+        parser.add_argument("--skip-retention", action="store_true", help="Archive only, do not purge expired logs")
+
+    def handle(self, *args, **options):
+        hot_months = options.get("hot_months")
+        if hot_months is not None and hot_months < 0:
+            raise CommandError("--hot-months must not be negative.")
+        dry_run = options["dry_run"]
+
+        if not options["skip_retention"]:
+            rows, files = purge_expired(dry_run=dry_run)
+            verb = "Would purge" if dry_run else "Purged"
+            self.stdout.write(f"{verb} {rows} expired log(s) and {files} archive file(s).")
+
+        archived = 0
+        for month, log_type, rows in closed_buckets(hot_months=hot_months):
+            if dry_run:
+                self.stdout.write(f"would archive {month:%Y-%m} {log_type}: {rows} log(s)")
+                continue
+            archive = archive_month(month, log_type)
+            if archive is None:
+                continue
+            archived += archive.row_count
+            self.stdout.write(f"{month:%Y-%m} {log_type}: {archive.row_count} log(s) -> {archive.file_name}")
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS(f"Archived {archived} log(s)."))
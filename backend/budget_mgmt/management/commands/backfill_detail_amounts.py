@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from budget_mgmt.models import BudgetDetail
+from budget_mgmt.totals import AMOUNT_BACKFILL_BATCH_SIZE, backfill_detail_amounts, find_amount_drift
+
+
+class Command(BaseCommand):
+    help = "Backfill BudgetDetail.amount from price/qty/freq/is_rate in batches, or check it for drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--year", type=int, help="Limit to details of entries in a budget year")
+        parser.add_argument("--batch-size", type=int, default=AMOUNT_BACKFILL_BATCH_SIZE, help="Detail ids per UPDATE")
+        parser.add_argument("--check", action="store_true", help="Only report details whose stored amount drifted")
+        parser.add_argument("--max-rows", type=int, default=50, help="Max drift rows to print")
+        parser.add_argument("--strict", action="store_true", help="Raise CommandError when --check finds drift.")
+
+    def handle(self, *args, **options):
+        queryset = BudgetDetail.objects.all()
+        if options.get("year"):
+            queryset = queryset.filter(entry__year=options["year"])
+
+        if not options.get("check"):
+            if options["batch_size"] < 1:
+                raise CommandError("--batch-size must be positive.")
+            updated = backfill_detail_amounts(queryset, batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Backfilled amount on {updated} details."))
+            if updated:
+                self.stdout.write("Run verify_entry_totals --fix to realign entry totals if they were built from stale amounts.")
+            return
+
+        drift = find_amount_drift(queryset)
+        for item in drift[: max(0, options["max_rows"])]:
+            self.stdout.write(
+                f"detail={item['detail_id']} entry={item['entry_id']} amount {item['stored']} -> {item['expected']}"
+            )
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("No drift found."))
+            return
+        message = f"Found {len(drift)} details with a stale amount (rerun without --check to backfill)."
+        if options.get("strict"):
+            raise CommandError(message)
+        self.stdout.write(self.style.WARNING(message))
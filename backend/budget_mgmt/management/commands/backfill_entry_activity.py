@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from budget_mgmt.audit import backfill_entry_activity
+from budget_mgmt.models import BudgetEntry
+
+
+class Command(BaseCommand):
+    help = "Populate BudgetEntry submitted_*/latest_action_* from ApprovalLog history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--year", type=int, help="Limit to entries of a budget year")
+        parser.add_argument("--round", type=int, help="Limit to a supplemental round (requires --year)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Entries per UPDATE batch")
+
+    def handle(self, *args, **options):
+        if options.get("round") is not None and not options.get("year"):
+            raise CommandError("--round requires --year.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        queryset = BudgetEntry.objects.all()
+        if options.get("year"):
+            queryset = queryset.filter(year=options["year"])
+        if options.get("round") is not None:
+            queryset = queryset.filter(supplemental_round=options["round"])
+
+        processed = backfill_entry_activity(queryset, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Updated activity fields on {processed} entries."))
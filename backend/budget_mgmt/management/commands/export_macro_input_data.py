@@ -4,6 +4,7 @@ from pathlib import Path
 from django.core.management.base import BaseCommand
 
 from budget_mgmt.models import BudgetEntry
+from budget_mgmt.subjecttree import get_subject_tree
 
 
 HEADERS = [
@@ -27,16 +28,6 @@ HEADERS = [
 ]
 
 
-def _subject_levels(subject):
-    levels = {1: "", 2: "", 3: "", 4: ""}
-    node = subject
-    while node:
-        if node.level in levels:
-            levels[node.level] = node.name
-        node = node.parent
-    return levels
-
-
 class Command(BaseCommand):
     help = "Export budget detail rows to macro-friendly CSV format."
 
@@ -62,7 +53,7 @@ class Command(BaseCommand):
 
         qs = (
             BudgetEntry.objects.filter(year=year)
-            .select_related("organization", "subject", "subject__parent", "subject__parent__parent", "entrusted_project")
+            .select_related("organization", "subject", "entrusted_project")
             .prefetch_related("details")
             .order_by("organization__name", "entrusted_project__name", "subject__code", "id")
         )
@@ -72,13 +63,14 @@ class Command(BaseCommand):
         out_path = Path(output)
         out_path.parent.mkdir(parents=True, exist_ok=True)
 
+        subject_tree = get_subject_tree()
         row_no = 0
         with out_path.open("w", newline="", encoding="utf-8-sig") as f:
             writer = csv.writer(f)
             writer.writerow(HEADERS)
 
             for entry in qs:
-                levels = _subject_levels(entry.subject)
+                levels = subject_tree.levels(entry.subject_id)
                 organization_name = entry.organization.name
                 team_name = ""
                 jang = entry.entrusted_project.name if entry.entrusted_project else ""
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from budget_mgmt.audit_writer import replay_spool
+
+
+class Command(BaseCommand):
+    help = "Insert audit log spool segments left behind by failed flushes or exited processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--spool-dir", help="Spool directory (defaults to AUDIT_LOG_SPOOL_DIR)")
+
+    def handle(self, *args, **options):
+        inserted = replay_spool(options.get("spool_dir"))
+        self.stdout.write(self.style.SUCCESS(f"Replayed {inserted} audit log record(s)."))
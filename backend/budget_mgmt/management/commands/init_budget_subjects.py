@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from budget_mgmt.models import BudgetSubject, BudgetEntry
+from budget_mgmt.subjecttree import batched_invalidation
 
 class Command(BaseCommand):
     help = 'Initialize Budget Subjects based on 2026 Guidelines'
@@ -12,6 +13,7 @@ class Command(BaseCommand):
             help='Delete existing BudgetEntry and BudgetSubject records before initializing.',
         )
 
+    @batched_invalidation()
     def handle(self, *args, **options):
         if not options.get('force'):
             self.stdout.write(self.style.WARNING(
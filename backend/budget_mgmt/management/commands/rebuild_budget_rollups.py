@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from budget_mgmt.rollups import find_rollup_drift, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or check) the BudgetRollup rows used by version progress and the dashboard."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--year", type=int, help="Limit to a budget year")
+        parser.add_argument("--round", type=int, help="Limit to a supplemental round (requires --year)")
+        parser.add_argument("--check", action="store_true", help="Only report drift; raise CommandError if found")
+        parser.add_argument("--max-rows", type=int, default=50, help="Max drift rows to print")
+
+    def handle(self, *args, **options):
+        year = options.get("year")
+        round_no = options.get("round")
+        if round_no is not None and not year:
+            raise CommandError("--round requires --year.")
+
+        if not options.get("check"):
+            written = rebuild_rollups(year=year, round_no=round_no)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} rollup rows."))
+            return
+
+        drift = find_rollup_drift(year=year, round_no=round_no)
+        for item in drift[: max(0, options["max_rows"])]:
+            self.stdout.write(f"{item['key']} count/total/executed {item['stored']} -> {item['expected']}")
+        if drift:
+            raise CommandError(f"Found {len(drift)} drifted rollup rows (rerun without --check to rebuild).")
+        self.stdout.write(self.style.SUCCESS("No drift found."))
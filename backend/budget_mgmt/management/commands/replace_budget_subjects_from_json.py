@@ -5,6 +5,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 
 from budget_mgmt.models import BudgetEntry, BudgetSubject
+from budget_mgmt.subjecttree import batched_invalidation
 
 
 class Command(BaseCommand):
@@ -119,7 +120,7 @@ class Command(BaseCommand):
         sorted_records = sorted(records, key=lambda rec: (rec['level'], rec['sort_order']))
         incoming_codes = {rec['code'] for rec in records}
 
-        with transaction.atomic():
+        with transaction.atomic(), batched_invalidation():
             if replace:
                 entry_count = BudgetEntry.objects.count()
                 subject_count = BudgetSubject.objects.count()
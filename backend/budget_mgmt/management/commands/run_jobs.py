@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from budget_mgmt.jobs import default_worker_id, process_jobs
+
+
+class Command(BaseCommand):
+    help = "Process background jobs (/api/jobs/) from the database queue with a thread pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.BUDGET_JOBS_WORKERS, help="Concurrent jobs.")
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.BUDGET_JOBS_POLL_INTERVAL,
+            help="Seconds to wait when the queue is empty.",
+        )
+        parser.add_argument("--kind", action="append", dest="kinds", help="Only run jobs of this kind (repeatable).")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is drained.")
+
+    def handle(self, *args, **options):
+        workers = max(1, options["workers"])
+        worker_id = default_worker_id()
+        self.stdout.write(f"job worker {worker_id} started with {workers} thread(s)")
+        process_jobs(
+            worker_id,
+            workers=workers,
+            poll_interval=max(0.1, options["poll_interval"]),
+            kinds=options.get("kinds") or None,
+            should_stop=(lambda: True) if options["once"] else None,
+            on_finished=self._report,
+        )
+
+    def _report(self, job_id, future):
+        try:
+            job = future.result()
+        except Exception as exc:  # noqa: BLE001
+            self.stdout.write(self.style.ERROR(f"job={job_id} crashed: {exc}"))
+            return
+        line = f"job={job.pk} kind={job.kind} status={job.status}"
+        if job.status == "SUCCEEDED":
+            self.stdout.write(self.style.SUCCESS(line))
+        else:
+            self.stdout.write(self.style.WARNING(f"{line} message={job.message}"))
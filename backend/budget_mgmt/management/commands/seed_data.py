@@ -2,10 +2,12 @@ from django.core.management.base import BaseCommand
 from budget_mgmt.models import Organization, BudgetSubject, BudgetEntry, BudgetDetail
 from django.contrib.auth.models import User
 from budget_mgmt.models import UserProfile
+from budget_mgmt.totals import deferred_totals
 
 class Command(BaseCommand):
     help = 'Seed initial data'
 
+    @deferred_totals()
     def handle(self, *args, **options):
         # 1. Organizations
         orgs_data = [
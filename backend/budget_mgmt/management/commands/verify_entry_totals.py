@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from budget_mgmt.models import BudgetEntry
+from budget_mgmt.totals import find_total_drift
+
+
+class Command(BaseCommand):
+    help = "Compare stored BudgetEntry totals with a full recompute and report (or fix) drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--year", type=int, help="Limit to entries of a budget year")
+        parser.add_argument("--round", type=int, help="Limit to a supplemental round (requires --year)")
+        parser.add_argument("--fix", action="store_true", help="Rewrite drifted entries with recomputed totals")
+        parser.add_argument("--max-rows", type=int, default=50, help="Max drift rows to print")
+        parser.add_argument(
+            "--strict",
+            action="store_true",
+            help="Raise CommandError when drift is found (without --fix).",
+        )
+
+    def handle(self, *args, **options):
+        queryset = BudgetEntry.objects.all()
+        if options.get("round") is not None and not options.get("year"):
+            raise CommandError("--round requires --year.")
+        if options.get("year"):
+            queryset = queryset.filter(year=options["year"])
+        if options.get("round") is not None:
+            queryset = queryset.filter(supplemental_round=options["round"])
+
+        fix = bool(options.get("fix"))
+        drift = find_total_drift(queryset, fix=fix)
+
+        for item in drift[: max(0, options["max_rows"])]:
+            stored = item["stored"]
+            expected = item["expected"]
+            self.stdout.write(
+                f"entry={item['entry_id']} "
+                f"total {stored['total_amount']} -> {expected['total_amount']}, "
+                f"executed {stored['executed_amount']} -> {expected['executed_amount']}, "
+                f"remaining {stored['remaining_amount']} -> {expected['remaining_amount']}"
+            )
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("No drift found."))
+            return
+        if fix:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(drift)} drifted entries."))
+            return
+        message = f"Found {len(drift)} drifted entries (rerun with --fix to repair)."
+        if options.get("strict"):
+            raise CommandError(message)
+        self.stdout.write(self.style.WARNING(message))
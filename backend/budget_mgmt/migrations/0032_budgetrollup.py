@@ -0,0 +1,58 @@
+# Generated by Django 4.2.27 on 2026-10-18 03:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+
+def build_rollups(apps, schema_editor):
+    BudgetEntry = apps.get_model('budget_mgmt', 'BudgetEntry')
+    BudgetRollup = apps.get_model('budget_mgmt', 'BudgetRollup')
+    rows = (
+        BudgetEntry.objects.values('year', 'supplemental_round', 'organization_id', 'status', 'subject__subject_type')
+        .annotate(entry_count=Count('id'), total_sum=Sum('total_amount'), executed_sum=Sum('executed_amount'))
+        .order_by()
+    )
+    BudgetRollup.objects.bulk_create([
+        BudgetRollup(
+            year=row['year'],
+            supplemental_round=row['supplemental_round'],
+            organization_id=row['organization_id'],
+            status=row['status'],
+            subject_type=row['subject__subject_type'] or '',
+            entry_count=row['entry_count'],
+            total_amount=int(row['total_sum'] or 0),
+            executed_amount=int(row['executed_sum'] or 0),
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget_mgmt', '0031_budgetdetail_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BudgetRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('supplemental_round', models.IntegerField(default=0)),
+                ('status', models.CharField(max_length=20)),
+                ('subject_type', models.CharField(max_length=10)),
+                ('entry_count', models.IntegerField(default=0)),
+                ('total_amount', models.BigIntegerField(default=0)),
+                ('executed_amount', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='budget_mgmt.organization')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['year', 'supplemental_round'], name='budget_mgmt_year_5fe806_idx')],
+                'unique_together': {('year', 'supplemental_round', 'organization', 'status', 'subject_type')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
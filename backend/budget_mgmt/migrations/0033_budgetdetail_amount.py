@@ -0,0 +1,49 @@
+# Generated by Django 4.2.27 on 2026-10-18 03:17
+
+from django.db import migrations, models
+from django.db.models import BigIntegerField, Case, F, FloatField, Func, Q, Value, When
+from django.db.models.functions import Coalesce
+
+
+class TruncToInt(Func):
+    # Truncate toward zero like int(); frozen copy of budget_mgmt.totals.TruncToInt.
+    template = 'CAST(%(expressions)s AS INTEGER)'
+    output_field = BigIntegerField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(TRUNC(%(expressions)s) AS BIGINT)', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(TRUNCATE(%(expressions)s, 0) AS SIGNED)', **extra_context)
+
+
+def fill_amounts(apps, schema_editor):
+    # BudgetDetail.total_price as of this migration: price * qty / 100 for rates, else price * qty * freq.
+    BudgetDetail = apps.get_model('budget_mgmt', 'BudgetDetail')
+    qty = Coalesce(F('qty'), Value(0.0))
+    amount = Case(
+        When(Q(is_rate=True), then=F('price') * (qty / Value(100.0))),
+        default=F('price') * qty * Coalesce(F('freq'), Value(0)),
+        output_field=FloatField(),
+    )
+    BudgetDetail.objects.update(amount=TruncToInt(Coalesce(amount, Value(0.0))))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget_mgmt', '0032_budgetrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budgetdetail',
+            name='amount',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='budgetdetail',
+            index=models.Index(fields=['entry', 'amount'], name='budget_detail_entry_amount'),
+        ),
+        migrations.RunPython(fill_amounts, migrations.RunPython.noop),
+    ]
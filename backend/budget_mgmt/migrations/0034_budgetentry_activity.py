@@ -0,0 +1,67 @@
+# Generated by Django 4.2.27 on 2026-10-18 03:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Q, Subquery
+import django.db.models.deletion
+
+
+def fill_activity(apps, schema_editor):
+    # Same rules as BudgetEntrySerializer._entry_log_meta at this point: latest log;
+    # submitted = latest PENDING log, else first transition out of DRAFT, else oldest log.
+    BudgetEntry = apps.get_model('budget_mgmt', 'BudgetEntry')
+    ApprovalLog = apps.get_model('budget_mgmt', 'ApprovalLog')
+    entry_logs = ApprovalLog.objects.filter(entry_id=OuterRef('pk'))
+    latest = entry_logs.order_by('-created_at', '-id')
+    pending = entry_logs.filter(to_status='PENDING').order_by('-created_at', '-id')
+    first_transition = entry_logs.filter(
+        Q(to_status='PENDING') | (Q(from_status='DRAFT') & ~Q(to_status='DRAFT'))
+    ).order_by('created_at', 'id')
+    oldest = entry_logs.order_by('created_at', 'id')
+
+    entries = BudgetEntry.objects.all()
+    entries.filter(Exists(latest)).update(
+        latest_action_at=Subquery(latest.values('created_at')[:1]),
+        latest_action_by=Subquery(latest.values('actor_id')[:1]),
+    )
+    for source in (pending, first_transition, oldest):
+        entries.filter(submitted_at__isnull=True).filter(Exists(source)).update(
+            submitted_at=Subquery(source.values('created_at')[:1]),
+            submitted_by=Subquery(source.values('actor_id')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('budget_mgmt', '0033_budgetdetail_amount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budgetentry',
+            name='latest_action_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='budgetentry',
+            name='latest_action_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='budgetentry',
+            name='submitted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='budgetentry',
+            name='submitted_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='approvallog',
+            index=models.Index(fields=['entry', 'created_at'], name='approval_log_entry_created'),
+        ),
+        migrations.RunPython(fill_activity, migrations.RunPython.noop),
+    ]
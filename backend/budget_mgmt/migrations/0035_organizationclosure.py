@@ -0,0 +1,54 @@
+# Generated by Django 4.2.27 on 2026-10-18 03:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_closure(apps, schema_editor):
+    Organization = apps.get_model('budget_mgmt', 'Organization')
+    OrganizationClosure = apps.get_model('budget_mgmt', 'OrganizationClosure')
+    parents = dict(Organization.objects.values_list('id', 'parent_id'))
+    rows = []
+    for org_id in parents:
+        rows.append(OrganizationClosure(ancestor_id=org_id, descendant_id=org_id, depth=0))
+        seen = {org_id}
+        parent_id = parents.get(org_id)
+        depth = 1
+        while parent_id in parents and parent_id not in seen:  # stop at dangling parents and cycles
+            rows.append(OrganizationClosure(ancestor_id=parent_id, descendant_id=org_id, depth=depth))
+            seen.add(parent_id)
+            parent_id = parents[parent_id]
+            depth += 1
+    OrganizationClosure.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget_mgmt', '0034_budgetentry_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganizationClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.IntegerField(default=0)),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='budget_mgmt.organization')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='budget_mgmt.organization')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='org_closure_descendant')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(fill_closure, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='TreeGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('generation', models.CharField(max_length=32)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.27 on 2026-10-18 03:58
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget_mgmt', '0036_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='approvallog',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False),
+        ),
+    ]
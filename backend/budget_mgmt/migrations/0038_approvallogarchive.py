@@ -0,0 +1,33 @@
+# Generated by Django 4.2.27 on 2026-10-18 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget_mgmt', '0037_approvallog_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApprovalLogArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('log_type', models.CharField(max_length=20)),
+                ('file_name', models.CharField(max_length=255)),
+                ('row_count', models.IntegerField(default=0)),
+                ('first_id', models.BigIntegerField(default=0)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('summary', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-month', 'log_type', '-last_id'],
+                'indexes': [models.Index(fields=['month', 'log_type'], name='approval_log_archive_month')],
+            },
+        ),
+    ]
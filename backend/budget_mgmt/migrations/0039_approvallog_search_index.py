@@ -0,0 +1,94 @@
+from django.db import migrations
+from django.db.utils import DatabaseError
+
+LOG_TABLE = 'budget_mgmt_approvallog'
+SEARCH_TABLE = 'budget_mgmt_approvallog_search'
+SEARCH_COLUMNS = ('reason', 'path', 'resource_type', 'resource_id')
+
+
+def _columns(prefix=''):
+    return ', '.join(f'{prefix}{column}' for column in SEARCH_COLUMNS)
+
+
+def _sqlite_supports_trigram(cursor):
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp.approvallog_search_probe USING fts5(x, tokenize='trigram')")
+        cursor.execute('DROP TABLE temp.approvallog_search_probe')
+    except DatabaseError:
+        return False
+    return True
+
+
+def sqlite_install_sql():
+    # FTS5 trigram table with ApprovalLog as external content, kept in sync by triggers.
+    columns = _columns()
+    return [
+        f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5({columns}, "
+        f"content='{LOG_TABLE}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER {SEARCH_TABLE}_ai AFTER INSERT ON {LOG_TABLE} BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES (new.id, {_columns('new.')}); END",
+        f"CREATE TRIGGER {SEARCH_TABLE}_ad AFTER DELETE ON {LOG_TABLE} BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {_columns('old.')}); END",
+        f"CREATE TRIGGER {SEARCH_TABLE}_au AFTER UPDATE OF {columns} ON {LOG_TABLE} BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {_columns('old.')}); "
+        f"INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES (new.id, {_columns('new.')}); END",
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')",
+    ]
+
+
+def sqlite_uninstall_sql():
+    return [f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{suffix}' for suffix in ('ai', 'ad', 'au')] + [
+        f'DROP TABLE IF EXISTS {SEARCH_TABLE}',
+    ]
+
+
+def postgresql_install_sql():
+    # Same expression Django emits for icontains, so the GIN indexes serve it as is.
+    return ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+        f'CREATE INDEX IF NOT EXISTS {LOG_TABLE}_{column}_trgm ON {LOG_TABLE} '
+        f'USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        for column in SEARCH_COLUMNS
+    ]
+
+
+def postgresql_uninstall_sql():
+    return [f'DROP INDEX IF EXISTS {LOG_TABLE}_{column}_trgm' for column in SEARCH_COLUMNS]
+
+
+def install_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            if not _sqlite_supports_trigram(cursor):
+                return  # SQLite < 3.34: keyword search keeps scanning
+            statements = sqlite_install_sql()
+        elif vendor == 'postgresql':
+            statements = postgresql_install_sql()
+        else:
+            return
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def uninstall_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = sqlite_uninstall_sql()
+    elif vendor == 'postgresql':
+        statements = postgresql_uninstall_sql()
+    else:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget_mgmt', '0038_approvallogarchive'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.27 on 2026-10-18 04:12
+
+from datetime import timedelta
+import hashlib
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def move_legacy_tokens(apps, schema_editor):
+    # Keep signed-in clients working: their single DRF token becomes a device token.
+    Token = apps.get_model('authtoken', 'Token')
+    AuthToken = apps.get_model('budget_mgmt', 'AuthToken')
+    ttl = getattr(settings, 'AUTH_TOKEN_TTL', 0)
+    expires_at = timezone.now() + timedelta(seconds=ttl) if ttl > 0 else None
+    AuthToken.objects.bulk_create([
+        AuthToken(
+            user_id=token.user_id,
+            digest=hashlib.sha256(token.key.encode('utf-8')).hexdigest(),
+            key_prefix=token.key[:8],
+            name='legacy',
+            expires_at=expires_at,
+        )
+        for token in Token.objects.all()
+    ], batch_size=1000)
+    Token.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('authtoken', '0003_tokenproxy'),
+        ('budget_mgmt', '0039_approvallog_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('key_prefix', models.CharField(max_length=8)),
+                ('name', models.CharField(blank=True, default='', max_length=100)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('revoked_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='auth_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'revoked_at'], name='auth_token_user')],
+            },
+        ),
+        migrations.RunPython(move_legacy_tokens, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,11 @@
+from functools import partial
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from . import orgtree, rollups, subjecttree, totals
 
 
 class Organization(models.Model):
@@ -17,6 +22,31 @@ class Organization(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        return instance
+
+
+class OrganizationClosure(models.Model):
+    # 조직 계층 클로저 테이블 (자기 자신 depth=0 포함), orgtree.rebuild_org_closure로 관리
+    ancestor = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='org_closure_descendant'),
+        ]
+
+
+class TreeGeneration(models.Model):
+    # 계층 인덱스 세대 값 (treecache.py). 공유 캐시(Redis)가 없을 때 프로세스 간 무효화 기준
+    name = models.CharField(max_length=50, unique=True)
+    generation = models.CharField(max_length=32)
+
 
 class BudgetSubject(models.Model):
     code = models.CharField(max_length=20, unique=True)
@@ -34,6 +64,16 @@ class BudgetSubject(models.Model):
     def __str__(self):
         return f"[{self.code}] {self.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_subject_type = instance.__dict__.get('subject_type')
+        instance._loaded_tree_state = instance.tree_state()
+        return instance
+
+    def tree_state(self):
+        return tuple(self.__dict__.get(field) for field in subjecttree.TREE_FIELDS)
+
 
 class BudgetVersion(models.Model):
     CREATION_MODE_CHOICES = [
@@ -123,6 +163,7 @@ class BudgetEntry(models.Model):
         ('ACCIDENT', '사고이월'),
         ('CONTINUING', '계속비이월'),
     ]
+    ACTIVITY_FIELDS = ('submitted_at', 'submitted_by', 'latest_action_at', 'latest_action_by')
 
     subject = models.ForeignKey(BudgetSubject, on_delete=models.PROTECT)
     organization = models.ForeignKey(Organization, on_delete=models.PROTECT)
@@ -138,6 +179,12 @@ class BudgetEntry(models.Model):
     executed_amount = models.BigIntegerField(default=0)
     remaining_amount = models.BigIntegerField(default=0)
 
+    # 결재 이력 요약 (audit.record_entry_activity 가 로그 기록과 같은 트랜잭션에서 갱신)
+    submitted_at = models.DateTimeField(null=True, blank=True)
+    submitted_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    latest_action_at = models.DateTimeField(null=True, blank=True)
+    latest_action_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
     class Meta:
         unique_together = ('subject', 'organization', 'entrusted_project', 'year', 'supplemental_round')
         indexes = [
@@ -151,26 +198,108 @@ class BudgetEntry(models.Model):
 
     def update_totals(self):
         """
-        Recalculates totals from related details and executions.
-        Call this method whenever details or executions change.
+        Recalculates totals from related details and executions (full recompute).
+        Detail/execution writes keep totals current incrementally; use this to
+        repair an entry after raw SQL or other signal-less writes.
         """
-        # Calculate total_amount from BudgetDetail
-        details_sum = sum(detail.total_price for detail in self.details.all())
-        self.total_amount = details_sum
+        from .totals import TOTAL_FIELDS, compute_entry_totals
 
-        # Calculate executed_amount from BudgetExecution
-        executions_sum = sum(execution.amount for execution in self.executions.all())
-        self.executed_amount = executions_sum
-
-        # Update remaining_amount
-        self.remaining_amount = self.total_amount - self.executed_amount
-        self.save()
+        total_amount, executed_amount = compute_entry_totals([self.pk]).get(self.pk, (0, 0))
+        self.total_amount = total_amount
+        self.executed_amount = executed_amount
+        self.remaining_amount = total_amount - executed_amount
+        self.save(update_fields=list(TOTAL_FIELDS))
 
     @property
     def executed_total(self):
         # Compatibility property for existing code relying on 'executed_total'
         return self.executed_amount
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rollup_key = instance.rollup_key()
+        return instance
+
+    def rollup_key(self):
+        """Fields that place the entry in a BudgetRollup row (None if deferred)."""
+        fields = ('year', 'supplemental_round', 'organization_id', 'status', 'subject_id')
+        if self.get_deferred_fields().intersection(fields):
+            return None
+        return tuple(getattr(self, name) for name in fields)
+
+    def save(self, *args, **kwargs):
+        # Totals are maintained by detail/execution writes (F() deltas) and the
+        # activity fields by log writes; a full save of a stale instance must
+        # not overwrite them.
+        if not self._state.adding and self.pk is not None and kwargs.get('update_fields') is None and not args:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in totals.TOTAL_FIELDS and f.name not in self.ACTIVITY_FIELDS
+            ]
+        return super().save(*args, **kwargs)
+
+
+class BudgetRollup(models.Model):
+    """
+    (연도, 차수, 조직, 상태, 과목구분)별 예산 항목 집계.
+    rollups.py 가 항목/산출내역 변경 시 갱신하며 진행률·대시보드 조회에 사용한다.
+    """
+    year = models.IntegerField()
+    supplemental_round = models.IntegerField(default=0)
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='+')
+    status = models.CharField(max_length=20)
+    subject_type = models.CharField(max_length=10)
+    entry_count = models.IntegerField(default=0)
+    total_amount = models.BigIntegerField(default=0)
+    executed_amount = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('year', 'supplemental_round', 'organization', 'status', 'subject_type')
+        indexes = [
+            models.Index(fields=['year', 'supplemental_round']),
+        ]
+
+    def __str__(self):
+        return f"{self.year}-{self.supplemental_round} org={self.organization_id} {self.status}/{self.subject_type}"
+
+
+class BudgetDetailQuerySet(models.QuerySet):
+    """
+    bulk_create / bulk_update / update 경로에서도 amount(산출금액) 컬럼을 함께 맞춘다.
+    bulk_update / update 는 auto_now 처럼 updated_at 도 갱신한다 (amount 만 다시 계산하는 경우 제외).
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.amount = obj.total_price
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        if set(fields) & set(totals.DETAIL_AMOUNT_FIELDS):
+            for obj in objs:
+                obj.amount = obj.total_price
+            if 'amount' not in fields:
+                fields.append('amount')
+        if set(fields) - {'amount', 'updated_at'} and 'updated_at' not in fields:
+            now = timezone.now()
+            for obj in objs:
+                obj.updated_at = now
+            fields.append('updated_at')
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        changed = {name: kwargs[name] for name in totals.DETAIL_AMOUNT_FIELDS if name in kwargs}
+        if changed and 'amount' not in kwargs:
+            kwargs['amount'] = totals.detail_amount_expression(**changed)
+        if set(kwargs) - {'amount'}:
+            kwargs.setdefault('updated_at', timezone.now())
+        return super().update(**kwargs)
+
 
 class BudgetDetail(models.Model):
     entry = models.ForeignKey(BudgetEntry, on_delete=models.CASCADE, related_name='details')
@@ -178,6 +307,7 @@ class BudgetDetail(models.Model):
     price = models.BigIntegerField()
     qty = models.FloatField()
     freq = models.IntegerField(default=1)
+    amount = models.BigIntegerField(default=0, editable=False)  # 산출금액(total_price 저장값, 합계 집계용)
     currency_unit = models.CharField(max_length=20, default='원')
     unit = models.CharField(max_length=20)
     freq_unit = models.CharField(max_length=20, default='회')
@@ -197,6 +327,14 @@ class BudgetDetail(models.Model):
     updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
 
+    objects = BudgetDetailQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # entry별 SUM(amount)를 인덱스만으로 계산
+            models.Index(fields=['entry', 'amount'], name='budget_detail_entry_amount'),
+        ]
+
     def clean(self):
         if self.price < 0:
             raise ValidationError('Price cannot be negative.')
@@ -204,13 +342,22 @@ class BudgetDetail(models.Model):
             raise ValidationError('Quantity cannot be negative.')
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
+        self.amount = self.total_price
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(totals.DETAIL_AMOUNT_FIELDS):
+            kwargs['update_fields'] = {*update_fields, 'amount'}
+        return totals.locked_write(
+            self, partial(super().save, *args, **kwargs), totals.stored_detail_amount, using=kwargs.get('using'),
+        )
+
+    def delete(self, *args, **kwargs):
+        return totals.locked_write(
+            self, partial(super().delete, *args, **kwargs), totals.stored_detail_amount, using=kwargs.get('using'),
+        )
 
     @property
     def total_price(self):
-        if self.is_rate:
-            return int(self.price * (self.qty / 100))
-        return int(self.price * self.qty * self.freq)
+        return totals.detail_amount(self.price, self.qty, self.freq, self.is_rate)
 
 
 class SpendingLimitRule(models.Model):
@@ -230,6 +377,16 @@ class BudgetExecution(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.PROTECT)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    def save(self, *args, **kwargs):
+        return totals.locked_write(
+            self, partial(super().save, *args, **kwargs), totals.stored_execution_amount, using=kwargs.get('using'),
+        )
+
+    def delete(self, *args, **kwargs):
+        return totals.locked_write(
+            self, partial(super().delete, *args, **kwargs), totals.stored_execution_amount, using=kwargs.get('using'),
+        )
+
 
 class BudgetTransfer(models.Model):
     STATUS_CHOICES = [
@@ -280,10 +437,43 @@ class ApprovalLog(models.Model):
     user_agent = models.CharField(max_length=255, null=True, blank=True)
     metadata = models.JSONField(default=dict, blank=True)
     reason = models.TextField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # 버퍼링된 감사 로그도 발생 시각을 유지하도록 auto_now_add 대신 default 사용
+    created_at = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
 
     class Meta:
         ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['entry', 'created_at'], name='approval_log_entry_created'),
+        ]
+
+
+class ApprovalLogArchive(models.Model):
+    """
+    월 단위로 아카이브된 ApprovalLog 파일 목록 (archive_audit_logs 명령이 생성).
+    - (월, log_type) 별 gzip NDJSON 파일 하나, AUDIT_LOG_ARCHIVE_DIR 기준 상대 경로.
+    - 행은 최신순(-created_at, -id)으로 저장되며 원본 테이블에서는 삭제된다.
+    - entry에 연결된 로그는 제외 (rebuild_entry_activity가 테이블에서 다시 계산).
+    """
+    month = models.DateField()  # 해당 월 1일
+    log_type = models.CharField(max_length=20)
+    file_name = models.CharField(max_length=255)
+    row_count = models.IntegerField(default=0)
+    first_id = models.BigIntegerField(default=0)
+    last_id = models.BigIntegerField(default=0)
+    size_bytes = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, default='')
+    # [actor_id, auth_user_id, entry_id, entry_org_id, entry_year, entry_round, 행 수] 목록 (파일을 열지 않고 건수 계산)
+    summary = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-month', 'log_type', '-last_id']
+        indexes = [
+            models.Index(fields=['month', 'log_type'], name='approval_log_archive_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.log_type} ({self.row_count} rows)"
 
 
 class UserProfile(models.Model):
@@ -303,6 +493,36 @@ class UserProfile(models.Model):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='STAFF')
 
 
+class AuthToken(models.Model):
+    """
+    기기(세션)별 API 토큰. 원문 키는 발급 시 한 번만 반환하고 SHA-256 digest 만 저장한다.
+    - expires_at 이 지나거나 revoked_at 이 설정되면 인증에 사용할 수 없다.
+    - 인증 결과는 캐시된다 (authentication.py 참고).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='auth_tokens')
+    digest = models.CharField(max_length=64, unique=True)
+    key_prefix = models.CharField(max_length=8)  # 세션 목록 표시용
+    name = models.CharField(max_length=100, blank=True, default='')  # 기기 이름 (없으면 User-Agent)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)  # None: 만료 없음
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'revoked_at'], name='auth_token_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.key_prefix}… ({self.user_id})"
+
+    @property
+    def is_active(self):
+        return self.revoked_at is None and (self.expires_at is None or self.expires_at > timezone.now())
+
+
 class SubmissionComment(models.Model):
     """
     예산 검토 의견 스레드.
@@ -384,18 +604,194 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
 
-# Signals for automatic total updates
+class Job(models.Model):
+    """
+    DB 기반 범용 백그라운드 작업 큐 (run_jobs 워커가 처리, 외부 브로커 불필요).
+    - kind 별 핸들러는 budget_mgmt/jobs.py 에 등록한다.
+    - 결과 파일(artifact)은 MEDIA_ROOT/jobs/ 아래에 저장한다.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', '대기'),
+        ('RUNNING', '진행중'),
+        ('SUCCEEDED', '완료'),
+        ('FAILED', '실패'),
+        ('CANCELLED', '취소'),
+    ]
+    FINISHED_STATUSES = ('SUCCEEDED', 'FAILED', 'CANCELLED')
+
+    kind = models.CharField(max_length=50)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    cancel_requested = models.BooleanField(default=False)
+
+    progress = models.FloatField(default=0)  # 0 ~ 100
+    message = models.TextField(blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    artifact = models.FileField(upload_to='jobs/%Y/%m/', null=True, blank=True)
+    artifact_name = models.CharField(max_length=255, blank=True, default='')
+    artifact_content_type = models.CharField(max_length=100, blank=True, default='')
+
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, default='')  # 처리 중인 워커 (host:pid:thread)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_queue'),
+        ]
+
+    def __str__(self):
+        return f"job #{self.pk} {self.kind} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+# Signals for automatic total updates (F() deltas, see totals.py)
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+
+def _deleted_with_entry(origin):
+    # Entry deletion cascades to its children; no totals left to maintain.
+    return isinstance(origin, BudgetEntry) or getattr(origin, 'model', None) is BudgetEntry
+
+
 @receiver(post_save, sender=BudgetDetail)
+def update_entry_totals_from_detail(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    totals.on_detail_saved(instance, using=using)
+
+
 @receiver(post_delete, sender=BudgetDetail)
-def update_entry_totals_from_detail(sender, instance, **kwargs):
-    if instance.entry:
-        instance.entry.update_totals()
+def update_entry_totals_from_deleted_detail(sender, instance, using=None, origin=None, **kwargs):
+    if _deleted_with_entry(origin):
+        return
+    totals.on_detail_deleted(instance, using=using)
+
 
 @receiver(post_save, sender=BudgetExecution)
+def update_entry_totals_from_execution(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    totals.on_execution_saved(instance, using=using)
+
+
 @receiver(post_delete, sender=BudgetExecution)
-def update_entry_totals_from_execution(sender, instance, **kwargs):
-    if instance.entry:
-        instance.entry.update_totals()
+def update_entry_totals_from_deleted_execution(sender, instance, using=None, origin=None, **kwargs):
+    if _deleted_with_entry(origin):
+        return
+    totals.on_execution_deleted(instance, using=using)
+
+
+# Rollup maintenance for entry create/move/status changes (see rollups.py)
+@receiver(post_save, sender=BudgetEntry)
+def update_rollups_from_entry(sender, instance, created, raw=False, using=None, update_fields=None, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_rollup_key', None)
+    current = instance.rollup_key()
+    totals_written = update_fields is not None and bool(set(update_fields) & set(totals.TOTAL_FIELDS))
+    if created or loaded != current or totals_written:
+        buckets = {(instance.year, instance.supplemental_round, instance.organization_id)}
+        if loaded is not None:
+            buckets.add(loaded[:3])
+        rollups.mark_rollup_buckets(buckets, using=using)
+    instance._loaded_rollup_key = current
+
+
+@receiver(post_delete, sender=BudgetEntry)
+def update_rollups_from_deleted_entry(sender, instance, using=None, **kwargs):
+    rollups.mark_rollup_buckets(
+        {(instance.year, instance.supplemental_round, instance.organization_id)}, using=using,
+    )
+
+
+@receiver(post_save, sender=BudgetSubject)
+def update_rollups_from_subject(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw or created:
+        return
+    if getattr(instance, '_loaded_subject_type', instance.subject_type) != instance.subject_type:
+        rollups.mark_rollup_buckets(
+            set(
+                BudgetEntry.objects.using(using).filter(subject_id=instance.pk)
+                .values_list('year', 'supplemental_round', 'organization_id')
+                .distinct()
+            ),
+            using=using,
+        )
+    instance._loaded_subject_type = instance.subject_type
+
+
+# Subject hierarchy index invalidation (see subjecttree.py)
+@receiver(post_save, sender=BudgetSubject)
+def invalidate_subject_tree_from_subject(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    state = instance.tree_state()
+    if created or getattr(instance, '_loaded_tree_state', None) != state:
+        subjecttree.subject_tree_changed(using)
+    instance._loaded_tree_state = state
+
+
+@receiver(post_delete, sender=BudgetSubject)
+def invalidate_subject_tree_from_deleted_subject(sender, instance, using=None, **kwargs):
+    subjecttree.subject_tree_changed(using)
+
+
+# Entry activity (submitted_* / latest_action_*) maintenance, see audit.py.
+# bulk_create callers call audit.record_entry_activity themselves.
+@receiver(post_save, sender=ApprovalLog)
+def update_entry_activity_from_log(sender, instance, created, raw=False, **kwargs):
+    if raw or not created or not instance.entry_id:
+        return
+    from .audit import record_entry_activity
+
+    record_entry_activity([instance])
+
+
+# Cached token authentication (see authentication.py)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_auth_cache_from_user(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    from .authentication import invalidate_user_auth
+
+    invalidate_user_auth(instance.pk, using)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_auth_cache_from_profile(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    from .authentication import invalidate_user_auth
+
+    invalidate_user_auth(instance.user_id, using)
+
+
+# Organization hierarchy index / scope cache invalidation (see orgtree.py)
+@receiver(post_save, sender=Organization)
+def update_hierarchy_from_organization(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    if created or getattr(instance, '_loaded_parent_id', None) != instance.parent_id:
+        orgtree.on_hierarchy_changed(using)
+    else:
+        orgtree.invalidate_org_tree(using)
+    instance._loaded_parent_id = instance.parent_id
+
+
+@receiver(post_delete, sender=Organization)
+def update_hierarchy_from_deleted_organization(sender, instance, using=None, **kwargs):
+    # Children were detached with SET_NULL (no signals); rebuild from scratch.
+    orgtree.on_hierarchy_changed(using)
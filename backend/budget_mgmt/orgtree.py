@@ -0,0 +1,90 @@
+"""
+Organization hierarchy index.
+
+``get_org_tree()`` returns a process-wide ``OrgTree`` built from one query
+over Organization. It answers ancestors, subtrees, root department and depth
+from precomputed dicts, so nested organizations of any depth cost no queries.
+The same closure is persisted in OrganizationClosure for SQL-side filters.
+
+Organization saves, deletes and reorders invalidate the tree (see
+treecache.py); the scope cache (scope.py) is keyed by the same generation.
+"""
+from dataclasses import dataclass
+
+from django.db import router, transaction
+
+from .treecache import ForestIndex, ProcessTreeCache
+
+
+@dataclass(frozen=True)
+class OrgNode:
+    id: int
+    name: str
+    org_type: str
+    parent_id: int | None
+    sort_order: int
+
+
+class OrgTree(ForestIndex):
+    def __init__(self, rows):
+        super().__init__(
+            OrgNode(row['id'], row['name'] or '', row['org_type'] or '', row['parent_id'], row['sort_order'])
+            for row in rows
+        )
+
+    def root_name(self, org_id):
+        root = self.nodes.get(self.root_id(org_id))
+        return root.name if root else ''
+
+    def department_id(self, org_id):
+        """The org itself when it is a dept, else its nearest dept ancestor (None when there is none)."""
+        for node_id in (org_id,) + self.ancestors(org_id):
+            node = self.nodes.get(node_id)
+            if node is not None and node.org_type == 'dept':
+                return node_id
+        return None
+
+
+def load_org_tree(using=None):
+    from .models import Organization
+
+    rows = Organization.objects.using(using or router.db_for_read(Organization)).values(
+        'id', 'name', 'org_type', 'parent_id', 'sort_order',
+    ).order_by()
+    return OrgTree(rows)
+
+
+_tree_cache = ProcessTreeCache('org-tree', load_org_tree, 'ORG_TREE_MAX_AGE')
+
+
+def hierarchy_generation():
+    return _tree_cache.generation()
+
+
+def get_org_tree():
+    return _tree_cache.get()
+
+
+def invalidate_org_tree(using=None):
+    """Drop the cached tree and every scope derived from it."""
+    _tree_cache.invalidate(using)
+
+
+def rebuild_org_closure(using=None):
+    """Rewrite OrganizationClosure from the current hierarchy. Returns rows written."""
+    from .models import OrganizationClosure
+
+    using = using or router.db_for_write(OrganizationClosure)
+    rows = [
+        OrganizationClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+        for ancestor_id, descendant_id, depth in load_org_tree(using).closure_rows()
+    ]
+    with transaction.atomic(using=using):
+        OrganizationClosure.objects.using(using).all().delete()
+        OrganizationClosure.objects.using(using).bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def on_hierarchy_changed(using=None):
+    rebuild_org_closure(using)
+    invalidate_org_tree(using)
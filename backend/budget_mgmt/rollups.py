@@ -0,0 +1,240 @@
+"""
+Materialized BudgetRollup rows keyed by (year, round, organization, status,
+subject_type) with entry counts and amount sums.
+
+Amount changes from detail/execution deltas are applied to the matching row
+with one F() UPDATE. Entry creation, deletion, moves and status transitions
+refresh the affected (year, round, organization) bucket from BudgetEntry with
+one grouped query. Inside ``deferred_totals()`` refreshes are collected and
+run once on exit.
+
+A refresh locks the bucket's Organization rows (select_for_update) so two
+transactions refreshing the same bucket run one after the other, then
+upserts the recomputed rows (ON CONFLICT on the unique key) and deletes only
+the keys that no longer have entries.
+"""
+from collections import defaultdict
+
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Subquery, Sum
+
+from .totals import deferred_state
+
+ROLLUP_STATUSES = ('DRAFT', 'PENDING', 'REVIEWING', 'FINALIZED')
+ROLLUP_KEY_FIELDS = ('year', 'supplemental_round', 'organization_id', 'status', 'subject_type')
+ROLLUP_VALUE_FIELDS = ('entry_count', 'total_amount', 'executed_amount', 'updated_at')
+
+
+def _db(using=None):
+    from .models import BudgetRollup
+
+    return using or router.db_for_write(BudgetRollup)
+
+
+def apply_amount_delta(entry_id, *, total=0, executed=0, using=None):
+    """Shift the rollup row of one entry by an amount delta (single UPDATE)."""
+    from .models import BudgetEntry, BudgetRollup
+
+    if not entry_id or (not total and not executed):
+        return
+    using = _db(using)
+    state = deferred_state()
+    if state is not None:
+        state.rollup_entry_ids.add(entry_id)
+        return
+    entry = BudgetEntry.objects.using(using).filter(pk=entry_id)
+    updated = BudgetRollup.objects.using(using).filter(
+        year=Subquery(entry.values('year')[:1]),
+        supplemental_round=Subquery(entry.values('supplemental_round')[:1]),
+        organization_id=Subquery(entry.values('organization_id')[:1]),
+        status=Subquery(entry.values('status')[:1]),
+        subject_type=Subquery(entry.values('subject__subject_type')[:1]),
+    ).update(
+        total_amount=F('total_amount') + total,
+        executed_amount=F('executed_amount') + executed,
+    )
+    if not updated:
+        refresh_rollups(entry_ids=[entry_id], using=using)
+
+
+def mark_rollup_buckets(buckets, *, using=None):
+    """Refresh (year, round, org_id) buckets now, or on deferred_totals() exit."""
+    buckets = {tuple(b) for b in buckets if b and all(v is not None for v in b)}
+    if not buckets:
+        return
+    state = deferred_state()
+    if state is not None:
+        state.rollup_buckets.update(buckets)
+        return
+    refresh_rollups(buckets=buckets, using=using)
+
+
+def mark_rollup_entries(entry_ids, *, using=None):
+    """Refresh the buckets of the given entries now, or on deferred_totals() exit."""
+    entry_ids = {int(entry_id) for entry_id in entry_ids if entry_id}
+    if not entry_ids:
+        return
+    state = deferred_state()
+    if state is not None:
+        state.rollup_entry_ids.update(entry_ids)
+        return
+    refresh_rollups(entry_ids=entry_ids, using=using)
+
+
+def _aggregate_rows(queryset):
+    return (
+        queryset.values('year', 'supplemental_round', 'organization_id', 'status', 'subject__subject_type')
+        .annotate(
+            entry_count=Count('id'),
+            total_sum=Sum('total_amount'),
+            executed_sum=Sum('executed_amount'),
+        )
+        .order_by()
+    )
+
+
+def _build_rows(aggregated):
+    from .models import BudgetRollup
+
+    return [
+        BudgetRollup(
+            year=row['year'],
+            supplemental_round=row['supplemental_round'],
+            organization_id=row['organization_id'],
+            status=row['status'],
+            subject_type=row['subject__subject_type'] or '',
+            entry_count=row['entry_count'],
+            total_amount=int(row['total_sum'] or 0),
+            executed_amount=int(row['executed_sum'] or 0),
+        )
+        for row in aggregated
+    ]
+
+
+def _rollup_key(row):
+    return tuple(getattr(row, name) for name in ROLLUP_KEY_FIELDS)
+
+
+def _write_rows(rollups, rows, using, batch_size=None):
+    """Upsert ``rows`` and delete the rows of ``rollups`` whose key is not among them."""
+    from .models import BudgetRollup
+
+    keys = {_rollup_key(row) for row in rows}
+    stale = [pk for pk, *key in rollups.values_list('pk', *ROLLUP_KEY_FIELDS) if tuple(key) not in keys]
+    if stale:
+        BudgetRollup.objects.using(using).filter(pk__in=stale).delete()
+    if rows:
+        features = connections[using].features
+        # MySQL upserts on any unique key and takes no conflict target
+        unique_fields = ['year', 'supplemental_round', 'organization', 'status', 'subject_type']
+        BudgetRollup.objects.using(using).bulk_create(
+            rows,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=unique_fields if features.supports_update_conflicts_with_target else None,
+            update_fields=list(ROLLUP_VALUE_FIELDS),
+        )
+
+
+def refresh_rollups(*, entry_ids=(), buckets=(), using=None):
+    """Recompute the rollup rows of the given buckets (plus the buckets of entry_ids)."""
+    from .models import BudgetEntry, BudgetRollup, Organization
+
+    using = _db(using)
+    buckets = {tuple(b) for b in buckets}
+    entry_ids = list(entry_ids)
+    for start in range(0, len(entry_ids), 500):
+        buckets.update(
+            BudgetEntry.objects.using(using)
+            .filter(id__in=entry_ids[start:start + 500])
+            .values_list('year', 'supplemental_round', 'organization_id')
+            .distinct()
+        )
+    if not buckets:
+        return 0
+
+    by_round = defaultdict(set)
+    for year, round_no, org_id in buckets:
+        by_round[(year, round_no)].add(org_id)
+
+    written = 0
+    with transaction.atomic(using=using):
+        # Serialize refreshes per organization; ordered so concurrent refreshes lock in the same order
+        list(
+            Organization.objects.using(using)
+            .select_for_update()
+            .filter(id__in=set().union(*by_round.values()))
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        for (year, round_no), org_ids in by_round.items():
+            rows = _build_rows(_aggregate_rows(
+                BudgetEntry.objects.using(using).filter(
+                    year=year, supplemental_round=round_no, organization_id__in=org_ids,
+                )
+            ))
+            rollups = BudgetRollup.objects.using(using).filter(
+                year=year, supplemental_round=round_no, organization_id__in=org_ids,
+            )
+            _write_rows(rollups, rows, using)
+            written += len(rows)
+    return written
+
+
+def rebuild_rollups(*, year=None, round_no=None, using=None):
+    """Full rebuild (optionally limited to one year / round). Returns rows written."""
+    from .models import BudgetEntry, BudgetRollup
+
+    using = _db(using)
+    entries = BudgetEntry.objects.using(using).all()
+    rollups = BudgetRollup.objects.using(using).all()
+    if year is not None:
+        entries = entries.filter(year=year)
+        rollups = rollups.filter(year=year)
+    if round_no is not None:
+        entries = entries.filter(supplemental_round=round_no)
+        rollups = rollups.filter(supplemental_round=round_no)
+    with transaction.atomic(using=using):
+        rows = _build_rows(_aggregate_rows(entries))
+        _write_rows(rollups, rows, using, batch_size=1000)
+    return len(rows)
+
+
+def find_rollup_drift(*, year=None, round_no=None):
+    """Compare stored rollup rows with a grouped recompute; returns mismatching keys."""
+    from .models import BudgetEntry, BudgetRollup
+
+    entries = BudgetEntry.objects.all()
+    rollups = BudgetRollup.objects.all()
+    if year is not None:
+        entries = entries.filter(year=year)
+        rollups = rollups.filter(year=year)
+    if round_no is not None:
+        entries = entries.filter(supplemental_round=round_no)
+        rollups = rollups.filter(supplemental_round=round_no)
+
+    def key(row):
+        return (row.year, row.supplemental_round, row.organization_id, row.status, row.subject_type)
+
+    expected = {key(row): row for row in _build_rows(_aggregate_rows(entries))}
+    stored = {key(row): row for row in rollups}
+    drift = []
+    for k in set(expected) | set(stored):
+        exp, got = expected.get(k), stored.get(k)
+        values = [
+            tuple(getattr(row, f, 0) if row else 0 for f in ('entry_count', 'total_amount', 'executed_amount'))
+            for row in (exp, got)
+        ]
+        if values[0] != values[1]:
+            drift.append({'key': k, 'expected': values[0], 'stored': values[1]})
+    return drift
+
+
+def rollup_queryset(year, round_no, org_ids=None):
+    """Rollup rows of one round, optionally limited to organization ids."""
+    from .models import BudgetRollup
+
+    qs = BudgetRollup.objects.filter(year=year, supplemental_round=round_no, entry_count__gt=0)
+    if org_ids is not None:
+        qs = qs.filter(organization_id__in=org_ids)
+    return qs
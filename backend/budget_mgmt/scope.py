@@ -0,0 +1,36 @@
+"""
+Memoized organization scope resolution for permission checks.
+
+The allowed organization ids of a non-admin user depend only on the user's
+profile (role, organization, team) and on the organization hierarchy. The
+resolved set is kept on the user object for the rest of the request and in
+the shared cache under (user id, profile fields, hierarchy generation). The
+generation (see orgtree.py and treecache.py) is bumped whenever the
+organization hierarchy changes, in every worker even with a per-process
+cache, so cached scopes never outlive a hierarchy change; profile changes
+produce a different key.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .orgtree import hierarchy_generation
+
+_MEMO_ATTR = '_org_scope_memo'
+
+
+def cached_org_scope(user, profile, compute):
+    """
+    Return ``compute(profile)`` (a set of organization ids) memoized on the
+    user object and in the shared cache. Returns a copy callers may modify.
+    """
+    memo = user.__dict__.get(_MEMO_ATTR)
+    fingerprint = (profile.role, profile.organization_id, profile.team_id)
+    if memo is None or memo[0] != fingerprint:
+        key = 'org-scope:{}:{}:{}:{}:{}'.format(hierarchy_generation(), user.pk, *fingerprint)
+        scope = cache.get(key)
+        if scope is None:
+            scope = frozenset(compute(profile))
+            cache.set(key, scope, settings.ORG_SCOPE_CACHE_TIMEOUT)
+        memo = (fingerprint, scope)
+        user.__dict__[_MEMO_ATTR] = memo
+    return set(memo[1])
@@ -3,8 +3,9 @@ from .models import (
     Organization, BudgetSubject, BudgetEntry, BudgetDetail,
     BudgetTransfer, ApprovalLog, Notification, UserProfile,
     SpendingLimitRule, BudgetExecution, BudgetVersion, EntrustedProject,
-    SubmissionComment, SupportingDocument,
+    SubmissionComment, SupportingDocument, Job,
 )
+from .annotations import ensure_comment_status, unresolved_types
 
 class SupportingDocumentSerializer(serializers.ModelSerializer):
     author_display = serializers.SerializerMethodField(read_only=True)
@@ -34,8 +35,6 @@ class SupportingDocumentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['author', 'created_at', 'file_size', 'filename']
 
-from datetime import datetime
-
 class OrganizationSerializer(serializers.ModelSerializer):
     parent_name = serializers.CharField(source='parent.name', read_only=True)
     class Meta:
@@ -195,6 +194,49 @@ class BudgetDetailSerializer(serializers.ModelSerializer):
                     raise serializers.ValidationError('지역/날씨 정보와 함께 입력되는 출처명/URL은 비워둘 수 없습니다.')
         return attrs
 
+class BudgetEntrySummarySerializer(serializers.ModelSerializer):
+    """목록(?view=summary)용 경량 직렬화: 산출내역을 싣지 않고 SQL로 계산한 집계 값만 사용."""
+    subject_name = serializers.CharField(source='subject.name', read_only=True)
+    subject_code = serializers.CharField(source='subject.code', read_only=True)
+    organization_name = serializers.CharField(source='organization.name', read_only=True)
+    entrusted_project_name = serializers.CharField(source='entrusted_project.name', read_only=True, default=None)
+    original_amount = serializers.IntegerField(source='last_year_amount', read_only=True)
+    variance_amount = serializers.SerializerMethodField(read_only=True)
+    detail_count = serializers.IntegerField(read_only=True)
+    comment_count = serializers.IntegerField(read_only=True)
+    latest_comment_type = serializers.CharField(read_only=True, allow_null=True)
+    unresolved_types = serializers.SerializerMethodField(read_only=True)
+    submitted_by = serializers.CharField(source='submitted_by.username', read_only=True, default=None)
+    submitted_by_display = serializers.SerializerMethodField(read_only=True)
+    latest_action_by = serializers.CharField(source='latest_action_by.username', read_only=True, default=None)
+    latest_action_by_display = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = BudgetEntry
+        fields = [
+            'id', 'subject', 'subject_name', 'subject_code', 'organization', 'organization_name',
+            'entrusted_project', 'entrusted_project_name', 'year', 'supplemental_round', 'status',
+            'budget_category', 'carryover_type', 'last_year_amount', 'original_amount',
+            'total_amount', 'executed_amount', 'remaining_amount', 'variance_amount',
+            'detail_count', 'comment_count', 'latest_comment_type', 'unresolved_types',
+            'submitted_at', 'submitted_by', 'submitted_by_display',
+            'latest_action_at', 'latest_action_by', 'latest_action_by_display',
+        ]
+        read_only_fields = fields
+
+    def get_variance_amount(self, obj):
+        return int(obj.total_amount or 0) - int(obj.last_year_amount or 0)
+
+    def get_unresolved_types(self, obj):
+        return unresolved_types(obj)
+
+    def get_submitted_by_display(self, obj):
+        return BudgetEntrySerializer._actor_display(obj.submitted_by)
+
+    def get_latest_action_by_display(self, obj):
+        return BudgetEntrySerializer._actor_display(obj.latest_action_by)
+
+
 class BudgetEntrySerializer(serializers.ModelSerializer):
     details = BudgetDetailSerializer(many=True, read_only=True)
     subject_name = serializers.CharField(source='subject.name', read_only=True)
@@ -235,134 +277,42 @@ class BudgetEntrySerializer(serializers.ModelSerializer):
         display = str(actor.first_name or '').strip()
         return display or actor.username
 
-    def _entry_log_meta(self, obj):
-        cache = getattr(self, '_entry_log_meta_cache', None)
-        if cache is None:
-            cache = {}
-            setattr(self, '_entry_log_meta_cache', cache)
-        if obj.pk in cache:
-            return cache[obj.pk]
-
-        prefetched = getattr(obj, '_prefetched_objects_cache', {}) or {}
-        logs = prefetched.get('approval_logs')
-        if logs is None:
-            logs = list(obj.approval_logs.select_related('actor').all())
-        else:
-            logs = list(logs)
-
-        if logs:
-            logs_desc = sorted(logs, key=lambda log: log.created_at or datetime.min, reverse=True)
-            logs_asc = list(reversed(logs_desc))
-            latest_log = logs_desc[0]
-            submit_candidates = [log for log in logs_desc if log.to_status == 'PENDING']
-            submit_log = submit_candidates[0] if submit_candidates else None
-            if submit_log is None:
-                transition_candidates = [
-                    log for log in logs_asc
-                    if (log.from_status == 'DRAFT' and log.to_status != 'DRAFT') or log.to_status == 'PENDING'
-                ]
-                submit_log = transition_candidates[0] if transition_candidates else logs_asc[0]
-        else:
-            latest_log = None
-            submit_log = None
-
-        details_rel = getattr(obj, 'details', None)
-        detail_count = len(details_rel.all()) if hasattr(details_rel, 'all') else 0
-
-        meta = {
-            'latest_log': latest_log,
-            'submit_log': submit_log,
-            'detail_count': detail_count,
-        }
-        cache[obj.pk] = meta
-        return meta
-
     def get_detail_count(self, obj):
-        return self._entry_log_meta(obj)['detail_count']
+        details_rel = getattr(obj, 'details', None)
+        return len(details_rel.all()) if hasattr(details_rel, 'all') else 0
 
     def get_comment_count(self, obj):
-        prefetched = getattr(obj, '_prefetched_objects_cache', {}) or {}
-        comments = prefetched.get('comments')
-        if comments is None:
-            return obj.comments.filter(is_deleted=False).count()
-        return sum(1 for c in comments if not c.is_deleted)
+        return ensure_comment_status(obj).comment_count
 
     def get_latest_comment_type(self, obj):
         """최신 top-level 의견의 타입 → 목의 현재 상태 머릿말."""
-        prefetched = getattr(obj, '_prefetched_objects_cache', {}) or {}
-        comments = prefetched.get('comments')
-        if comments is None:
-            latest = obj.comments.filter(is_deleted=False, parent__isnull=True).order_by('-created_at').first()
-            return latest.comment_type if latest else None
-        top_level = [c for c in comments if not c.is_deleted and c.parent_id is None]
-        if not top_level:
-            return None
-        latest = max(top_level, key=lambda c: c.created_at)
-        return latest.comment_type
+        return ensure_comment_status(obj).latest_comment_type
 
     def get_unresolved_types(self, obj):
         """미해소 의견 유형 목록 반환.
         - REQUEST 이후 DONE/ANSWER가 없으면 'REQUEST' 포함
         - QUESTION 이후 ANSWER/DONE이 없으면 'QUESTION' 포함
+        (annotations.comment_status_annotations 의 Exists 조건으로 계산)
         """
-        prefetched = getattr(obj, '_prefetched_objects_cache', {}) or {}
-        comments_qs = prefetched.get('comments')
-        
-        if comments_qs is None:
-            comments = list(obj.comments.filter(
-                is_deleted=False,
-                version__year=obj.year,
-                version__round=obj.supplemental_round
-            ))
-        else:
-            comments = [c for c in comments_qs if not c.is_deleted]
-            
-        comments.sort(key=lambda c: c.created_at, reverse=True)
-        top_level = [c for c in comments if c.parent_id is None]
-        
-        result = []
-        _resolve = {'DONE', 'ANSWER'}
-        
-        for check_type, resolvers in (('REQUEST', _resolve), ('QUESTION', _resolve)):
-            for comment in top_level:
-                ct = comment.comment_type
-                if ct == check_type:
-                    # 이 REQUEST/QUESTION의 답글로 해소되었는지 검사
-                    specific_resolver = 'DONE' if check_type == 'REQUEST' else 'ANSWER'
-                    has_reply = any(c.parent_id == comment.id and c.comment_type == specific_resolver for c in comments)
-                    
-                    if not has_reply:
-                        # 해소되지 않은 최신 코멘트 발견
-                        result.append(check_type)
-                        break
-                elif ct in resolvers:
-                    # 최상위에 해소 의견이 먼저 등장 → 미해소 아님 (이전 모든 항목 해소)
-                    break
-        return result
+        return unresolved_types(ensure_comment_status(obj))
 
     def get_submitted_at(self, obj):
-        submit_log = self._entry_log_meta(obj)['submit_log']
-        return submit_log.created_at if submit_log else None
+        return obj.submitted_at
 
     def get_submitted_by(self, obj):
-        submit_log = self._entry_log_meta(obj)['submit_log']
-        return submit_log.actor.username if submit_log and submit_log.actor else None
+        return obj.submitted_by.username if obj.submitted_by else None
 
     def get_submitted_by_display(self, obj):
-        submit_log = self._entry_log_meta(obj)['submit_log']
-        return self._actor_display(submit_log.actor) if submit_log else None
+        return self._actor_display(obj.submitted_by)
 
     def get_latest_action_at(self, obj):
-        latest_log = self._entry_log_meta(obj)['latest_log']
-        return latest_log.created_at if latest_log else None
+        return obj.latest_action_at
 
     def get_latest_action_by(self, obj):
-        latest_log = self._entry_log_meta(obj)['latest_log']
-        return latest_log.actor.username if latest_log and latest_log.actor else None
+        return obj.latest_action_by.username if obj.latest_action_by else None
 
     def get_latest_action_by_display(self, obj):
-        latest_log = self._entry_log_meta(obj)['latest_log']
-        return self._actor_display(latest_log.actor) if latest_log else None
+        return self._actor_display(obj.latest_action_by)
 
     def get_variance_amount(self, obj):
         total_amount = int(getattr(obj, 'total_amount', 0) or 0)
@@ -413,6 +363,10 @@ class BudgetExecutionSerializer(serializers.ModelSerializer):
 class ApprovalLogSerializer(serializers.ModelSerializer):
     actor_name = serializers.CharField(source='actor.username', read_only=True)
     actor_display = serializers.SerializerMethodField(read_only=True)
+    archived = serializers.SerializerMethodField(read_only=True)
+
+    def get_archived(self, obj):
+        return bool(getattr(obj, 'archived', False))
 
     def get_actor_display(self, obj):
         actor = getattr(obj, 'actor', None)
@@ -437,6 +391,23 @@ class NotificationSerializer(serializers.ModelSerializer):
         model = Notification
         fields = '__all__'
 
+class JobSerializer(serializers.ModelSerializer):
+    artifact_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'kind', 'status', 'progress', 'message', 'cancel_requested', 'result',
+            'artifact_name', 'artifact_content_type', 'artifact_url', 'attempts',
+            'created_by', 'created_at', 'updated_at', 'started_at', 'finished_at',
+        ]
+        read_only_fields = fields
+
+    def get_artifact_url(self, obj):
+        if not obj.artifact:
+            return None
+        return f'/api/jobs/{obj.pk}/artifact/'
+
 class SpendingLimitRuleSerializer(serializers.ModelSerializer):
     class Meta:
         model = SpendingLimitRule
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Callable
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+
+from ..models import BudgetDetail, BudgetEntry, BudgetSubject, BudgetVersion, EntrustedProject
+from ..orgtree import get_org_tree
+from ..subjecttree import get_subject_tree
+from .budget_book_export import _resolve_template_path, write_budget_book
+from .budget_book_template import template_checksum
+
+logger = logging.getLogger(__name__)
+
+# Bump when the exporter's output changes so stale files stop matching.
+EXPORT_FORMAT_VERSION = 1
+
+_build_locks_guard = threading.Lock()
+_build_locks: dict[str, threading.Lock] = {}
+
+
+@dataclass
+class CachedBudgetBook:
+    key: str
+    path: Path
+    file_name: str
+    disposition: str
+    meta: dict[str, Any]
+    hit: bool
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.key}"'
+
+    def open(self) -> BinaryIO:
+        return self.path.open("rb")
+
+
+def _rows_digest(rows) -> str:
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(repr(tuple(row)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def version_fingerprint(version: BudgetVersion) -> dict[str, Any]:
+    """Everything the budget book reads from the database, in a handful of aggregate queries."""
+    entries = BudgetEntry.objects.filter(year=version.year, supplemental_round=version.round)
+    entry_groups = list(
+        entries.order_by()
+        .values("status", "budget_category", "carryover_type")
+        .annotate(
+            count=Count("id"),
+            max_id=Max("id"),
+            total=Sum("total_amount"),
+            last_year=Sum("last_year_amount"),
+            latest_action_at=Max("latest_action_at"),
+        )
+        .order_by("status", "budget_category", "carryover_type")
+    )
+    # Rows are placed by (subject, organization, project): moving an entry keeps the totals above.
+    placements = (
+        entries.order_by()
+        .values("subject_id", "organization_id", "entrusted_project_id")
+        .annotate(count=Count("id"), total=Sum("total_amount"), last_year=Sum("last_year_amount"))
+        .order_by("subject_id", "organization_id", "entrusted_project_id")
+        .values_list("subject_id", "organization_id", "entrusted_project_id", "count", "total", "last_year")
+    )
+    projects = (
+        EntrustedProject.objects.filter(id__in=entries.order_by().values("entrusted_project_id"))
+        .order_by("id")
+        .values_list("id", "name")
+    )
+    # Descriptions are not part of the subject tree index.
+    descriptions = BudgetSubject.objects.exclude(description="").order_by("id").values_list("id", "description")
+    details = BudgetDetail.objects.filter(
+        entry__year=version.year, entry__supplemental_round=version.round,
+    ).aggregate(count=Count("id"), max_id=Max("id"), updated_at=Max("updated_at"), amount=Sum("amount"))
+    return {
+        "version": [version.pk, version.year, version.round, version.status],
+        "entries": entry_groups,
+        "placements": _rows_digest(placements),
+        "projects": _rows_digest(projects),
+        "details": details,
+        "subjects": get_subject_tree().digest(),
+        "subject_descriptions": _rows_digest(descriptions),
+        "organizations": get_org_tree().digest(),
+    }
+
+
+def budget_book_cache_key(version: BudgetVersion, template_path: Path | None = None) -> str:
+    template_path = template_path or _resolve_template_path()
+    payload = json.dumps(
+        {
+            "format": EXPORT_FORMAT_VERSION,
+            "data": version_fingerprint(version),
+            "template": template_checksum(template_path),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:40]
+
+
+def cache_dir() -> Path:
+    return Path(settings.BUDGET_BOOK_CACHE_DIR)
+
+
+def _write_atomic(path: Path, write: Callable[[BinaryIO], Any]) -> Any:
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            result = write(fh)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return result
+
+
+def _load(key: str) -> CachedBudgetBook | None:
+    directory = cache_dir()
+    file_path = directory / f"{key}.xlsx"
+    meta_path = directory / f"{key}.json"
+    try:
+        stored = json.loads(meta_path.read_text(encoding="utf-8"))
+        os.utime(file_path)  # LRU: eviction drops the least recently served files first
+        os.utime(meta_path)
+    except (OSError, ValueError):
+        return None
+    return CachedBudgetBook(
+        key=key,
+        path=file_path,
+        file_name=stored["file_name"],
+        disposition=stored["disposition"],
+        meta=stored["meta"],
+        hit=True,
+    )
+
+
+def evict_budget_book_cache(max_bytes: int | None = None, keep: str = "") -> int:
+    """Drop least recently used cached books until the directory fits. Returns files removed."""
+    max_bytes = settings.BUDGET_BOOK_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    directory = cache_dir()
+    books = []
+    total = 0
+    for file_path in directory.glob("*.xlsx"):
+        meta_path = file_path.with_suffix(".json")
+        try:
+            stat = file_path.stat()
+            size = stat.st_size + (meta_path.stat().st_size if meta_path.exists() else 0)
+        except OSError:
+            continue
+        books.append((stat.st_mtime, file_path.stem, size))
+        total += size
+
+    removed = 0
+    for _mtime, key, size in sorted(books):
+        if total <= max_bytes:
+            break
+        if key == keep:
+            continue
+        (directory / f"{key}.xlsx").unlink(missing_ok=True)
+        (directory / f"{key}.json").unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def _build_lock(key: str) -> threading.Lock:
+    with _build_locks_guard:
+        return _build_locks.setdefault(key, threading.Lock())
+
+
+def get_budget_book(version: BudgetVersion, key: str | None = None) -> CachedBudgetBook:
+    """
+    The version's budget book from the on-disk cache, built (once per key and
+    process) on a miss. The key covers the version's data fingerprint and the
+    template checksum, so any change to either produces a new file.
+    """
+    key = key or budget_book_cache_key(version)
+    cached = _load(key)
+    if cached is not None:
+        return cached
+
+    with _build_lock(key):
+        cached = _load(key)
+        if cached is not None:
+            return cached
+        directory = cache_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        file_name, disposition, meta = _write_atomic(
+            directory / f"{key}.xlsx", lambda fh: write_budget_book(version, fh),
+        )
+        stored = json.dumps({"file_name": file_name, "disposition": disposition, "meta": meta}, default=str)
+        _write_atomic(directory / f"{key}.json", lambda fh: fh.write(stored.encode("utf-8")))
+    with _build_locks_guard:
+        _build_locks.pop(key, None)
+    try:
+        evict_budget_book_cache(keep=key)
+    except OSError:
+        logger.warning("budget book cache eviction failed", exc_info=True)
+    return CachedBudgetBook(
+        key=key,
+        path=directory / f"{key}.xlsx",
+        file_name=file_name,
+        disposition=disposition,
+        meta=meta,
+        hit=False,
+    )
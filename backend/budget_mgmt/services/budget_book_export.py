@@ -2,21 +2,34 @@ from __future__ import annotations
 
 from collections import defaultdict
 from dataclasses import dataclass
-from io import BytesIO
 from pathlib import Path
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
 import re
 import logging
+import shutil
+import tempfile
+import zipfile
 from typing import Any, Iterable
 from urllib.parse import quote
 
 from django.conf import settings
+from django.db.models import Count
 
-from openpyxl import Workbook, load_workbook
-from openpyxl.cell.cell import MergedCell
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE, MergedCell
+from openpyxl.utils import get_column_letter
 
-from ..models import BudgetEntry, BudgetVersion, Organization
+from ..models import BudgetEntry, BudgetVersion
+from ..orgtree import get_org_tree
+from ..subjecttree import get_subject_tree
+from ..totals import detail_amount_sum
+from .budget_book_template import template_cache
 
 XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+SHEET_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_STREAM_BATCH_ROWS = 500
 
 _DEFAULT_TEMPLATE_NAMES = (
     "2026\ub144 \ubcf8\uc608\uc0b0\uc11c.xlsx",
@@ -84,8 +97,7 @@ def _resolve_template_path() -> Path | None:
 def _open_workbook() -> tuple[Workbook, Path | None]:
     template_path = _resolve_template_path()
     if template_path is not None:
-        wb = load_workbook(template_path)
-        return wb, template_path
+        return template_cache.workbook(template_path), template_path
     return Workbook(), None
 
 
@@ -107,46 +119,20 @@ def _to_thousand_won(amount: int) -> int:
 def _subject_path(subject) -> tuple[str, str, str, str]:
     if subject is None:
         return "", "", "", ""
-
-    by_level = {}
-    cursor = subject
-    guard = 0
-    while cursor is not None and guard < 8:
-        level = int(getattr(cursor, "level", 0) or 0)
-        if level not in by_level and level > 0:
-            by_level[level] = _safe_str(getattr(cursor, "name", ""))
-        cursor = getattr(cursor, "parent", None)
-        guard += 1
-
-    jang = by_level.get(1, "")
-    gwan = by_level.get(2, "")
-    hang = by_level.get(3, "")
-    mok = by_level.get(4, "")
-    return jang, gwan, hang, mok
+    return tuple(_safe_str(name) for name in get_subject_tree().path(subject.id))
 
 
 def _root_department_name(org) -> str:
     if org is None:
         return ""
-    cursor = org
-    guard = 0
-    while getattr(cursor, "parent", None) is not None and guard < 8:
-        cursor = cursor.parent
-        guard += 1
-    return _safe_str(getattr(cursor, "name", ""))
+    return _safe_str(get_org_tree().root_name(org.id) or getattr(org, "name", ""))
 
 
-def _entry_amount(entry, detail_items) -> int:
+def _entry_amount(entry) -> int:
     total_amount = int(getattr(entry, "total_amount", 0) or 0)
     if total_amount:
         return total_amount
-    detail_total = 0
-    for item in detail_items:
-        try:
-            detail_total += int(item.total_price or 0)
-        except Exception:
-            continue
-    return detail_total
+    return int(getattr(entry, "detail_total", 0) or 0)
 
 
 def _collect_entry_rows(version: BudgetVersion) -> list[_EntryRow]:
@@ -155,20 +141,15 @@ def _collect_entry_rows(version: BudgetVersion) -> list[_EntryRow]:
         .filter(year=version.year, supplemental_round=version.round)
         .select_related(
             "subject",
-            "subject__parent",
-            "subject__parent__parent",
-            "subject__parent__parent__parent",
             "organization",
-            "organization__parent",
             "entrusted_project",
         )
-        .prefetch_related("details")
+        .annotate(detail_count=Count("details"), detail_total=detail_amount_sum("details__"))
         .order_by("subject__subject_type", "subject__code", "organization__id", "id")
     )
 
     rows: list[_EntryRow] = []
     for entry in queryset:
-        details = list(entry.details.all())
         subject = entry.subject
         jang, gwan, hang, mok = _subject_path(subject)
         subject_name = _safe_str(getattr(subject, "name", ""))
@@ -185,9 +166,9 @@ def _collect_entry_rows(version: BudgetVersion) -> list[_EntryRow]:
             department_name=_root_department_name(entry.organization),
             organization_name=_safe_str(getattr(entry.organization, "name", "")),
             project_name=_safe_str(getattr(entry.entrusted_project, "name", "")),
-            current_amount=_entry_amount(entry, details),
+            current_amount=_entry_amount(entry),
             previous_amount=int(getattr(entry, "last_year_amount", 0) or 0),
-            detail_count=len(details),
+            detail_count=entry.detail_count,
             status=_safe_str(getattr(entry, "status", "")),
             budget_category=_safe_str(getattr(entry, "budget_category", "")),
             carryover_type=_safe_str(getattr(entry, "carryover_type", "")),
@@ -213,11 +194,16 @@ def _base_amount_header(version: BudgetVersion) -> str:
     return "\uc804\ub144\ub3c4\uc608\uc0b0\uc561(\uc6d0)"
 
 
-def _write_seed_sheet(wb: Workbook, version: BudgetVersion, rows: list[_EntryRow]) -> None:
-    ws = _get_or_create_sheet(wb, _SHEET_SEED)
-    _clear_sheet(ws)
+@dataclass
+class _StreamedSheet:
+    """A data-heavy sheet written as raw row XML instead of openpyxl cells."""
+    title: str
+    headers: list[str]
+    rows: Iterable[list]
+    row_count: int
+
 
-    base_header = _base_amount_header(version)
+def _seed_sheet(version: BudgetVersion, rows: list[_EntryRow]) -> _StreamedSheet:
     headers = [
         "\uc5f0\ub3c4",
         "\ud68c\ucc28",
@@ -233,41 +219,41 @@ def _write_seed_sheet(wb: Workbook, version: BudgetVersion, rows: list[_EntryRow
         "\uc870\uc9c1",
         "\uacfc\uc81c\uba85",
         "\ud604\uc7ac\uc608\uc0b0\uc561(\uc6d0)",
-        base_header,
+        _base_amount_header(version),
         "\uc99d\uac10\uc561(\uc6d0)",
         "\uc0b0\ucd9c\ub0b4\uc5ed\uc218",
         "\uc0c1\ud0dc",
         "\uc608\uc0b0\uad6c\ubd84",
         "\uc774\uc6d4\uad6c\ubd84",
     ]
-    ws.append(headers)
 
-    for row in rows:
-        diff = int(row.current_amount or 0) - int(row.previous_amount or 0)
-        ws.append([
-            version.year,
-            version.round,
-            row.subject_type,
-            row.jang,
-            row.gwan,
-            row.hang,
-            row.mok,
-            row.subject_code,
-            row.subject_name,
-            row.description,
-            row.department_name,
-            row.organization_name,
-            row.project_name,
-            int(row.current_amount or 0),
-            int(row.previous_amount or 0),
-            diff,
-            int(row.detail_count or 0),
-            row.status,
-            row.budget_category,
-            row.carryover_type,
-        ])
-
-    ws.freeze_panes = "A2"
+    def data():
+        for row in rows:
+            diff = int(row.current_amount or 0) - int(row.previous_amount or 0)
+            yield [
+                version.year,
+                version.round,
+                row.subject_type,
+                row.jang,
+                row.gwan,
+                row.hang,
+                row.mok,
+                row.subject_code,
+                row.subject_name,
+                row.description,
+                row.department_name,
+                row.organization_name,
+                row.project_name,
+                int(row.current_amount or 0),
+                int(row.previous_amount or 0),
+                diff,
+                int(row.detail_count or 0),
+                row.status,
+                row.budget_category,
+                row.carryover_type,
+            ]
+
+    return _StreamedSheet(_SHEET_SEED, headers, data(), len(rows))
 
 
 def _aggregate_rows(rows: Iterable[_EntryRow], subject_type: str):
@@ -291,13 +277,9 @@ def _aggregate_rows(rows: Iterable[_EntryRow], subject_type: str):
     return sorted(bucket.items(), key=lambda kv: kv[0])
 
 
-def _write_summary_sheet(wb: Workbook, version: BudgetVersion, rows: list[_EntryRow], subject_type: str) -> None:
+def _summary_sheet(version: BudgetVersion, rows: list[_EntryRow], subject_type: str) -> _StreamedSheet:
     title = _SHEET_INCOME_SUMMARY if subject_type == "income" else _SHEET_EXPENSE_SUMMARY
-    ws = _get_or_create_sheet(wb, title)
-    _clear_sheet(ws)
-
-    base_header = _base_amount_header(version)
-    ws.append([
+    headers = [
         "\uad6c\ubd84",
         "\uc7a5",
         "\uad00",
@@ -305,63 +287,124 @@ def _write_summary_sheet(wb: Workbook, version: BudgetVersion, rows: list[_Entry
         "\ubaa9",
         "\ubd80\uc11c",
         "\ud604\uc7ac\uc608\uc0b0\uc561(\uc6d0)",
-        base_header,
+        _base_amount_header(version),
         "\uc99d\uac10\uc561(\uc6d0)",
         "\uac74\uc218",
         "\uc0b0\ucd9c\ub0b4\uc5ed\uc218",
-    ])
-
+    ]
     agg = _aggregate_rows(rows, subject_type)
-    current_sum = 0
-    previous_sum = 0
-    count_sum = 0
-    detail_sum = 0
     type_label = "\uc218\uc785" if subject_type == "income" else "\uc9c0\ucd9c"
 
-    for key, values in agg:
-        jang, gwan, hang, mok, dept = key
-        current = int(values["current"] or 0)
-        previous = int(values["previous"] or 0)
-        diff = current - previous
-        entry_count = int(values["entry_count"] or 0)
-        detail_count = int(values["detail_count"] or 0)
-        ws.append([type_label, jang, gwan, hang, mok, dept, current, previous, diff, entry_count, detail_count])
-        current_sum += current
-        previous_sum += previous
-        count_sum += entry_count
-        detail_sum += detail_count
-
-    if not agg:
-        ws.append([
-            type_label,
+    def data():
+        current_sum = 0
+        previous_sum = 0
+        count_sum = 0
+        detail_sum = 0
+        for key, values in agg:
+            jang, gwan, hang, mok, dept = key
+            current = int(values["current"] or 0)
+            previous = int(values["previous"] or 0)
+            diff = current - previous
+            entry_count = int(values["entry_count"] or 0)
+            detail_count = int(values["detail_count"] or 0)
+            yield [type_label, jang, gwan, hang, mok, dept, current, previous, diff, entry_count, detail_count]
+            current_sum += current
+            previous_sum += previous
+            count_sum += entry_count
+            detail_sum += detail_count
+
+        if not agg:
+            yield [type_label, "", "", "", "", "", 0, 0, 0, 0, 0]
+
+        yield [
+            "\ud569\uacc4",
             "",
             "",
             "",
             "",
             "",
-            0,
-            0,
-            0,
-            0,
-            0,
-        ])
+            current_sum,
+            previous_sum,
+            current_sum - previous_sum,
+            count_sum,
+            detail_sum,
+        ]
 
-    ws.append([
-        "\ud569\uacc4",
-        "",
-        "",
-        "",
-        "",
-        "",
-        current_sum,
-        previous_sum,
-        current_sum - previous_sum,
-        count_sum,
-        detail_sum,
-    ])
+    return _StreamedSheet(title, headers, data(), max(len(agg), 1) + 1)
+
+
+def _prepare_streamed_sheet(wb: Workbook, sheet: _StreamedSheet) -> None:
+    # Only the header row goes through openpyxl; data rows are spliced in on save.
+    ws = _get_or_create_sheet(wb, sheet.title)
+    _clear_sheet(ws)
+    ws.append(sheet.headers)
     ws.freeze_panes = "A2"
 
 
+def _xml_text(value) -> str:
+    return escape(ILLEGAL_CHARACTERS_RE.sub("", str(value)))
+
+
+def _row_xml(row_number: int, values: list) -> str:
+    cells = []
+    for column, value in enumerate(values, start=1):
+        if value is None or value == "":
+            continue
+        ref = f"{get_column_letter(column)}{row_number}"
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+        else:
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{_xml_text(value)}</t></is></c>')
+    return f'<row r="{row_number}">{"".join(cells)}</row>'
+
+
+def _sheet_parts(archive: zipfile.ZipFile) -> dict[str, str]:
+    """Sheet title -> worksheet part name, from workbook.xml and its relationships."""
+    workbook_xml = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    rels_xml = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels_xml}
+    parts = {}
+    for sheet in workbook_xml.iter(f"{{{SHEET_MAIN_NS}}}sheet"):
+        target = targets.get(sheet.get(f"{{{REL_NS}}}id")) or ""
+        parts[sheet.get("name")] = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+    return parts
+
+
+def _write_streamed_sheet(template_xml: str, sheet: _StreamedSheet, out) -> None:
+    last_ref = f"{get_column_letter(max(len(sheet.headers), 1))}{sheet.row_count + 1}"
+    template_xml = re.sub(r'<dimension ref="[^"]*"\s*/>', f'<dimension ref="A1:{last_ref}"/>', template_xml, count=1)
+    if "</sheetData>" in template_xml:
+        head, tail = template_xml.split("</sheetData>", 1)
+    else:
+        head, tail = re.split(r"<sheetData\s*/>", template_xml, maxsplit=1)
+        head += "<sheetData>"
+    out.write(head.encode("utf-8"))
+    batch = []
+    for offset, values in enumerate(sheet.rows):
+        batch.append(_row_xml(offset + 2, values))
+        if len(batch) >= _STREAM_BATCH_ROWS:
+            out.write("".join(batch).encode("utf-8"))
+            batch = []
+    out.write(("".join(batch) + "</sheetData>" + tail).encode("utf-8"))
+
+
+def _splice_streamed_sheets(base, destination, streamed: list[_StreamedSheet]) -> None:
+    """Copy the saved workbook into ``destination``, filling the streamed sheets' rows."""
+    with zipfile.ZipFile(base) as source, zipfile.ZipFile(destination, "w", zipfile.ZIP_DEFLATED) as target:
+        parts = _sheet_parts(source)
+        by_part = {parts[sheet.title]: sheet for sheet in streamed}
+        for info in source.infolist():
+            sheet = by_part.get(info.filename)
+            part_info = zipfile.ZipInfo(info.filename, info.date_time)
+            part_info.compress_type = zipfile.ZIP_DEFLATED
+            with target.open(part_info, "w") as out:
+                if sheet is None:
+                    with source.open(info) as part:
+                        shutil.copyfileobj(part, out)
+                else:
+                    _write_streamed_sheet(source.read(info).decode("utf-8"), sheet, out)
+
+
 def _write_deferred_sheet(wb: Workbook, version: BudgetVersion, row_count: int) -> None:
     ws = _get_or_create_sheet(wb, _SHEET_DEFERRED)
     _clear_sheet(ws)
@@ -540,8 +583,9 @@ def _set_cell_ref(ws, ref: str, value, *, preserve_formula: bool = True) -> int:
 def _top_level_organization_names() -> list[str]:
     names: list[str] = []
     seen: set[str] = set()
-    for raw in Organization.objects.filter(parent__isnull=True).order_by("sort_order", "id").values_list("name", flat=True):
-        name = _safe_str(raw)
+    tree = get_org_tree()
+    for org_id in tree.children(None):
+        name = _safe_str(tree.get(org_id).name)
         key = _normalize_key(name)
         if not key or key in seen:
             continue
@@ -891,7 +935,14 @@ def _build_content_disposition(file_name: str) -> str:
     return f"attachment; filename={ascii_name}; filename*=UTF-8''{encoded}"
 
 
-def build_budget_book_file(version: BudgetVersion):
+def write_budget_book(version: BudgetVersion, destination) -> tuple[str, str, dict[str, Any]]:
+    """
+    Write the budget book to ``destination`` (a path or a writable binary
+    file). The template part is saved to a temporary file and the seed and
+    summary sheets are streamed row by row into the final archive, so the
+    workbook never holds the data rows as openpyxl cells or as one byte string.
+    Returns (file name, Content-Disposition, meta).
+    """
     workbook, template_path = _open_workbook()
     rows = _collect_entry_rows(version)
 
@@ -900,24 +951,27 @@ def build_budget_book_file(version: BudgetVersion):
         item for item in template_overrides
         if (not item.get("applied")) or str(item.get("reason")) not in ("ok", "no_root_organizations")
     ]
-    _write_seed_sheet(workbook, version, rows)
-    _write_summary_sheet(workbook, version, rows, "income")
-    _write_summary_sheet(workbook, version, rows, "expense")
+    streamed = [
+        _seed_sheet(version, rows),
+        _summary_sheet(version, rows, "income"),
+        _summary_sheet(version, rows, "expense"),
+    ]
+    for sheet in streamed:
+        _prepare_streamed_sheet(workbook, sheet)
     _write_deferred_sheet(workbook, version, len(rows))
     _write_asset_sample_sheet(workbook, version)
     _write_labor_sample_sheet(workbook, version)
 
-    file_name = _build_file_name(version)
-    disposition = _build_content_disposition(file_name)
-
-    buffer = BytesIO()
-    workbook.save(buffer)
-    workbook.close()
+    with tempfile.TemporaryFile() as base:
+        workbook.save(base)
+        workbook.close()
+        base.seek(0)
+        _splice_streamed_sheets(base, destination, streamed)
 
+    file_name = _build_file_name(version)
     return (
-        buffer.getvalue(),
         file_name,
-        disposition,
+        _build_content_disposition(file_name),
         {
             "template_path": str(template_path) if template_path else "",
             "row_count": len(rows),
@@ -926,3 +980,10 @@ def build_budget_book_file(version: BudgetVersion):
             "template_warnings": template_warnings,
         },
     )
+
+
+def build_budget_book_file(version: BudgetVersion):
+    with tempfile.TemporaryFile() as output:
+        file_name, disposition, meta = write_budget_book(version, output)
+        output.seek(0)
+        return output.read(), file_name, disposition, meta
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import pickle
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from openpyxl import Workbook, load_workbook
+
+logger = logging.getLogger(__name__)
+
+_checksum_lock = threading.Lock()
+_template_checksums: dict[tuple, str] = {}
+
+
+def _stamp(path: Path) -> tuple:
+    stat = path.stat()
+    return (str(path), stat.st_mtime_ns, stat.st_size)
+
+
+def template_checksum(path: Path | None) -> str:
+    """SHA-256 of the template file, recomputed only when its mtime or size changes."""
+    if path is None:
+        return ""
+    stamp = _stamp(path)
+    with _checksum_lock:
+        checksum = _template_checksums.get(stamp)
+    if checksum is None:
+        digest = hashlib.sha256()
+        with path.open("rb") as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                digest.update(chunk)
+        checksum = digest.hexdigest()
+        with _checksum_lock:
+            _template_checksums[stamp] = checksum
+    return checksum
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    stamp: tuple
+    checksum: str
+    blob: bytes | None  # None: the workbook could not be pickled, parse per use
+
+
+class TemplateCache:
+    """
+    Parses the budget book template once per process and hands out
+    independent working copies unpickled from an in-memory snapshot, which
+    skips the XML parse. A changed mtime/size re-checks the checksum and only
+    re-parses when the content differs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: _Snapshot | None = None
+
+    def _current(self, path: Path) -> _Snapshot:
+        stamp = _stamp(path)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.stamp == stamp:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.stamp == stamp:
+                return snapshot
+            checksum = template_checksum(path)
+            if snapshot is not None and snapshot.checksum == checksum:
+                snapshot = _Snapshot(stamp, checksum, snapshot.blob)  # touched, not changed
+            else:
+                snapshot = _Snapshot(stamp, checksum, self._parse(path))
+            self._snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def _parse(path: Path) -> bytes | None:
+        workbook = load_workbook(path)
+        try:
+            return pickle.dumps(workbook, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:  # noqa: BLE001
+            logger.warning("budget book template is not picklable, parsing per export: %s", path, exc_info=True)
+            return None
+        finally:
+            workbook.close()
+
+    def workbook(self, path: Path) -> Workbook:
+        """A fresh, independently editable copy of the template at ``path``."""
+        if not getattr(settings, "BUDGET_BOOK_TEMPLATE_CACHE", True):
+            return load_workbook(path)
+        snapshot = self._current(path)
+        if snapshot.blob is None:
+            return load_workbook(path)
+        return pickle.loads(snapshot.blob)
+
+    def warm(self, path: Path | None) -> bool:
+        if path is None or not path.exists():
+            return False
+        self._current(path)
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshot = None
+
+
+template_cache = TemplateCache()
+
+
+def warm_template_cache() -> bool:
+    """Parse the configured template now (startup hook) so the first export skips it."""
+    from .budget_book_export import _resolve_template_path
+
+    try:
+        return template_cache.warm(_resolve_template_path())
+    except Exception:  # noqa: BLE001
+        logger.warning("budget book template warm-up failed", exc_info=True)
+        return False
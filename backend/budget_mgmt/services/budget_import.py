@@ -0,0 +1,363 @@
+from __future__ import annotations
+
+import csv
+import json
+import re
+from typing import Any, Iterator
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Max
+from django.utils import timezone
+
+from budget_mgmt.jobs import enqueue_job, job_handler
+from budget_mgmt.models import (
+    BudgetDetail,
+    BudgetEntry,
+    BudgetSubject,
+    EntrustedProject,
+    Organization,
+)
+from budget_mgmt.totals import deferred_totals, mark_entries_dirty
+
+MAX_RECORDED_ERRORS = 200
+MAX_CHUNK_SIZE = 5000
+# Job.result of a budget_import job: counters plus the resume checkpoint, saved with every chunk.
+# processed_bytes is the byte offset to resume from; replace mode only replaces details with
+# ids up to replace_before_detail_id (the last detail id when the job first started).
+CHECKPOINT_FIELDS = (
+    "processed_bytes", "rows_processed", "rows_imported", "rows_skipped", "entries_created", "columns", "errors",
+    "replace_before_detail_id",
+)
+
+
+class ImportRun:
+    """One run of a ``budget_import`` job: upload settings from Job.params, checkpoint from Job.result."""
+
+    def __init__(self, job, ctx):
+        params = job.params
+        state = job.result or {}
+        self.ctx = ctx
+        self.year = params["year"]
+        self.supplemental_round = params.get("round", 0)
+        self.file_format = params["file_format"]
+        self.mode = params.get("mode", "replace")
+        self.file = params["file"]
+        self.chunk_size = params.get("chunk_size")
+        self.total_bytes = params.get("total_bytes", 0)
+        self.scope_org_ids = params.get("scope_org_ids")
+        self.processed_bytes = state.get("processed_bytes", 0)
+        self.rows_processed = state.get("rows_processed", 0)
+        self.rows_imported = state.get("rows_imported", 0)
+        self.rows_skipped = state.get("rows_skipped", 0)
+        self.entries_created = state.get("entries_created", 0)
+        self.columns = state.get("columns")
+        self.errors = list(state.get("errors") or [])
+        self.replace_before_detail_id = state.get("replace_before_detail_id")
+
+    def state(self) -> dict:
+        return {field: getattr(self, field) for field in CHECKPOINT_FIELDS}
+
+    def checkpoint(self) -> None:
+        """Save the checkpoint (inside a chunk's transaction, it commits with the chunk)."""
+        percent = min(self.processed_bytes / self.total_bytes, 1.0) * 100 if self.total_bytes else 0
+        self.ctx.progress(percent, f"{self.rows_processed} rows", state=self.state())
+
+# export_macro_input_data column -> import field. English keys are accepted as-is.
+FIELD_BY_COLUMN = {
+    "No.": "row_no",
+    "부서명": "org_name",
+    "팀명": "team_name",
+    "장": "project_name",
+    "관": "gwan",
+    "항": "hang",
+    "목": "mok",
+    "산출내역1": "name",
+    "산출내역2(재원)": "source",
+    "단가": "price",
+    "단가단위": "currency_unit",
+    "수량": "qty",
+    "수량단위": "unit",
+    "회차": "freq",
+    "회차단위": "freq_unit",
+    "금액": "amount",
+    "금액단위": "amount_unit",
+}
+
+_NAME_PREFIX_RE = re.compile(r"^\[[^\]]*\]\s*")
+
+
+def _safe_str(value: Any) -> str:
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def _normalize_record(raw: dict) -> dict:
+    record = {}
+    for key, value in raw.items():
+        key = _safe_str(key).lstrip("﻿")
+        record[FIELD_BY_COLUMN.get(key, key)] = value
+    return record
+
+
+def _csv_fields(line: str) -> list[str]:
+    return next(csv.reader([line]), [])
+
+
+def iter_records(run: ImportRun, fh) -> Iterator[tuple[int, dict | None, str]]:
+    """
+    Yield (end_offset, record, error) from the upload starting at the
+    checkpoint. Lines are read one at a time from a binary handle so the byte
+    offset after each record can be stored as a resumable checkpoint.
+    """
+    offset = int(run.processed_bytes or 0)
+    fh.seek(offset)
+
+    if run.file_format == "csv" and offset == 0:
+        header = fh.readline()
+        offset += len(header)
+        run.columns = [_safe_str(col).lstrip("﻿") for col in _csv_fields(header.decode("utf-8-sig"))]
+        run.processed_bytes = offset
+        run.checkpoint()
+
+    pending = b""
+    for raw_line in iter(fh.readline, b""):
+        offset += len(raw_line)
+        pending += raw_line
+        text = pending.decode("utf-8", errors="replace")
+        if run.file_format == "csv" and text.count('"') % 2 == 1:
+            continue  # quoted field spans lines
+        pending = b""
+        text = text.strip("\r\n")
+        if not text.strip():
+            yield offset, None, ""
+            continue
+        if run.file_format == "ndjson":
+            try:
+                raw = json.loads(text)
+            except ValueError:
+                yield offset, None, "invalid_json"
+                continue
+            if not isinstance(raw, dict):
+                yield offset, None, "invalid_row"
+                continue
+            yield offset, _normalize_record(raw), ""
+        else:
+            values = _csv_fields(text)
+            yield offset, _normalize_record(dict(zip(run.columns or [], values))), ""
+    if pending.strip():
+        yield offset, None, "unterminated_row"
+
+
+class _Resolver:
+    """Master data lookups cached for the duration of one run (bounded by master data size)."""
+
+    def __init__(self, year: int):
+        self.year = year
+        orgs = list(Organization.objects.values("id", "code", "name", "org_type", "parent_id"))
+        self.org_by_code = {o["code"]: o["id"] for o in orgs}
+        self.org_by_name: dict[str, int] = {}
+        for o in sorted(orgs, key=lambda o: (o["org_type"] != "dept", o["parent_id"] is not None)):
+            self.org_by_name.setdefault(o["name"], o["id"])
+        self.team_by_parent = {(o["parent_id"], o["name"]): o["id"] for o in orgs if o["parent_id"]}
+
+        subjects = {s["id"]: s for s in BudgetSubject.objects.values("id", "code", "name", "level", "parent_id")}
+        self.subject_by_code = {s["code"]: s["id"] for s in subjects.values() if s["level"] == 4}
+        self.subject_by_path: dict[tuple[str, str, str], int] = {}
+        self.subjects_by_name: dict[str, list[int]] = {}
+        for s in subjects.values():
+            if s["level"] != 4:
+                continue
+            names = {4: s["name"]}
+            parent = subjects.get(s["parent_id"])
+            while parent is not None:
+                names[parent["level"]] = parent["name"]
+                parent = subjects.get(parent["parent_id"])
+            self.subject_by_path[(names.get(2, ""), names.get(3, ""), s["name"])] = s["id"]
+            self.subjects_by_name.setdefault(s["name"], []).append(s["id"])
+        self.project_cache: dict[tuple[int, str], int | None] = {}
+
+    def organization(self, record: dict) -> int | None:
+        code = _safe_str(record.get("org_code"))
+        if code:
+            return self.org_by_code.get(code)
+        org_id = self.org_by_name.get(_safe_str(record.get("org_name")))
+        team_name = _safe_str(record.get("team_name"))
+        if org_id and team_name:
+            return self.team_by_parent.get((org_id, team_name))
+        return org_id
+
+    def subject(self, record: dict) -> int | None:
+        code = _safe_str(record.get("subject_code"))
+        if code:
+            return self.subject_by_code.get(code)
+        mok = _safe_str(record.get("mok"))
+        found = self.subject_by_path.get((_safe_str(record.get("gwan")), _safe_str(record.get("hang")), mok))
+        if found:
+            return found
+        candidates = self.subjects_by_name.get(mok, [])
+        return candidates[0] if len(candidates) == 1 else None
+
+    def project(self, org_id: int, name: str) -> int | None:
+        key = (org_id, name)
+        if key not in self.project_cache:
+            self.project_cache[key] = (
+                EntrustedProject.objects.filter(organization_id=org_id, year=self.year, name=name)
+                .values_list("id", flat=True)
+                .first()
+            )
+        return self.project_cache[key]
+
+
+def _detail_values(record: dict) -> dict | None:
+    try:
+        price = int(float(record.get("price") or 0))
+        qty = float(record.get("qty") if record.get("qty") not in (None, "") else 1)
+        freq = int(float(record.get("freq") if record.get("freq") not in (None, "") else 1))
+    except (TypeError, ValueError):
+        return None
+    if price < 0 or qty < 0:
+        return None
+    name = _NAME_PREFIX_RE.sub("", _safe_str(record.get("name"))) or "Imported Item"
+    return {
+        "name": name[:200],
+        "price": price,
+        "qty": qty,
+        "freq": max(freq, 1),
+        "currency_unit": (_safe_str(record.get("currency_unit")) or "원")[:20],
+        "unit": (_safe_str(record.get("unit")) or "식")[:20],
+        "freq_unit": (_safe_str(record.get("freq_unit")) or "회")[:20],
+        "source": (_safe_str(record.get("source")) or "SELF")[:50],
+    }
+
+
+def _record_error(run: ImportRun, line_no: int, reason: str) -> None:
+    run.rows_skipped += 1
+    if len(run.errors) < MAX_RECORDED_ERRORS:
+        run.errors.append({"line": line_no, "reason": reason})
+
+
+def _import_chunk(run: ImportRun, resolver: _Resolver, chunk: list, end_offset: int) -> None:
+    scope = set(run.scope_org_ids) if run.scope_org_ids is not None else None
+    first_line = run.rows_processed + (2 if run.file_format == "csv" else 1)
+    parsed = []
+    for index, (record, error) in enumerate(chunk):
+        line_no = first_line + index
+        if error:
+            _record_error(run, line_no, error)
+            continue
+        if record is None:
+            continue
+        org_id = resolver.organization(record)
+        subject_id = resolver.subject(record)
+        if org_id is None:
+            _record_error(run, line_no, "unknown_org")
+            continue
+        if subject_id is None:
+            _record_error(run, line_no, "unknown_subject")
+            continue
+        if scope is not None and org_id not in scope:
+            _record_error(run, line_no, "out_of_scope")
+            continue
+        project_id = None
+        project_name = _safe_str(record.get("project_name"))
+        if project_name:
+            project_id = resolver.project(org_id, project_name)
+            if project_id is None:
+                _record_error(run, line_no, "unknown_project")
+                continue
+        values = _detail_values(record)
+        if values is None:
+            _record_error(run, line_no, "invalid_number")
+            continue
+        values["sort_order"] = line_no
+        parsed.append(((subject_id, org_id, project_id), values))
+
+    with deferred_totals():
+        entry_ids = {}
+        keys = {key for key, _ in parsed}
+        if keys:
+            existing = BudgetEntry.objects.filter(
+                year=run.year,
+                supplemental_round=run.supplemental_round,
+                subject_id__in={k[0] for k in keys},
+                organization_id__in={k[1] for k in keys},
+            ).values_list("subject_id", "organization_id", "entrusted_project_id", "id")
+            for subject_id, org_id, project_id, entry_id in existing:
+                if (subject_id, org_id, project_id) in keys:
+                    entry_ids[(subject_id, org_id, project_id)] = entry_id
+            missing = [key for key in keys if key not in entry_ids]
+            created = BudgetEntry.objects.bulk_create([
+                BudgetEntry(
+                    year=run.year,
+                    supplemental_round=run.supplemental_round,
+                    subject_id=subject_id,
+                    organization_id=org_id,
+                    entrusted_project_id=project_id,
+                    status="DRAFT",
+                )
+                for subject_id, org_id, project_id in missing
+            ])
+            for entry in created:
+                entry_ids[(entry.subject_id, entry.organization_id, entry.entrusted_project_id)] = entry.pk
+            run.entries_created += len(created)
+
+        touched = set(entry_ids.values())
+        if run.mode == "replace" and touched and run.replace_before_detail_id:
+            # Details created by this job have larger ids, so earlier chunks' rows survive.
+            BudgetDetail.objects.filter(entry_id__in=touched, id__lte=run.replace_before_detail_id).delete()
+
+        BudgetDetail.objects.bulk_create(
+            [BudgetDetail(entry_id=entry_ids[key], **values) for key, values in parsed],
+            batch_size=1000,
+        )
+        mark_entries_dirty(touched)
+
+        run.rows_imported += len(parsed)
+        run.rows_processed += len(chunk)
+        run.processed_bytes = end_offset
+        run.checkpoint()
+
+
+def store_upload(filename: str, content) -> tuple[str, int]:
+    """Save an upload under MEDIA_ROOT/imports/. Returns (storage name, size)."""
+    name = default_storage.generate_filename(timezone.now().strftime("imports/%Y/%m/") + filename)
+    name = default_storage.save(name, content)
+    return name, default_storage.size(name)
+
+
+def start_import_job(*, user, file: str, filename: str, total_bytes: int, **params):
+    """
+    Queue a ``budget_import`` job for a stored upload (run inline when
+    BUDGET_JOBS_ASYNC is off). ``params``: year, round, file_format, mode,
+    chunk_size, scope_org_ids (None: unrestricted). Returns the Job.
+    """
+    return enqueue_job("budget_import", {
+        **params, "file": file, "filename": filename, "total_bytes": total_bytes,
+    }, user=user)
+
+
+@job_handler("budget_import", resumable=True)
+def run_import_job(job, ctx):
+    """Import the upload from its last checkpoint in chunks, each committed together with the checkpoint."""
+    run = ImportRun(job, ctx)
+    if run.mode == "replace" and run.replace_before_detail_id is None:
+        run.replace_before_detail_id = BudgetDetail.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+        run.checkpoint()
+
+    chunk_size = max(1, min(int(run.chunk_size or settings.BUDGET_IMPORT_CHUNK_SIZE), MAX_CHUNK_SIZE))
+    resolver = _Resolver(run.year)
+    with default_storage.open(run.file, "rb") as fh:
+        chunk: list = []
+        end_offset = run.processed_bytes
+        for end_offset, record, error in iter_records(run, fh):
+            chunk.append((record, error))
+            if len(chunk) >= chunk_size:
+                _import_chunk(run, resolver, chunk, end_offset)
+                chunk = []
+        if chunk:
+            _import_chunk(run, resolver, chunk, end_offset)
+
+    run.processed_bytes = run.total_bytes or run.processed_bytes
+    return run.state()
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import random
+import string
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from budget_mgmt.models import BudgetDetail, BudgetEntry, EntrustedProject
+from budget_mgmt.totals import mark_entries_dirty
+
+# Detail columns copied into a cloned project (amount formula only, no history).
+CLONED_DETAIL_FIELDS = (
+    "name", "price", "qty", "freq", "currency_unit", "unit", "freq_unit",
+    "sort_order", "sub_label", "source", "organization_id",
+)
+
+
+@dataclass
+class ProjectClonePlan:
+    source: EntrustedProject
+    organization_id: int
+    year: int
+    name: str
+
+
+def _new_code() -> str:
+    ts = hex(int(time.time() * 1000))[2:].upper()
+    rand = "".join(random.choices(string.ascii_uppercase + string.digits, k=5))
+    return f"EP_{ts}_{rand}"
+
+
+def generate_project_codes(count: int) -> list[str]:
+    """Unused project codes (one existence query per collision round)."""
+    codes: set[str] = set()
+    while len(codes) < count:
+        candidates = {_new_code() for _ in range(count - len(codes))} - codes
+        taken = set(EntrustedProject.objects.filter(code__in=candidates).values_list("code", flat=True))
+        codes |= candidates - taken
+    return sorted(codes)
+
+
+def clone_projects(plans: list[ProjectClonePlan], *, copy_entries: bool = True, chunk_size: int | None = None) -> list[EntrustedProject]:
+    """
+    Create the planned projects and, optionally, copy their entries and
+    details with bulk inserts. Cloned entries are marked dirty, so run this
+    inside ``deferred_totals()`` for a single totals recompute at the end.
+    """
+    if not plans:
+        return []
+    codes = generate_project_codes(len(plans))
+    projects = [
+        EntrustedProject(
+            organization_id=plan.organization_id,
+            year=plan.year,
+            code=code,
+            name=plan.name,
+            status="PLANNED",
+            source_project=plan.source,
+        )
+        for plan, code in zip(plans, codes)
+    ]
+    EntrustedProject.objects.bulk_create(projects)
+    if not copy_entries:
+        return projects
+
+    target_by_source = {plan.source.pk: (plan, project) for plan, project in zip(plans, projects)}
+    source_entries = BudgetEntry.objects.filter(entrusted_project_id__in=target_by_source).order_by("pk")
+    chunk_size = max(1, int(chunk_size or settings.BUDGET_CLONE_CHUNK_SIZE))
+    last_id = 0
+    while True:
+        entries = list(source_entries.filter(pk__gt=last_id)[:chunk_size])
+        if not entries:
+            break
+        last_id = entries[-1].pk
+        new_entries = []
+        for entry in entries:
+            plan, project = target_by_source[entry.entrusted_project_id]
+            new_entries.append(BudgetEntry(
+                subject_id=entry.subject_id,
+                organization_id=plan.organization_id,
+                entrusted_project=project,
+                year=plan.year,
+                status="DRAFT",
+                last_year_amount=entry.total_amount,  # keep source amount as last-year baseline
+                budget_category="ORIGINAL",
+                supplemental_round=0,
+                carryover_type="NONE",
+            ))
+        BudgetEntry.objects.bulk_create(new_entries)
+        new_id_by_source = {entry.pk: new.pk for entry, new in zip(entries, new_entries)}
+
+        BudgetDetail.objects.bulk_create([
+            BudgetDetail(
+                entry_id=new_id_by_source[detail.entry_id],
+                **{field: getattr(detail, field) for field in CLONED_DETAIL_FIELDS},
+            )
+            for detail in BudgetDetail.objects.filter(entry_id__in=new_id_by_source).order_by("entry_id", "id")
+        ])
+        mark_entries_dirty(new_id_by_source.values())
+    return projects
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+from typing import Callable
+
+from django.conf import settings
+from django.db import transaction
+
+from budget_mgmt.jobs import enqueue_job, job_handler
+from budget_mgmt.models import BudgetDetail, BudgetEntry, BudgetVersion, EntrustedProject
+from budget_mgmt.rollups import mark_rollup_buckets
+from budget_mgmt.totals import detail_amount_sum
+
+MAX_CHUNK_SIZE = 5000
+
+# Detail columns copied verbatim into the cloned version.
+CLONED_DETAIL_FIELDS = (
+    "name", "price", "qty", "freq", "currency_unit", "unit", "freq_unit", "sub_label", "sort_order",
+    "source", "is_rate", "organization_id", "region_context", "weather_context",
+    "evidence_source_name", "evidence_source_url", "evidence_as_of",
+)
+
+
+def detail_snapshot(detail: BudgetDetail) -> dict:
+    return {
+        "detail_id": detail.id,
+        "entry_id": detail.entry_id,
+        "name": detail.name,
+        "price": detail.price,
+        "qty": detail.qty,
+        "freq": detail.freq,
+        "currency_unit": detail.currency_unit,
+        "unit": detail.unit,
+        "freq_unit": detail.freq_unit,
+        "source": detail.source,
+        "sub_label": detail.sub_label,
+        "sort_order": detail.sort_order,
+        "is_rate": detail.is_rate,
+        "organization": detail.organization_id,
+        "total_price": detail.total_price,
+    }
+
+
+def _plain(source_entries):
+    return source_entries.select_related(None).prefetch_related(None).order_by()
+
+
+def resolve_project_mapping(source_entries, target_year: int) -> dict[int, int]:
+    """
+    Map source entrusted project ids from other years to target-year projects:
+    an existing project with the same (organization, code), else the same
+    (organization, name), else a new PLANNED project. Three queries in total.
+    """
+    source_ids = (
+        _plain(source_entries)
+        .filter(entrusted_project__isnull=False)
+        .exclude(entrusted_project__year=target_year)
+        .values_list("entrusted_project_id", flat=True)
+        .distinct()
+    )
+    sources = list(EntrustedProject.objects.filter(id__in=source_ids).order_by("id"))
+    if not sources:
+        return {}
+
+    by_code: dict[tuple, EntrustedProject] = {}
+    by_name: dict[tuple, EntrustedProject] = {}
+    existing = EntrustedProject.objects.filter(
+        year=target_year, organization_id__in={p.organization_id for p in sources},
+    ).order_by("id")
+    for project in existing:
+        by_code.setdefault((project.organization_id, project.code), project)
+        by_name.setdefault((project.organization_id, project.name), project)
+
+    mapping: dict[int, EntrustedProject] = {}
+    to_create: list[EntrustedProject] = []
+    for src in sources:
+        target = by_code.get((src.organization_id, src.code)) or by_name.get((src.organization_id, src.name))
+        if target is None:
+            target = EntrustedProject(
+                organization_id=src.organization_id,
+                year=target_year,
+                code=src.code,
+                name=src.name,
+                status="PLANNED",
+                source_project=src,
+            )
+            to_create.append(target)
+            by_code[(src.organization_id, src.code)] = target
+            by_name.setdefault((src.organization_id, src.name), target)
+        mapping[src.id] = target
+    if to_create:
+        EntrustedProject.objects.bulk_create(to_create)
+    return {src_id: project.pk for src_id, project in mapping.items()}
+
+
+def _clone_chunk(entries: list, target_version, budget_category: str, project_mapping: dict[int, int]) -> int:
+    new_entries = []
+    for src in entries:
+        amount = int(src.total_amount or 0) or int(src.detail_total or 0)
+        new_entries.append(BudgetEntry(
+            subject_id=src.subject_id,
+            organization_id=src.organization_id,
+            entrusted_project_id=project_mapping.get(src.entrusted_project_id, src.entrusted_project_id),
+            year=target_version.year,
+            supplemental_round=target_version.round,
+            status="DRAFT",
+            last_year_amount=amount,
+            budget_category=budget_category,
+            carryover_type=src.carryover_type,
+            total_amount=amount,
+            executed_amount=0,
+            remaining_amount=amount,
+        ))
+    BudgetEntry.objects.bulk_create(new_entries)
+    new_id_by_source = {src.id: new.pk for src, new in zip(entries, new_entries)}
+
+    details = [
+        BudgetDetail(
+            entry_id=new_id_by_source[detail.entry_id],
+            transfer_source_detail_id=detail.id,
+            before_snapshot=detail_snapshot(detail),
+            **{field: getattr(detail, field) for field in CLONED_DETAIL_FIELDS},
+        )
+        for detail in BudgetDetail.objects.filter(entry_id__in=new_id_by_source).order_by("entry_id", "id")
+    ]
+    BudgetDetail.objects.bulk_create(details)
+    return len(details)
+
+
+def clone_entries_into_version(
+    source_entries,
+    target_version,
+    *,
+    budget_category: str,
+    chunk_size: int | None = None,
+    after_id: int = 0,
+    on_chunk: Callable[[int, int, int], None] | None = None,
+) -> tuple[int, int]:
+    """
+    Clone source entries (and their details, with before-snapshots) into the
+    target version. Entries are read in primary-key order and bulk-created per
+    chunk; ``on_chunk(last_source_id, entries, details)`` runs inside each
+    chunk's transaction. Returns (entries cloned, details cloned).
+    """
+    chunk_size = max(1, min(int(chunk_size or settings.BUDGET_CLONE_CHUNK_SIZE), MAX_CHUNK_SIZE))
+    project_mapping = resolve_project_mapping(source_entries, target_version.year)
+    source = _plain(source_entries).annotate(detail_total=detail_amount_sum("details__")).order_by("pk")
+
+    created_entries = 0
+    created_details = 0
+    org_ids: set[int] = set()
+    last_id = after_id
+    while True:
+        entries = list(source.filter(pk__gt=last_id)[:chunk_size])
+        if not entries:
+            break
+        last_id = entries[-1].pk
+        with transaction.atomic():
+            detail_count = _clone_chunk(entries, target_version, budget_category, project_mapping)
+            if on_chunk is not None:
+                on_chunk(last_id, len(entries), detail_count)
+        created_entries += len(entries)
+        created_details += detail_count
+        org_ids.update(src.organization_id for src in entries)
+
+    # bulk_create skips the entry post_save receivers
+    mark_rollup_buckets({(target_version.year, target_version.round, org_id) for org_id in org_ids})
+    return created_entries, created_details
+
+
+def clone_source_queryset(source_year: int, source_round: int, source_status: str = ""):
+    qs = BudgetEntry.objects.filter(year=source_year, supplemental_round=source_round)
+    if source_status:
+        qs = qs.filter(status=source_status)
+    return qs
+
+
+@job_handler("version_clone", resumable=True)
+def run_clone_job(job, ctx):
+    """
+    Clone ``params`` (target_version_id, source_year, source_round,
+    source_status, budget_category, chunk_size) into the target version. The
+    counters and ``last_source_entry_id`` are the job result, checkpointed with
+    each chunk, so a resumed job continues after its last committed chunk.
+    """
+    params = job.params
+    state = {"total_entries": 0, "entries_cloned": 0, "details_cloned": 0, "last_source_entry_id": 0}
+    state.update(job.result or {})
+    target_version = BudgetVersion.objects.get(pk=params["target_version_id"])
+    source = clone_source_queryset(params["source_year"], params["source_round"], params.get("source_status") or "")
+    state["total_entries"] = source.count()
+
+    def report(last_source_id: int, entries: int, details: int) -> None:
+        state["last_source_entry_id"] = last_source_id
+        state["entries_cloned"] += entries
+        state["details_cloned"] += details
+        percent = min(state["entries_cloned"] / state["total_entries"], 1.0) * 100 if state["total_entries"] else 0
+        ctx.progress(percent, f"{state['entries_cloned']}/{state['total_entries']} entries", state=state)
+
+    clone_entries_into_version(
+        source,
+        target_version,
+        budget_category=params["budget_category"],
+        chunk_size=params.get("chunk_size"),
+        after_id=state["last_source_entry_id"],
+        on_chunk=report,
+    )
+    return state
+
+
+def start_clone_job(
+    target_version,
+    *,
+    source_year: int,
+    source_round: int,
+    source_status: str = "",
+    budget_category: str,
+    chunk_size: int | None = None,
+    user=None,
+):
+    """Queue the clone as a ``version_clone`` job (run inline when BUDGET_JOBS_ASYNC is off). Returns the Job."""
+    return enqueue_job("version_clone", {
+        "target_version_id": target_version.pk,
+        "source_year": source_year,
+        "source_round": source_round,
+        "source_status": source_status,
+        "budget_category": budget_category,
+        "chunk_size": chunk_size or settings.BUDGET_CLONE_CHUNK_SIZE,
+    }, user=user)
@@ -0,0 +1,135 @@
+"""
+Budget subject (chart of accounts) hierarchy index.
+
+``get_subject_tree()`` returns a process-wide ``SubjectTree`` built from one
+query over BudgetSubject, with each subject's 장/관/항/목 path, ancestors and
+descendant leaf ids precomputed, so exports and reports need no
+``subject__parent__parent__parent`` joins.
+
+BudgetSubject saves that change a tree field (TREE_FIELDS) and deletes
+invalidate the tree through model signals; bulk_update_tree and reorder
+invalidate explicitly (see treecache.py). Per-row loops (restore_defaults,
+replace_budget_subjects_from_json) run inside ``batched_invalidation()`` so
+the tree is invalidated once at the end instead of once per subject.
+
+The cached tree serves read paths only. Integrity checks before writes use
+``subtree_ids_from_db``, which sees subjects other workers added since the
+cached tree was built.
+"""
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.db import router
+
+from .treecache import ForestIndex, ProcessTreeCache
+
+SUBJECT_LEVELS = (1, 2, 3, 4)  # 장, 관, 항, 목
+# BudgetSubject columns the index is built from; other edits leave it valid.
+TREE_FIELDS = ('parent_id', 'code', 'name', 'level', 'subject_type', 'sort_order')
+
+_batch = threading.local()
+
+
+@dataclass(frozen=True)
+class SubjectNode:
+    id: int
+    code: str
+    name: str
+    level: int
+    subject_type: str
+    parent_id: int | None
+    sort_order: int
+
+
+class SubjectTree(ForestIndex):
+    def __init__(self, rows):
+        super().__init__(
+            SubjectNode(
+                row['id'], row['code'] or '', row['name'] or '', int(row['level'] or 0),
+                row['subject_type'] or '', row['parent_id'], row['sort_order'],
+            )
+            for row in rows
+        )
+        self._paths = {}
+        self._leaves = {}
+        for subject_id in self.nodes:
+            by_level = {}
+            for node_id in (subject_id,) + self.ancestors(subject_id):
+                node = self.nodes[node_id]
+                by_level.setdefault(node.level, node.name)
+            self._paths[subject_id] = tuple(by_level.get(level, '') for level in SUBJECT_LEVELS)
+            self._leaves[subject_id] = frozenset(
+                node_id for node_id in self.subtree(subject_id) if not self.children(node_id)
+            )
+
+    def path(self, subject_id):
+        """(jang, gwan, hang, mok) names; levels missing above the subject are ''."""
+        return self._paths.get(subject_id, ('', '', '', ''))
+
+    def levels(self, subject_id):
+        return dict(zip(SUBJECT_LEVELS, self.path(subject_id)))
+
+    def leaf_ids(self, subject_id):
+        """Descendant ids without children (the subject itself when it is a leaf)."""
+        return self._leaves.get(subject_id, frozenset())
+
+
+def load_subject_tree(using=None):
+    from .models import BudgetSubject
+
+    rows = BudgetSubject.objects.using(using or router.db_for_read(BudgetSubject)).values(
+        'id', 'code', 'name', 'level', 'subject_type', 'parent_id', 'sort_order',
+    ).order_by()
+    return SubjectTree(rows)
+
+
+def subtree_ids_from_db(subject_id, using=None):
+    """The subject id and all of its descendant ids, queried level by level (not from the cached tree)."""
+    from .models import BudgetSubject
+
+    subjects = BudgetSubject.objects.using(using or router.db_for_read(BudgetSubject))
+    ids = {subject_id}
+    frontier = [subject_id]
+    while frontier:
+        frontier = [
+            child_id for child_id in subjects.filter(parent_id__in=frontier).values_list('id', flat=True)
+            if child_id not in ids  # parent cycles end the walk
+        ]
+        ids.update(frontier)
+    return ids
+
+
+_tree_cache = ProcessTreeCache('subject-tree', load_subject_tree, 'SUBJECT_TREE_MAX_AGE')
+
+
+def get_subject_tree():
+    return _tree_cache.get()
+
+
+def invalidate_subject_tree(using=None):
+    _tree_cache.invalidate(using)
+
+
+@contextmanager
+def batched_invalidation(using=None):
+    """Collapse the subject saves/deletes inside the block into one invalidation at its end."""
+    if getattr(_batch, 'changed', None) is not None:
+        yield
+        return
+    _batch.changed = False
+    try:
+        yield
+    finally:
+        changed = _batch.changed
+        _batch.changed = None
+        if changed:
+            invalidate_subject_tree(using)
+
+
+def subject_tree_changed(using=None):
+    """Signal-side invalidation, deferred while a ``batched_invalidation`` block is open."""
+    if getattr(_batch, 'changed', None) is not None:
+        _batch.changed = True
+    else:
+        invalidate_subject_tree(using)
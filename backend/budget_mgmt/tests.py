@@ -1,18 +1,62 @@
+from django.conf import settings
 from django.test import TestCase
-from django.test.utils import override_settings
+from django.test.utils import override_settings, CaptureQueriesContext
+from django.db import connection
 from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.core.management.base import CommandError
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from django.http import StreamingHttpResponse
+from django.urls import ResolverMatch
 from rest_framework.test import APIClient
 from openpyxl import Workbook, load_workbook
+from datetime import timedelta
 from io import BytesIO, StringIO
 from pathlib import Path
+import csv
 import json
+import os
 import tempfile
-from unittest import mock
+from contextlib import contextmanager
+from unittest import mock, skipUnless
 
 from .calculation import parse_calc_expression
-from .models import UserProfile, Organization, BudgetSubject, BudgetEntry, BudgetDetail, BudgetVersion, EntrustedProject, ApprovalLog
-from .services.budget_book_export import build_budget_book_file
+from .models import AuthToken, UserProfile, Organization, BudgetSubject, BudgetEntry, BudgetDetail, BudgetExecution, BudgetVersion, EntrustedProject, ApprovalLog, ApprovalLogArchive, BudgetRollup, SubmissionComment, OrganizationClosure, Job
+from . import audit_search, treecache
+from .audit import write_audit_log
+from .audit_writer import AuditLogWriter, _encode, fcntl, spool_supported
+from .jobs import claim_next_job, enqueue_job, job_handler, run_job
+from .log_archive import LogFilter, LogHistory, archived_match_count
+from .orgtree import get_org_tree, load_org_tree
+from .subjecttree import get_subject_tree
+from .treecache import ProcessTreeCache
+from . import rollups
+from .rollups import find_rollup_drift, refresh_rollups, rollup_queryset
+from .totals import (
+    deferred_totals,
+    detail_amount_expression,
+    detail_amount_sum,
+    find_amount_drift,
+    find_total_drift,
+    mark_entries_dirty,
+)
+from .services.budget_book_cache import budget_book_cache_key, evict_budget_book_cache
+from .services.budget_book_export import build_budget_book_file, write_budget_book
+from .services.budget_book_template import TemplateCache
+from .views import _scope_org_ids_for_user
+
+
+@contextmanager
+def request_generations():
+    """The per-request generation memo of treecache, without the request_finished connection cleanup."""
+    treecache._start_request_memo()
+    try:
+        yield
+    finally:
+        treecache._end_request_memo()
 
 
 class CalcExpressionParserTest(TestCase):
@@ -286,6 +330,78 @@ class AuthApiTest(TestCase):
         self.assertEqual(mismatch.status_code, 400)
         self.assertEqual(mismatch.data['error'], 'team does not belong to organization')
 
+    def _signup(self, username):
+        response = self.client.post('/api/auth/signup/', {
+            'username': username,
+            'password': 'StrongPass!234',
+            'name': username,
+            'email': f'{username}@example.com',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['token']
+
+    def _get_as(self, token, path):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        return self.client.get(path)
+
+    def test_device_sessions_are_cached_and_revoked_individually(self):
+        phone = self._signup('device_user')
+        login = self.client.post('/api/auth/login/', {
+            'username': 'device_user', 'password': 'StrongPass!234', 'device': 'laptop',
+        }, format='json')
+        self.assertEqual(login.status_code, 200)
+        laptop = login.data['token']
+        self.assertIsNotNone(login.data['expires_at'])
+        self.assertFalse(AuthToken.objects.filter(digest=laptop).exists())  # only the digest is stored
+
+        self.assertEqual(self._get_as(phone, '/api/auth/me/').status_code, 200)
+        with mock.patch('budget_mgmt.authentication._per_process_cache', return_value=False), self.assertNumQueries(0):
+            self.assertEqual(self._get_as(phone, '/api/auth/me/').status_code, 200)
+        with self.assertNumQueries(1):  # LocMemCache: one token/profile check per request
+            self.assertEqual(self._get_as(phone, '/api/auth/me/').status_code, 200)
+
+        sessions = self._get_as(laptop, '/api/auth/sessions/')
+        self.assertEqual(sorted(s['name'] for s in sessions.data), ['', 'laptop'])
+        self.assertEqual([s['name'] for s in sessions.data if s['current']], ['laptop'])
+
+        self.assertEqual(self.client.post('/api/auth/logout/', {}, format='json').status_code, 200)
+        self.assertEqual(self._get_as(laptop, '/api/auth/me/').status_code, 401)
+        self.assertEqual(self._get_as(phone, '/api/auth/me/').status_code, 200)
+
+        AuthToken.objects.filter(user__username='device_user').update(expires_at=timezone.now() - timezone.timedelta(seconds=1))
+        cache.clear()
+        self.assertEqual(self._get_as(phone, '/api/auth/me/').status_code, 401)
+
+    def test_per_process_cache_sees_changes_made_by_other_workers(self):
+        self._signup('worker_admin')  # the first signup becomes ADMIN
+        token = self._signup('worker_user')
+        self.assertEqual(self._get_as(token, '/api/auth/me/').data['profile']['role'], 'STAFF')
+
+        # queryset updates send no signals, like a change committed by another process
+        UserProfile.objects.filter(user__username='worker_user').update(role='MANAGER')
+        self.assertEqual(self._get_as(token, '/api/auth/me/').data['profile']['role'], 'MANAGER')
+        AuthToken.objects.filter(user__username='worker_user').update(revoked_at=timezone.now())
+        self.assertEqual(self._get_as(token, '/api/auth/me/').status_code, 401)
+
+    def test_role_and_password_changes_invalidate_cached_sessions(self):
+        admin = self._signup('cache_admin')
+        user = self._signup('cache_user')
+        self.assertEqual(self._get_as(user, '/api/auth/me/').data['profile']['role'], 'STAFF')
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {admin}')
+        assign = self.client.post('/api/auth/assign-role/', {
+            'user_id': User.objects.get(username='cache_user').id, 'role': 'MANAGER', 'organization': self.dept.id,
+        }, format='json')
+        self.assertEqual(assign.status_code, 200)
+        self.assertEqual(self._get_as(user, '/api/auth/me/').data['profile']['role'], 'MANAGER')
+
+        changed = self.client.post('/api/auth/change-password/', {
+            'current_password': 'StrongPass!234', 'new_password': 'NewStrong!789',
+        }, format='json')
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(self._get_as(user, '/api/auth/me/').status_code, 401)
+        self.assertEqual(self._get_as(changed.data['token'], '/api/auth/me/').status_code, 200)
+
 
 class AuditLogApiTest(TestCase):
     def setUp(self):
@@ -404,6 +520,207 @@ class AuditLogApiTest(TestCase):
             ).exists()
         )
 
+    def test_buffered_audit_logs_are_spooled_and_bulk_inserted(self):
+        user = User.objects.get(username='audit_admin')
+        with tempfile.TemporaryDirectory() as spool_dir, override_settings(
+            AUDIT_LOG_ASYNC=True, AUDIT_LOG_SPOOL_DIR=spool_dir, AUDIT_LOG_MAX_BUFFER=2, AUDIT_LOG_BLOCK_TIMEOUT=0,
+        ):
+            writer = AuditLogWriter(autostart=False)
+            with mock.patch('budget_mgmt.audit_writer.audit_writer', writer):
+                with self.captureOnCommitCallbacks(execute=True):
+                    for index in range(3):
+                        write_audit_log(actor=user, action='EXPORT', resource_type='report', resource_id=index)
+                # the third record found the buffer full and was written through
+                self.assertEqual(ApprovalLog.objects.filter(action='EXPORT').count(), 1)
+                self.assertEqual(len(list(Path(spool_dir).glob('*.open'))), 1)
+
+                self.assertEqual(writer.flush(), 2)
+            self.assertEqual(list(Path(spool_dir).iterdir()), [])
+            logs = ApprovalLog.objects.filter(action='EXPORT')
+            self.assertEqual(sorted(logs.values_list('resource_id', flat=True)), ['0', '1', '2'])
+            self.assertTrue(all(log.actor_id == user.id for log in logs))
+
+    def test_records_are_written_directly_without_a_lockable_spool(self):
+        user = User.objects.get(username='audit_admin')
+        with tempfile.TemporaryDirectory() as spool_dir, override_settings(AUDIT_LOG_ASYNC=True, AUDIT_LOG_SPOOL_DIR=spool_dir):
+            writer = AuditLogWriter(autostart=False)
+            with mock.patch('budget_mgmt.audit_writer.audit_writer', writer), mock.patch('budget_mgmt.audit_writer.fcntl', None):
+                with self.captureOnCommitCallbacks(execute=True):
+                    write_audit_log(actor=user, action='EXPORT', resource_type='report', resource_id='nolock')
+                self.assertEqual(list(Path(spool_dir).iterdir()), [])
+            with mock.patch.dict('sys.modules', {'budget_mgmt.audit_writer': None}):  # import fails
+                with self.captureOnCommitCallbacks(execute=True):
+                    write_audit_log(actor=user, action='EXPORT', resource_type='report', resource_id='noimport')
+        self.assertEqual(
+            sorted(ApprovalLog.objects.filter(action='EXPORT').values_list('resource_id', flat=True)), ['noimport', 'nolock'],
+        )
+
+    @skipUnless(spool_supported(), 'needs fcntl.flock')
+    def test_spool_segments_of_exited_processes_are_replayed(self):
+        record = {
+            'actor_id': User.objects.get(username='audit_admin').id, 'entry_id': None, 'log_type': 'SYSTEM',
+            'action': 'EVENT', 'reason': 'replayed', 'metadata': {}, 'created_at': timezone.now(),
+        }
+        with tempfile.TemporaryDirectory() as spool_dir:
+            # an unlocked segment is dead even when its PID has been reused by a live process
+            Path(spool_dir, f'audit-{os.getpid()}-00000001.open').write_text(_encode(record) * 2, encoding='utf-8')
+            live = Path(spool_dir, f'audit-{os.getpid()}-0a1b2c3d-00000001.open')
+            live.write_text(_encode(record), encoding='utf-8')
+            with live.open(encoding='utf-8') as held:
+                fcntl.flock(held.fileno(), fcntl.LOCK_EX)
+                out = StringIO()
+                call_command('flush_audit_spool', spool_dir=spool_dir, stdout=out)
+                self.assertIn('Replayed 2', out.getvalue())
+                # the locked segment is left to its writer
+                self.assertEqual([p.name for p in Path(spool_dir).iterdir()], [live.name])
+            call_command('flush_audit_spool', spool_dir=spool_dir, stdout=StringIO())
+            self.assertEqual(list(Path(spool_dir).iterdir()), [])
+        self.assertEqual(ApprovalLog.objects.filter(reason='replayed').count(), 3)
+
+    def test_closed_months_are_archived_and_still_listed(self):
+        admin = User.objects.get(username='audit_admin')
+        now = timezone.now()
+        old = timezone.make_aware(timezone.datetime(now.year - 2, 1, 15, 9, 0))
+        older = timezone.make_aware(timezone.datetime(now.year - 3, 1, 15, 9, 0))
+        ApprovalLog.objects.create(actor=admin, log_type='CRUD', action='CREATE', resource_type='widget', created_at=old)
+        ApprovalLog.objects.create(actor=admin, log_type='SYSTEM', action='EVENT', reason='nightly sync', created_at=old + timezone.timedelta(hours=1))
+        ApprovalLog.objects.create(actor=admin, log_type='AUTH', action='LOGIN', created_at=older)
+        org = Organization.objects.create(name='Archive Dept', code='ARC01', org_type='dept')
+        subject = BudgetSubject.objects.create(code='9301', name='Archive Subject', level=4, subject_type='expense')
+        entry = BudgetEntry.objects.create(subject=subject, organization=org, year=now.year - 2, supplemental_round=0)
+        submit = ApprovalLog.objects.create(
+            actor=admin, entry=entry, log_type='WORKFLOW', action='SUBMIT', to_status='PENDING', created_at=old,
+        )
+        hot_before = ApprovalLog.objects.filter(created_at__gte=now - timezone.timedelta(days=1)).count() + 1
+
+        with tempfile.TemporaryDirectory() as archive_dir, override_settings(
+            AUDIT_LOG_ARCHIVE_DIR=archive_dir, AUDIT_LOG_RETENTION_MONTHS={'AUTH': 24, 'WORKFLOW': 12},
+        ):
+            out = StringIO()
+            call_command('archive_audit_logs', hot_months=1, dry_run=True, stdout=out)
+            self.assertIn('Would purge 1 expired log(s)', out.getvalue())
+            self.assertNotIn('WORKFLOW', out.getvalue())
+            out = StringIO()
+            call_command('archive_audit_logs', hot_months=1, stdout=out)
+            self.assertIn('Purged 1 expired log(s)', out.getvalue())
+            self.assertIn('Archived 2 log(s)', out.getvalue())
+            self.assertEqual(ApprovalLog.objects.count(), hot_before)
+            self.assertEqual(
+                sorted(ApprovalLogArchive.objects.values_list('log_type', 'row_count')), [('CRUD', 1), ('SYSTEM', 1)],
+            )
+            self.assertTrue(all((Path(archive_dir) / a.file_name).exists() for a in ApprovalLogArchive.objects.all()))
+            # entry logs are neither archived nor purged (WORKFLOW is past retention) so entry activity can still be rebuilt
+            self.assertTrue(ApprovalLog.objects.filter(pk=submit.pk).exists())
+            call_command('backfill_entry_activity', stdout=StringIO())
+            entry.refresh_from_db()
+            self.assertEqual((entry.submitted_at, entry.submitted_by_id), (old, admin.id))
+
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.admin_token}')
+            res = self.client.get('/api/logs/')
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.data['count'], hot_before + 2)
+            tail = res.data['results'][-2:]
+            self.assertEqual([row['log_type'] for row in tail], ['SYSTEM', 'CRUD'])
+            self.assertTrue(all(row['archived'] for row in tail))
+            self.assertEqual(tail[0]['actor_name'], 'audit_admin')
+
+            res = self.client.get('/api/logs/', {'q': 'nightly'})
+            self.assertEqual([row['reason'] for row in res.data['results']], ['nightly sync'])
+            res = self.client.get('/api/logs/', {'q': 'nightly', 'archived': '0'})
+            self.assertEqual(res.data['count'], 0)
+            res = self.client.get('/api/logs/export/', {'q': 'nightly', 'file_format': 'ndjson'})
+            lines = [json.loads(line) for line in b''.join(res.streaming_content).decode('utf-8').splitlines()]
+            self.assertEqual([(line['reason'], line['actor_username']) for line in lines], [('nightly sync', 'audit_admin')])
+
+            history = LogHistory(ApprovalLog.objects.order_by('-created_at', '-id'), LogFilter({}))
+            self.assertEqual([log.log_type for log in history[hot_before - 1:hot_before + 1]][1:], ['SYSTEM'])
+            self.assertEqual([log.log_type for log in history[hot_before + 1:]], ['CRUD'])
+
+            # scoped and whole-month date filters are counted from the archive summaries
+            def archived_count(params, user_id=admin.id):
+                log_filter = LogFilter(params, allowed_org_ids=[], user_id=user_id)
+                return sum(archived_match_count(archive, log_filter) for archive in log_filter.archives())
+
+            january = {'from_date': f'{now.year - 2}-01-01', 'to_date': f'{now.year - 2}-01-31'}
+            with mock.patch('budget_mgmt.log_archive.read_archive', side_effect=AssertionError('archive file read')):
+                self.assertEqual(archived_count({}), 2)
+                self.assertEqual(archived_count(january), 2)
+                self.assertEqual(archived_count({'log_type': 'SYSTEM'}, user_id=admin.id + 1000), 0)
+            self.assertEqual(archived_count({'from_date': f'{now.year - 2}-01-16'}), 0)
+
+    def test_keyword_and_actor_filters_use_the_search_index(self):
+        worker = User.objects.create_user(username='search_worker', password='x', first_name='홍길동')
+        quarterly = ApprovalLog.objects.create(actor=worker, log_type='SYSTEM', reason='Quarterly Budget Sync', path='/api/sync/')
+        ApprovalLog.objects.create(log_type='CRUD', action='UPDATE', resource_type='details', resource_id='98765')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.admin_token}')
+
+        def ids(**params):
+            res = self.client.get('/api/logs/', params)
+            self.assertEqual(res.status_code, 200)
+            return [row['id'] for row in res.data['results']]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(ids(q='BUDGET s'), [quarterly.id])
+        self.assertTrue(any(audit_search.SEARCH_TABLE in q['sql'] and 'MATCH' in q['sql'] for q in queries.captured_queries))
+        self.assertEqual(len(ids(q='876')), 1)
+        self.assertEqual(ids(q='홍길동'), [quarterly.id])
+        self.assertEqual(ids(q='길동'), [quarterly.id])  # too short for trigrams: scanned
+
+        worker.username = 'renamed_worker'
+        worker.save(update_fields=['username'])
+        self.assertEqual(ids(actor='RENAMED'), [quarterly.id])
+        self.assertEqual(ids(actor='search_worker'), [])
+
+        quarterly.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM {audit_search.SEARCH_TABLE} WHERE {audit_search.SEARCH_TABLE} MATCH %s', ['"quarterly"'],
+            )
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_search_triggers_dropped_by_a_table_rebuild_are_restored_after_migrate(self):
+        with connection.cursor() as cursor:
+            for trigger in audit_search.TRIGGER_NAMES:
+                cursor.execute(f'DROP TRIGGER {trigger}')
+        audit_search._fts_tables.clear()
+        unindexed = ApprovalLog.objects.create(log_type='SYSTEM', reason='Rebuilt table log')
+        self.assertFalse(audit_search.fts_available())
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.admin_token}')
+        self.assertEqual([row['id'] for row in self.client.get('/api/logs/', {'q': 'rebuilt'}).data['results']], [unindexed.id])
+
+        emit_post_migrate_signal(verbosity=0, interactive=False, db=connection.alias)
+        self.assertTrue(audit_search.fts_available())
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get('/api/logs/', {'q': 'rebuilt'})
+        self.assertEqual([row['id'] for row in res.data['results']], [unindexed.id])
+        self.assertTrue(any('MATCH' in q['sql'] for q in queries.captured_queries))
+
+    def test_export_streams_filtered_logs_as_csv_and_ndjson(self):
+        admin = User.objects.get(username='audit_admin')
+        for index in range(3):
+            ApprovalLog.objects.create(
+                actor=admin, log_type='SYSTEM', action='EXPORT', reason=f'감사 export {index}', metadata={'n': index},
+            )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.admin_token}')
+
+        res = self.client.get('/api/logs/export/', {'action': 'EXPORT'})
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.streaming)
+        self.assertIn('attachment;', res['Content-Disposition'])
+        body = b''.join(res.streaming_content).decode('utf-8-sig')
+        rows = list(csv.DictReader(StringIO(body)))
+        self.assertEqual([row['reason'] for row in rows], ['감사 export 2', '감사 export 1', '감사 export 0'])
+        self.assertEqual(rows[0]['actor_username'], 'audit_admin')
+        self.assertEqual(json.loads(rows[0]['metadata']), {'n': 2})
+
+        res = self.client.get('/api/logs/export/', {'action': 'EXPORT', 'q': 'export 1', 'file_format': 'ndjson'})
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lines = [json.loads(line) for line in b''.join(res.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual([(line['reason'], line['metadata']) for line in lines], [('감사 export 1', {'n': 1})])
+
+        res = self.client.get('/api/logs/export/', {'file_format': 'xlsx'})
+        self.assertEqual(res.status_code, 400)
+
 
 class BudgetSubjectBulkUpdateApiTest(TestCase):
     def setUp(self):
@@ -443,6 +760,44 @@ class BudgetSubjectBulkUpdateApiTest(TestCase):
         self.assertEqual(self.root_a.code, original_a)
         self.assertEqual(self.child_a.code, original_child)
 
+    def _authenticate_manager(self):
+        user = User.objects.create_user(username='subject_tree_manager', password='StrongPass!234')
+        UserProfile.objects.create(user=user, role='MANAGER')
+        self.client.force_authenticate(user=user)
+
+    def test_bulk_update_applies_rotation_with_constant_statements(self):
+        self._authenticate_manager()
+        root_c = BudgetSubject.objects.create(code='3000', name='Root C', level=1, subject_type='expense')
+        updates = [
+            {'id': self.root_a.id, 'code': '2000'},
+            {'id': self.root_b.id, 'code': '3000'},
+            {'id': root_c.id, 'code': '1000'},
+            {'id': self.child_a.id, 'code': '1100', 'parent': root_c.id},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/subjects/bulk-update-tree/', {'updates': updates}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated_count'], 4)
+        self.assertEqual(response.data['code_changed_count'], 3)
+        self.assertIn('elapsed_ms', response.data)
+        self.assertEqual(sum('UPDATE "budget_mgmt_budgetsubject"' in q['sql'] for q in ctx.captured_queries), 2)
+        self.assertEqual(
+            dict(BudgetSubject.objects.values_list('id', 'code')),
+            {self.root_a.id: '2000', self.root_b.id: '3000', root_c.id: '1000', self.child_a.id: '1100'},
+        )
+        self.child_a.refresh_from_db()
+        self.assertEqual(self.child_a.parent_id, root_c.id)
+
+    def test_bulk_update_rejects_parent_cycle(self):
+        self._authenticate_manager()
+        response = self.client.post('/api/subjects/bulk-update-tree/', {
+            'updates': [{'id': self.root_a.id, 'parent': self.child_a.id, 'level': 3}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Cycle detected', response.data['error'])
+        self.root_a.refresh_from_db()
+        self.assertIsNone(self.root_a.parent_id)
+
 
 class EntrustedProjectDeleteGuardApiTest(TestCase):
     def setUp(self):
@@ -495,6 +850,68 @@ class EntrustedProjectDeleteGuardApiTest(TestCase):
         self.assertTrue(EntrustedProject.objects.filter(id=project.id).exists())
 
 
+class EntrustedProjectCloneApiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        signup = self.client.post('/api/auth/signup/', {
+            'username': 'project_clone_admin',
+            'password': 'StrongPass!234',
+            'name': 'Project Clone',
+            'email': 'project_clone_admin@example.com',
+        }, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {signup.data['token']}")
+        self.org = Organization.objects.create(name='Clone Dept', code='CD01', org_type='dept')
+        root = BudgetSubject.objects.create(code='7200', name='Clone Root', level=1, subject_type='expense')
+        self.child = BudgetSubject.objects.create(code='7210', name='Clone Child', level=2, parent=root, subject_type='expense')
+
+    def _project_with_details(self, org, name, detail_count):
+        project = EntrustedProject.objects.create(organization=org, year=2026, code=f'EP_{name}', name=name)
+        entry = BudgetEntry.objects.create(
+            subject=self.child, organization=org, entrusted_project=project, year=2026, status='FINALIZED',
+        )
+        BudgetDetail.objects.bulk_create([
+            BudgetDetail(entry=entry, name=f'{name} {idx}', price=1000, qty=1, freq=2, source='SELF', unit='EA')
+            for idx in range(detail_count)
+        ])
+        entry.update_totals()
+        return project
+
+    def test_clone_copies_details_with_constant_queries(self):
+        project = self._project_with_details(self.org, 'Clone Source', 30)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(f'/api/entrusted-projects/{project.id}/clone/', {
+                'year': 2027, 'name': 'Clone Target',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertLess(len(ctx.captured_queries), 30)
+        cloned = BudgetEntry.objects.get(entrusted_project_id=response.data['id'])
+        self.assertEqual((cloned.year, cloned.last_year_amount, cloned.total_amount), (2027, 60_000, 60_000))
+        self.assertEqual(cloned.details.count(), 30)
+        self.assertEqual(find_total_drift(BudgetEntry.objects.filter(pk=cloned.pk)), [])
+
+    def test_bulk_clone_copies_department_projects_into_next_year(self):
+        team = Organization.objects.create(name='Clone Team', code='CT01', org_type='team', parent=self.org)
+        other = Organization.objects.create(name='Other Dept', code='OD01', org_type='dept')
+        self._project_with_details(self.org, 'Dept Project', 2)
+        self._project_with_details(team, 'Team Project', 3)
+        self._project_with_details(other, 'Other Project', 1)
+
+        payload = {'year': 2027, 'source_year': 2026, 'org_id': self.org.id}
+        response = self.client.post('/api/entrusted-projects/bulk-clone/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['cloned_count'], response.data['entry_count']), (2, 2))
+        self.assertEqual(
+            set(EntrustedProject.objects.filter(year=2027).values_list('name', 'organization_id')),
+            {('Dept Project', self.org.id), ('Team Project', team.id)},
+        )
+        self.assertEqual(BudgetDetail.objects.filter(entry__year=2027).count(), 5)
+        self.assertEqual(find_rollup_drift(year=2027, round_no=0), [])
+
+        again = self.client.post('/api/entrusted-projects/bulk-clone/', payload, format='json')
+        self.assertEqual((again.data['cloned_count'], again.data['skipped_count']), (0, 2))
+
+
+
 class DashboardAndBulkUpsertApiTest(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -543,6 +960,348 @@ class DashboardAndBulkUpsertApiTest(TestCase):
         self.assertEqual(entry.details.count(), 1)
         self.assertEqual(entry.details.first().price, 5000)
 
+    def test_bulk_upsert_reports_row_manifest_and_replaces_details(self):
+        signup = self.client.post('/api/auth/signup/', {
+            'username': 'bulkmanifest', 'password': 'StrongPass!234', 'name': 'Bulk', 'email': 'bulkm@example.com'
+        }, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {signup.data['token']}")
+        sub2 = BudgetSubject.objects.create(code='1112', name='Sub 2', level=4, subject_type='expense')
+        existing = BudgetEntry.objects.create(subject=sub2, organization=self.org, year=2026, status='DRAFT')
+        BudgetDetail.objects.create(entry=existing, name='Old', price=1, qty=1, freq=1, unit='EA', source='SELF')
+
+        payload = {
+            'year': 2026,
+            'entries': [
+                {'subject_code': '1111', 'org_code': 'D001', 'details': [{'name': 'A', 'price': 100, 'qty': 2}]},
+                {'subject_code': '1112', 'org_code': 'D001', 'details': [
+                    {'name': 'B', 'price': 300, 'qty': 1, 'freq': 2},
+                    {'name': 'Bad', 'price': 'x'},
+                ]},
+                {'subject_code': 'NOPE', 'org_code': 'D001', 'details': []},
+                {'subject_code': '1111', 'org_code': 'NOPE'},
+            ],
+        }
+        response = self.client.post('/api/entries/bulk-upsert/', payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['skipped']), (1, 1, 2))
+        rows = response.data['rows']
+        self.assertEqual([row['status'] for row in rows], ['created', 'updated', 'skipped', 'skipped'])
+        self.assertEqual(rows[1]['entry_id'], existing.id)
+        self.assertEqual(rows[1]['skipped_details'], 1)
+        self.assertEqual(rows[2]['reason'], 'unknown_subject')
+        self.assertEqual(rows[3]['reason'], 'unknown_org')
+
+        existing.refresh_from_db()
+        self.assertEqual(list(existing.details.values_list('name', flat=True)), ['B'])
+        self.assertEqual(existing.total_amount, 600)
+        created = BudgetEntry.objects.get(pk=rows[0]['entry_id'])
+        self.assertEqual(created.total_amount, 200)
+
+    def test_bulk_upsert_query_count_does_not_grow_with_rows(self):
+        signup = self.client.post('/api/auth/signup/', {
+            'username': 'bulkscale', 'password': 'StrongPass!234', 'name': 'Bulk', 'email': 'bulks@example.com'
+        }, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {signup.data['token']}")
+        subjects = [
+            BudgetSubject.objects.create(code=f'S{i:03d}', name=f'Sub {i}', level=4, subject_type='expense')
+            for i in range(30)
+        ]
+
+        def payload(count):
+            return {'year': 2027, 'entries': [
+                {'subject_code': s.code, 'org_code': 'D001', 'details': [{'name': 'X', 'price': 10, 'qty': 1}]}
+                for s in subjects[:count]
+            ]}
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/api/entries/bulk-upsert/', payload(3), format='json')
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post('/api/entries/bulk-upsert/', payload(30), format='json')
+        self.assertEqual(response.data['created'], 27)
+        self.assertEqual(response.data['updated'], 3)
+        # Replacing existing details goes through the delete collector, so allow a small constant slack.
+        self.assertLessEqual(len(large.captured_queries), len(small.captured_queries) + 6)
+
+
+class BudgetImportJobApiTest(TestCase):
+    def setUp(self):
+        self.media_dir = tempfile.TemporaryDirectory(prefix='budget_import_')
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_dir.name, BUDGET_JOBS_ASYNC=False)
+        self.settings_override.enable()
+        self.client = APIClient()
+        signup = self.client.post('/api/auth/signup/', {
+            'username': 'importer', 'password': 'StrongPass!234', 'name': 'Importer', 'email': 'imp@example.com'
+        }, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {signup.data['token']}")
+
+        self.org = Organization.objects.create(name='가져오기부서', code='IMP_D', org_type='dept')
+        gwan = BudgetSubject.objects.create(code='IMP_2', name='운영비', level=2, subject_type='expense')
+        hang = BudgetSubject.objects.create(code='IMP_3', name='일반운영비', level=3, subject_type='expense', parent=gwan)
+        self.mok = BudgetSubject.objects.create(code='IMP_4', name='사무관리비', level=4, subject_type='expense', parent=hang)
+        self.mok2 = BudgetSubject.objects.create(code='IMP_5', name='공공운영비', level=4, subject_type='expense', parent=hang)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media_dir.cleanup()
+
+    def test_csv_roundtrip_from_macro_export(self):
+        entry = BudgetEntry.objects.create(subject=self.mok, organization=self.org, year=2026, supplemental_round=0)
+        BudgetDetail.objects.create(entry=entry, name='복사용지', price=25000, qty=10, freq=2, unit='박스', source='자체')
+        BudgetDetail.objects.create(entry=entry, name='토너', price=90000, qty=3, freq=1, unit='개', source='국비')
+        export_path = Path(self.media_dir.name) / 'macro.csv'
+        call_command('export_macro_input_data', '--year', '2026', '--output', str(export_path), stdout=StringIO())
+        entry.details.all().delete()
+
+        response = self.client.post(
+            '/api/imports/?year=2026&round=0&chunk_size=1',
+            data=export_path.read_bytes(),
+            content_type='text/csv',
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'SUCCEEDED')
+        self.assertEqual(response.data['kind'], 'budget_import')
+        self.assertEqual(response.data['result']['rows_imported'], 2)
+        self.assertEqual(response.data['progress'], 100.0)
+
+        entry.refresh_from_db()
+        self.assertEqual(sorted(entry.details.values_list('name', flat=True)), ['복사용지', '토너'])
+        self.assertEqual(entry.total_amount, 500000 + 270000)
+
+        poll = self.client.get(f"/api/jobs/{response.data['id']}/")
+        self.assertEqual(poll.status_code, 200)
+        self.assertEqual(poll.data['status'], 'SUCCEEDED')
+
+    def test_ndjson_upload_reports_skipped_rows(self):
+        lines = [
+            {'org_code': 'IMP_D', 'subject_code': 'IMP_5', 'name': '전기료', 'price': 1000, 'qty': 2, 'freq': 3},
+            {'org_code': 'NOPE', 'subject_code': 'IMP_5', 'name': 'x', 'price': 1},
+            'not json',
+            {'부서명': '가져오기부서', '관': '운영비', '항': '일반운영비', '목': '공공운영비', '산출내역1': '[일반운영비] 수도료', '단가': '500', '수량': '1', '회차': '1'},
+        ]
+        body = '\n'.join(line if isinstance(line, str) else json.dumps(line, ensure_ascii=False) for line in lines)
+        upload = SimpleUploadedFile('rows.ndjson', body.encode('utf-8'), content_type='application/x-ndjson')
+        response = self.client.post('/api/imports/', {'file': upload, 'year': 2026, 'mode': 'append'}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        result = response.data['result']
+        self.assertEqual((result['rows_imported'], result['rows_skipped']), (2, 2))
+        self.assertEqual([e['reason'] for e in result['errors']], ['unknown_org', 'invalid_json'])
+
+        entry = BudgetEntry.objects.get(subject=self.mok2, organization=self.org, year=2026)
+        self.assertEqual(sorted(entry.details.values_list('name', flat=True)), ['수도료', '전기료'])
+        self.assertEqual(entry.total_amount, 6500)
+
+    def test_failed_job_resumes_from_checkpoint(self):
+        rows = [
+            {'org_code': 'IMP_D', 'subject_code': 'IMP_4', 'name': f'항목{i}', 'price': 100, 'qty': 1, 'freq': 1}
+            for i in range(5)
+        ]
+        body = '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows).encode('utf-8')
+
+        from .services import budget_import
+        original = budget_import._import_chunk
+        calls = {'n': 0}
+
+        def flaky(*args, **kwargs):
+            calls['n'] += 1
+            if calls['n'] == 2:
+                raise RuntimeError('disk full')
+            return original(*args, **kwargs)
+
+        with mock.patch.object(budget_import, '_import_chunk', side_effect=flaky):
+            response = self.client.post(
+                '/api/imports/?year=2026&chunk_size=2&file_format=ndjson',
+                data=body,
+                content_type='application/x-ndjson',
+            )
+        self.assertEqual(response.data['status'], 'FAILED')
+        self.assertEqual(response.data['result']['rows_processed'], 2)
+
+        resumed = self.client.post(f"/api/jobs/{response.data['id']}/resume/")
+        self.assertEqual(resumed.status_code, 202)
+        self.assertEqual(resumed.data['status'], 'SUCCEEDED')
+        self.assertEqual(resumed.data['result']['rows_imported'], 5)
+        entry = BudgetEntry.objects.get(subject=self.mok, organization=self.org, year=2026)
+        self.assertEqual(entry.details.count(), 5)
+        self.assertEqual(entry.total_amount, 500)
+
+    def test_replace_mode_keeps_rows_from_earlier_chunks(self):
+        entry = BudgetEntry.objects.create(subject=self.mok, organization=self.org, year=2026, supplemental_round=0)
+        BudgetDetail.objects.create(entry=entry, name='기존', price=999, qty=1, freq=1)
+        body = '\n'.join(
+            json.dumps({'org_code': 'IMP_D', 'subject_code': 'IMP_4', 'name': f'교체{i}', 'price': 10}, ensure_ascii=False)
+            for i in range(3)
+        ).encode('utf-8')
+        response = self.client.post('/api/imports/?year=2026&chunk_size=1&file_format=ndjson', data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.data['status'], 'SUCCEEDED')
+        self.assertEqual(sorted(entry.details.values_list('name', flat=True)), ['교체0', '교체1', '교체2'])
+
+    def test_force_resume_requires_stale_running_job(self):
+        job = Job.objects.create(
+            kind='budget_import', created_by=User.objects.get(username='importer'), status='RUNNING',
+            params={'year': 2026, 'file_format': 'ndjson', 'file': 'imports/missing.ndjson'},
+            started_at=timezone.now(), heartbeat_at=timezone.now(),
+        )
+        resumed = self.client.post(f'/api/jobs/{job.pk}/resume/?force=1')
+        self.assertEqual(resumed.status_code, 409)
+
+        stale = timezone.now() - timedelta(seconds=settings.BUDGET_JOBS_STALE_AFTER + 1)
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=stale)
+        self.assertEqual(self.client.post(f'/api/jobs/{job.pk}/resume/').status_code, 409)
+        with override_settings(BUDGET_JOBS_ASYNC=True):
+            resumed = self.client.post(f'/api/jobs/{job.pk}/resume/?force=1')
+        self.assertEqual(resumed.status_code, 202)
+        self.assertEqual(resumed.data['status'], 'PENDING')
+        self.assertEqual(self.client.post(f'/api/jobs/{job.pk}/resume/?force=1').status_code, 409)
+
+
+class JobQueueApiTest(TestCase):
+    def setUp(self):
+        self.media_dir = tempfile.TemporaryDirectory(prefix='budget_jobs_')
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_dir.name)
+        self.settings_override.enable()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='job_manager', password='StrongPass!234')
+        org = Organization.objects.create(name='작업부서', code='JOB_D', org_type='dept')
+        UserProfile.objects.create(user=self.user, role='MANAGER', organization=org)
+        self.client.force_authenticate(user=self.user)
+        BudgetSubject.objects.create(code='JOB_4', name='작업목', level=4, subject_type='expense')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media_dir.cleanup()
+
+    def _bulk_payload(self):
+        return {
+            'year': 2026,
+            'background': '1',
+            'entries': [{'subject_code': 'JOB_4', 'org_code': 'JOB_D', 'details': [{'name': '작업', 'price': 700}]}],
+        }
+
+    def test_background_request_is_queued_then_replayed_by_worker(self):
+        response = self.client.post('/api/entries/bulk-upsert/', self._bulk_payload(), format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['job']['status'], 'PENDING')
+        self.assertFalse(BudgetEntry.objects.filter(subject__code='JOB_4').exists())
+
+        job = claim_next_job('test-worker')
+        self.assertEqual(job.pk, response.data['job']['id'])
+        self.assertIsNone(claim_next_job('test-worker'))
+        job = run_job(job.pk, worker='test-worker')
+
+        self.assertEqual(job.status, 'SUCCEEDED')
+        self.assertEqual(job.progress, 100.0)
+        self.assertEqual(job.result['status_code'], 200)
+        self.assertEqual(job.result['data']['created'], 1)
+        self.assertEqual(BudgetEntry.objects.get(subject__code='JOB_4').total_amount, 700)
+
+        poll = self.client.get(f"/api/jobs/{job.pk}/")
+        self.assertEqual(poll.status_code, 200)
+        self.assertEqual(poll.data['status'], 'SUCCEEDED')
+
+    def test_cancel_pending_job_and_inline_mode(self):
+        response = self.client.post('/api/entries/bulk-upsert/', self._bulk_payload(), format='json')
+        job_id = response.data['job']['id']
+        cancel = self.client.post(f'/api/jobs/{job_id}/cancel/')
+        self.assertEqual(cancel.status_code, 202)
+        self.assertEqual(cancel.data['status'], 'CANCELLED')
+        self.assertIsNone(claim_next_job('test-worker'))
+        self.assertEqual(self.client.post(f'/api/jobs/{job_id}/cancel/').status_code, 409)
+
+        with override_settings(BUDGET_JOBS_ASYNC=False):
+            response = self.client.post('/api/entries/bulk-upsert/', self._bulk_payload(), format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['job']['status'], 'SUCCEEDED')
+
+        other = User.objects.create_user(username='job_other', password='StrongPass!234')
+        UserProfile.objects.create(user=other, role='MANAGER')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/').status_code, 404)
+
+    def test_artifact_is_stored_under_media_root_and_downloadable(self):
+        @job_handler('test_artifact')
+        def write_artifact(job, ctx):
+            ctx.progress(50, 'half way')
+            ctx.save_artifact('report.txt', b'job output', 'text/plain')
+            return {'lines': 1}
+
+        with override_settings(BUDGET_JOBS_ASYNC=False):
+            job = enqueue_job('test_artifact', user=self.user)
+        self.assertEqual(job.status, 'SUCCEEDED')
+        self.assertTrue(Path(job.artifact.path).is_relative_to(Path(self.media_dir.name) / 'jobs'))
+
+        response = self.client.get(f'/api/jobs/{job.pk}/artifact/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'job output')
+        self.assertIn('report.txt', response['Content-Disposition'])
+        response.close()
+
+    def test_cancelled_resumable_job_resumes_from_checkpoint(self):
+        steps = []
+
+        @job_handler('test_resumable', resumable=True)
+        def count_to_three(job, ctx):
+            done = (job.result or {}).get('done', 0)
+            if not job.result:
+                Job.objects.filter(pk=job.pk).update(cancel_requested=True)
+            while done < 3:
+                done += 1
+                steps.append(done)
+                ctx.progress(done * 100 / 3, state={'done': done})
+            return {'done': done}
+
+        with override_settings(BUDGET_JOBS_ASYNC=False):
+            job = enqueue_job('test_resumable', user=self.user)
+            self.assertEqual((job.status, job.result), ('CANCELLED', {'done': 1}))
+            response = self.client.post(f'/api/jobs/{job.pk}/resume/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'SUCCEEDED')
+        self.assertEqual(steps, [1, 2, 3])
+        self.assertEqual(self.client.post(f'/api/jobs/{job.pk}/resume/').status_code, 409)
+
+        bulk = self.client.post('/api/entries/bulk-upsert/', self._bulk_payload(), format='json')
+        self.assertEqual(self.client.post(f"/api/jobs/{bulk.data['job']['id']}/resume/").status_code, 400)
+
+    def test_replayed_streaming_request_stops_between_chunks_when_cancelled(self):
+        streamed = []
+
+        def chunks(job_id):
+            for index in range(5):
+                streamed.append(index)
+                if index == 1:
+                    Job.objects.filter(pk=job_id).update(cancel_requested=True)
+                yield b'row\n'
+
+        job = Job.objects.create(
+            kind='api_request', created_by=self.user, params={'method': 'GET', 'path': '/api/logs/export/'},
+        )
+        view = mock.Mock(return_value=StreamingHttpResponse(chunks(job.pk), content_type='text/csv'))
+        with mock.patch('django.urls.resolve', return_value=ResolverMatch(view, (), {})), \
+                mock.patch('budget_mgmt.jobs.REPLAY_CANCEL_CHECK_INTERVAL', 0):
+            job = run_job(job.pk, worker='test-worker')
+        self.assertEqual(job.status, 'CANCELLED')
+        self.assertEqual(streamed, [0, 1])
+        self.assertFalse(job.artifact)
+
+    def test_enqueue_starts_in_process_runner_unless_an_external_worker_runs(self):
+        with mock.patch('budget_mgmt.jobs.start_local_runner') as start:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/api/entries/bulk-upsert/', self._bulk_payload(), format='json')
+            start.assert_called_once()
+            with override_settings(BUDGET_JOBS_EXTERNAL_WORKER=True), self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/api/entries/bulk-upsert/', self._bulk_payload(), format='json')
+            start.assert_called_once()
+
+    def test_requeued_job_is_not_finished_by_its_old_runner(self):
+        @job_handler('test_superseded')
+        def requeued_midway(job, ctx):
+            Job.objects.filter(pk=job.pk).update(status='PENDING', worker='')
+            ctx.progress(50)
+            return {'done': True}
+
+        job = run_job(enqueue_job('test_superseded', user=self.user).pk, worker='test-worker')
+        self.assertEqual(job.status, 'PENDING')
+        self.assertIsNone(job.result)
+
 
 class BudgetVersionTransferApiTest(TestCase):
     def setUp(self):
@@ -687,6 +1446,42 @@ class BudgetVersionTransferApiTest(TestCase):
         self.assertEqual(second_cloned.total_amount, 8_000)
         self.assertEqual(second_cloned.remaining_amount, 8_000)
 
+    @override_settings(BUDGET_JOBS_ASYNC=False)
+    def test_create_next_round_background_clone_maps_projects_in_chunks(self):
+        project = EntrustedProject.objects.create(organization=self.org, year=2025, code='P-1', name='Project One')
+        existing = EntrustedProject.objects.create(organization=self.org, year=2026, code='P-2', name='Project Two')
+        project_two = EntrustedProject.objects.create(organization=self.org, year=2025, code='P-9', name='Project Two')
+        for idx, proj in enumerate((project, project, project_two)):
+            subject = BudgetSubject.objects.create(code=f'912{idx}', name=f'Clone {idx}', level=4, subject_type='expense')
+            entry = BudgetEntry.objects.create(
+                subject=subject, organization=self.org, entrusted_project=proj,
+                year=2025, supplemental_round=0, status='DRAFT',
+            )
+            BudgetDetail.objects.create(entry=entry, name=f'Item {idx}', price=100, qty=1, freq=1, source='SELF', unit='EA')
+
+        response = self.client.post('/api/versions/create_next_round/', {
+            'year': 2026,
+            'creation_mode': 'TRANSFER',
+            'source_version_id': self.source_version.id,
+            'background': 'true',
+            'chunk_size': 2,
+        }, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        job = response.data['clone_job']
+        self.assertEqual(job['status'], 'SUCCEEDED')
+        self.assertEqual(job['kind'], 'version_clone')
+        result = job['result']
+        self.assertEqual((result['total_entries'], result['entries_cloned'], result['details_cloned']), (4, 4, 4))
+        self.assertEqual(job['progress'], 100.0)
+
+        cloned = BudgetEntry.objects.filter(year=2026, supplemental_round=0)
+        new_projects = EntrustedProject.objects.filter(year=2026, source_project=project)
+        self.assertEqual(new_projects.count(), 1)
+        self.assertEqual(cloned.filter(entrusted_project=new_projects.get()).count(), 2)
+        self.assertEqual(cloned.filter(entrusted_project=existing).count(), 1)
+        self.assertEqual(self.client.get(f"/api/jobs/{job['id']}/").data['status'], 'SUCCEEDED')
+        self.assertEqual(find_rollup_drift(year=2026, round_no=0), [])
+
     def test_transfer_entry_baseline_amount_is_immutable(self):
         response = self.client.post('/api/versions/create_next_round/', {
             'year': 2026,
@@ -799,6 +1594,41 @@ class BudgetScopeAndConcurrencyApiTest(TestCase):
         }, format='json')
         self.assertEqual(create_detail_response.status_code, 403)
 
+    def test_org_scope_is_memoized_and_follows_hierarchy_changes(self):
+        division = Organization.objects.create(name='Scope Division', code='SCOPE_DIV', org_type='dept')
+        self.user_a.profile.organization = division
+        self.user_a.profile.save()
+        team = Organization.objects.create(name='Scope Team', code='SCOPE_T1', org_type='team', parent=division)
+
+        user = User.objects.select_related('profile').get(pk=self.user_a.pk)
+        self.assertEqual(_scope_org_ids_for_user(user), {division.id, team.id})
+        with CaptureQueriesContext(connection) as ctx:
+            scope = _scope_org_ids_for_user(user)
+            scope.add(self.org_b.id)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(_scope_org_ids_for_user(user), {division.id, team.id})
+
+        # A fresh user object (next request) does not recompute; with LocMemCache the
+        # hierarchy generation is read from the database once per request.
+        user = User.objects.select_related('profile').get(pk=self.user_a.pk)
+        with request_generations(), CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(_scope_org_ids_for_user(user), {division.id, team.id})
+            self.assertEqual(_scope_org_ids_for_user(user), {division.id, team.id})
+        self.assertEqual(['budget_mgmt_treegeneration' in q['sql'] for q in ctx.captured_queries], [True])
+
+        team_2 = Organization.objects.create(name='Scope Team 2', code='SCOPE_T2', org_type='team', parent=division)
+        user = User.objects.select_related('profile').get(pk=self.user_a.pk)
+        self.assertEqual(_scope_org_ids_for_user(user), {division.id, team.id, team_2.id})
+
+        team_2.parent = self.org_b
+        team_2.save()
+        user = User.objects.select_related('profile').get(pk=self.user_a.pk)
+        self.assertEqual(_scope_org_ids_for_user(user), {division.id, team.id})
+
+        user.profile.team = team
+        user.profile.save()
+        self.assertEqual(_scope_org_ids_for_user(user), {team.id})
+
     def test_detail_update_returns_409_on_stale_updated_at(self):
         detail = BudgetDetail.objects.create(
             entry=self.entry_a,
@@ -832,6 +1662,564 @@ class BudgetScopeAndConcurrencyApiTest(TestCase):
         self.assertEqual(update_conflict.data.get('code'), 'DETAIL_CONFLICT')
 
 
+class OrganizationHierarchyIndexTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.dept = Organization.objects.create(name='Tree Dept', code='TREE_D', org_type='dept')
+        self.team = Organization.objects.create(name='Tree Team', code='TREE_T', org_type='team', parent=self.dept)
+        self.unit = Organization.objects.create(name='Tree Unit', code='TREE_U', org_type='team', parent=self.team)
+        self.subject = BudgetSubject.objects.create(code='TRE1', name='Tree Subject', level=4, subject_type='expense')
+        self.user = User.objects.create_user(username='tree_staff', password='StrongPass!234')
+        UserProfile.objects.create(user=self.user, role='STAFF', organization=self.dept)
+
+    def test_tree_and_closure_cover_nested_orgs(self):
+        tree = get_org_tree()
+        self.assertEqual(tree.ancestors(self.unit.id), (self.team.id, self.dept.id))
+        self.assertEqual(tree.subtree(self.dept.id), {self.dept.id, self.team.id, self.unit.id})
+        self.assertEqual(tree.root_name(self.unit.id), 'Tree Dept')
+        self.assertEqual(tree.depth(self.unit.id), 2)
+        with request_generations():
+            self.assertIs(get_org_tree(), tree)  # reads the generation once per request
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertIs(get_org_tree(), tree)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(
+            set(OrganizationClosure.objects.filter(ancestor=self.dept).values_list('descendant_id', 'depth')),
+            {(self.dept.id, 0), (self.team.id, 1), (self.unit.id, 2)},
+        )
+
+        self.unit.parent = self.dept
+        self.unit.save()
+        self.assertEqual(get_org_tree().ancestors(self.unit.id), (self.dept.id,))
+        self.assertTrue(OrganizationClosure.objects.filter(ancestor=self.dept, descendant=self.unit, depth=1).exists())
+
+        self.team.delete()
+        self.assertNotIn(self.team.id, get_org_tree())
+        self.assertEqual(OrganizationClosure.objects.filter(ancestor=self.dept).count(), 2)
+
+    def test_hierarchy_changes_from_another_worker_drop_cached_scope(self):
+        self.assertEqual(get_org_tree().ancestors(self.unit.id), (self.team.id, self.dept.id))
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        self.assertEqual(_scope_org_ids_for_user(user), {self.dept.id, self.team.id, self.unit.id})
+
+        # another process moves the team out: no signals here, only its own tree cache invalidates
+        Organization.objects.filter(pk=self.team.pk).update(parent=None)
+        ProcessTreeCache('org-tree', load_org_tree, 'ORG_TREE_MAX_AGE').invalidate()
+        self.assertEqual(get_org_tree().ancestors(self.unit.id), (self.team.id,))
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        self.assertEqual(_scope_org_ids_for_user(user), {self.dept.id})
+
+    def test_scope_and_dashboard_include_nested_teams(self):
+        BudgetEntry.objects.create(subject=self.subject, organization=self.unit, year=2026, status='FINALIZED')
+        BudgetEntry.objects.create(subject=self.subject, organization=self.dept, year=2026, status='DRAFT')
+        self.assertEqual(_scope_org_ids_for_user(self.user), {self.dept.id, self.team.id, self.unit.id})
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/api/dashboard/summary/', {'year': 2026})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['org_progress'],
+            [{'id': self.dept.id, 'name': 'Tree Dept', 'total': 2, 'finalized': 1, 'ratio': 50.0}],
+        )
+
+    def test_dashboard_keeps_dept_nested_under_non_dept_root(self):
+        division = Organization.objects.create(name='Tree Division', code='TREE_V', org_type='division')
+        self.dept.parent = division
+        self.dept.save()
+        BudgetEntry.objects.create(subject=self.subject, organization=self.unit, year=2026, status='FINALIZED')
+        team_user = User.objects.create_user(username='tree_team_staff', password='StrongPass!234')
+        UserProfile.objects.create(user=team_user, role='STAFF', organization=self.dept, team=self.team)
+
+        for user in (self.user, team_user):
+            self.client.force_authenticate(user=user)
+            response = self.client.get('/api/dashboard/summary/', {'year': 2026})
+            self.assertEqual(
+                response.data['org_progress'],
+                [{'id': self.dept.id, 'name': 'Tree Dept', 'total': 1, 'finalized': 1, 'ratio': 100.0}],
+            )
+
+
+class BudgetSubjectTreeIndexTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.jang = BudgetSubject.objects.create(code='ST10', name='Jang', level=1, subject_type='expense')
+        self.gwan = BudgetSubject.objects.create(code='ST11', name='Gwan', level=2, subject_type='expense', parent=self.jang)
+        self.hang = BudgetSubject.objects.create(code='ST12', name='Hang', level=3, subject_type='expense', parent=self.gwan)
+        self.mok = BudgetSubject.objects.create(code='ST13', name='Mok', level=4, subject_type='expense', parent=self.hang)
+        self.admin = User.objects.create_user(username='subject_tree_admin', password='StrongPass!234')
+        UserProfile.objects.create(user=self.admin, role='ADMIN')
+
+    def test_paths_and_leaves_follow_subject_changes(self):
+        tree = get_subject_tree()
+        self.assertEqual(tree.path(self.mok.id), ('Jang', 'Gwan', 'Hang', 'Mok'))
+        self.assertEqual(tree.path(self.hang.id), ('Jang', 'Gwan', 'Hang', ''))
+        self.assertEqual(tree.leaf_ids(self.jang.id), {self.mok.id})
+        with request_generations():
+            self.assertIs(get_subject_tree(), tree)
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertIs(get_subject_tree(), tree)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        self.gwan.name = 'Gwan Renamed'
+        self.gwan.save()
+        self.assertEqual(get_subject_tree().path(self.mok.id), ('Jang', 'Gwan Renamed', 'Hang', 'Mok'))
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.delete(f'/api/subjects/{self.hang.id}/force-delete/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deleted_subjects_count'], 2)
+        self.assertNotIn(self.mok.id, get_subject_tree())
+        self.assertEqual(get_subject_tree().leaf_ids(self.jang.id), {self.gwan.id})
+
+    def test_force_delete_checks_descendants_missing_from_cached_tree(self):
+        self.assertEqual(get_subject_tree().leaf_ids(self.jang.id), {self.mok.id})
+        # another worker adds a child: bulk_create sends no signals, so this tree stays stale
+        BudgetSubject.objects.bulk_create([
+            BudgetSubject(code='ST15', name='Se', level=5, subject_type='expense', parent=self.mok),
+        ])
+        se = BudgetSubject.objects.get(code='ST15')
+        self.assertNotIn(se.id, get_subject_tree())
+        org = Organization.objects.create(name='Subject Tree Dept', code='ST_D', org_type='dept')
+        BudgetEntry.objects.create(subject=se, organization=org, year=2026)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.delete(f'/api/subjects/{self.hang.id}/force-delete/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['linked_entry_count'], 1)
+        self.assertTrue(BudgetSubject.objects.filter(pk=self.hang.pk).exists())
+
+    def test_only_tree_field_changes_invalidate_once_per_batch(self):
+        from . import subjecttree
+
+        with mock.patch.object(subjecttree, 'invalidate_subject_tree') as invalidate:
+            mok = BudgetSubject.objects.get(pk=self.mok.pk)
+            mok.description = 'Not part of the tree'
+            mok.erpnext_account = 'ACC-1'
+            mok.save()
+            self.assertEqual(invalidate.call_count, 0)
+
+            with subjecttree.batched_invalidation():
+                for subject in BudgetSubject.objects.all():
+                    subject.sort_order += 1
+                    subject.save()
+                BudgetSubject.objects.create(code='ST14', name='Mok 2', level=4, subject_type='expense', parent=self.hang)
+                self.assertEqual(invalidate.call_count, 0)
+            self.assertEqual(invalidate.call_count, 1)
+
+            mok.name = 'Mok Renamed'
+            mok.save()
+            self.assertEqual(invalidate.call_count, 2)
+
+
+class BudgetEntrySummaryListApiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.org = Organization.objects.create(name='Summary Dept', code='SUM_D', org_type='dept')
+        self.version = BudgetVersion.objects.create(year=2026, round=0, name='2026 본예산')
+        self.admin = User.objects.create_user(username='summary_admin', password='StrongPass!234', first_name='Kim')
+        UserProfile.objects.create(user=self.admin, role='ADMIN', organization=self.org)
+        self.client.force_authenticate(user=self.admin)
+
+        self.entries = []
+        for index in range(5):
+            subject = BudgetSubject.objects.create(code=f'SUM{index}', name=f'Summary {index}', level=4, subject_type='expense')
+            entry = BudgetEntry.objects.create(subject=subject, organization=self.org, year=2026, supplemental_round=0)
+            BudgetDetail.objects.create(entry=entry, name='Item', price=1000, qty=index + 1, freq=1, unit='EA', source='SELF')
+            self.entries.append(entry)
+
+        first = self.entries[0]
+        BudgetDetail.objects.create(entry=first, name='Rate', price=10000, qty=10, is_rate=True, unit='%', source='SELF')
+        ApprovalLog.objects.create(entry=first, from_status='DRAFT', to_status='PENDING', actor=self.admin)
+        question = SubmissionComment.objects.create(entry=first, version=self.version, comment_type='QUESTION', body='Why?', author=self.admin)
+        SubmissionComment.objects.create(entry=first, version=self.version, comment_type='REQUEST', body='Fix it', author=self.admin)
+        SubmissionComment.objects.create(entry=first, version=self.version, comment_type='ANSWER', body='Because', parent=question, author=self.admin)
+        SubmissionComment.objects.create(entry=self.entries[1], version=self.version, comment_type='DONE', body='Done', author=self.admin, is_deleted=True)
+
+    def _rows(self, response):
+        return response.data['results']
+
+    def test_summary_matches_full_serializer_without_details(self):
+        full = {row['id']: row for row in self._rows(self.client.get('/api/entries/', {'year': 2026}))}
+        response = self.client.get('/api/entries/', {'year': 2026, 'view': 'summary'})
+        self.assertEqual(response.status_code, 200)
+        rows = self._rows(response)
+        self.assertEqual([row['id'] for row in rows], [entry.id for entry in self.entries])
+        for row in rows:
+            self.assertNotIn('details', row)
+            expected = full[row['id']]
+            for key in (
+                'total_amount', 'variance_amount', 'detail_count', 'comment_count', 'latest_comment_type',
+                'unresolved_types', 'latest_action_by', 'latest_action_by_display',
+            ):
+                self.assertEqual(row[key], expected[key], key)
+        self.assertEqual(rows[0]['detail_count'], 2)
+        self.assertEqual(rows[0]['unresolved_types'], ['REQUEST'])
+        self.assertEqual(rows[0]['latest_action_by_display'], 'Kim')
+
+    def test_comment_status_rules_and_flat_query_cost(self):
+        def comment(entry, comment_type, parent=None, **kwargs):
+            return SubmissionComment.objects.create(
+                entry=entry, version=self.version, comment_type=comment_type, body='-', author=self.admin, parent=parent, **kwargs,
+            )
+
+        e1, e2, e3, e4 = self.entries[1:]
+        request = comment(e1, 'REQUEST')
+        comment(e1, 'DONE', parent=request)           # resolved by DONE reply
+        comment(e2, 'REQUEST')
+        comment(e2, 'ANSWER')                         # newer top-level ANSWER resolves it
+        question = comment(e3, 'QUESTION')
+        comment(e3, 'DONE', parent=question)          # QUESTION needs an ANSWER reply
+        comment(e4, 'REQUEST', is_deleted=True)
+
+        def fetch():
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get('/api/entries/', {'year': 2026})
+            return {row['id']: row for row in self._rows(response)}, len(captured.captured_queries)
+
+        rows, queries = fetch()
+        self.assertEqual(rows[e1.id]['unresolved_types'], [])
+        self.assertEqual(rows[e2.id]['unresolved_types'], [])
+        self.assertEqual(rows[e2.id]['latest_comment_type'], 'ANSWER')
+        self.assertEqual(rows[e3.id]['unresolved_types'], ['QUESTION'])
+        self.assertEqual((rows[e4.id]['comment_count'], rows[e4.id]['unresolved_types']), (0, []))
+        self.assertEqual(rows[e1.id]['comment_count'], 2)
+
+        for _ in range(10):
+            comment(e4, 'QUESTION')
+        _, queries_after = fetch()
+        self.assertEqual(queries_after, queries)
+
+        detail = self.client.get(f'/api/entries/{e3.id}/')
+        self.assertEqual(detail.data['unresolved_types'], ['QUESTION'])
+
+    def test_activity_fields_follow_workflow_and_backfill(self):
+        manager = User.objects.create_user(username='summary_manager', password='StrongPass!234', first_name='Lee')
+        UserProfile.objects.create(user=manager, role='MANAGER', organization=self.org)
+        entry = self.entries[2]
+
+        self.assertEqual(self.client.post(f'/api/entries/{entry.id}/submit/').status_code, 200)
+        entry.refresh_from_db()
+        submitted_at = entry.submitted_at
+        self.assertEqual((entry.submitted_by_id, entry.latest_action_by_id), (self.admin.id, self.admin.id))
+
+        self.client.force_authenticate(user=manager)
+        self.assertEqual(self.client.post(f'/api/entries/{entry.id}/approve/').status_code, 200)
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post('/api/entries/workflow/', {
+            'action': 'submit', 'org_id': self.org.id, 'year': 2026, 'round': 0, 'entry_ids': [self.entries[3].id],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.submitted_at, submitted_at)
+        self.assertEqual(entry.latest_action_by_id, manager.id)
+        self.assertGreater(entry.latest_action_at, submitted_at)
+        self.assertEqual(BudgetEntry.objects.get(pk=self.entries[3].pk).submitted_by_id, self.admin.id)
+
+        rows = {row['id']: row for row in self._rows(self.client.get('/api/entries/', {'year': 2026}))}
+        self.assertEqual(rows[entry.id]['latest_action_by_display'], 'Lee')
+        self.assertEqual(rows[entry.id]['submitted_by'], 'summary_admin')
+
+        expected = {
+            e['id']: e for e in BudgetEntry.objects.values('id', *BudgetEntry.ACTIVITY_FIELDS)
+        }
+        BudgetEntry.objects.update(submitted_at=None, submitted_by=None, latest_action_at=None, latest_action_by=None)
+        call_command('backfill_entry_activity', '--year', '2026', '--batch-size', '2', stdout=StringIO())
+        rebuilt = {e['id']: e for e in BudgetEntry.objects.values('id', *BudgetEntry.ACTIVITY_FIELDS)}
+        self.assertEqual(rebuilt, expected)
+
+    def test_submitted_falls_back_to_oldest_log_until_a_transition(self):
+        editor = User.objects.create_user(username='summary_editor', password='StrongPass!234')
+        entry = self.entries[1]
+        write_audit_log(actor=self.admin, entry=entry, log_type='CRUD', action='UPDATE')
+        write_audit_log(actor=editor, entry=entry, log_type='CRUD', action='UPDATE')
+        entry.refresh_from_db()
+        self.assertEqual((entry.submitted_by_id, entry.latest_action_by_id), (self.admin.id, editor.id))
+
+        write_audit_log(actor=editor, entry=entry, action='SUBMIT', from_status='DRAFT', to_status='REVIEWING')
+        write_audit_log(actor=self.admin, entry=entry, action='REJECT', from_status='REVIEWING', to_status='DRAFT')
+        write_audit_log(actor=self.admin, entry=entry, action='SUBMIT', from_status='DRAFT', to_status='REVIEWING')
+        entry.refresh_from_db()
+        self.assertEqual(entry.submitted_by_id, editor.id)
+
+        expected = {e['id']: e for e in BudgetEntry.objects.values('id', *BudgetEntry.ACTIVITY_FIELDS)}
+        call_command('backfill_entry_activity', '--year', '2026', stdout=StringIO())
+        self.assertEqual({e['id']: e for e in BudgetEntry.objects.values('id', *BudgetEntry.ACTIVITY_FIELDS)}, expected)
+
+    def test_summary_uses_keyset_pages_with_constant_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            first = self.client.get('/api/entries/', {'year': 2026, 'view': 'summary', 'page_size': 2})
+        self.assertEqual([row['id'] for row in self._rows(first)], [e.id for e in self.entries[:2]])
+        self.assertLessEqual(len(captured.captured_queries), 4)
+
+        seen = [row['id'] for row in self._rows(first)]
+        next_url = first.data['next']
+        while next_url:
+            page = self.client.get(next_url)
+            seen.extend(row['id'] for row in self._rows(page))
+            next_url = page.data['next']
+        self.assertEqual(seen, [e.id for e in self.entries])
+
+        keyset_full = self.client.get('/api/entries/', {'year': 2026, 'pagination': 'keyset', 'page_size': 3})
+        self.assertIn('details', self._rows(keyset_full)[0])
+        self.assertIsNotNone(keyset_full.data['next'])
+
+
+class EntryTotalsMaintenanceTest(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name='Totals Dept', code='TOT_D', org_type='dept')
+        self.subject = BudgetSubject.objects.create(code='TOT1', name='Totals Subject', level=4, subject_type='expense')
+        self.other_subject = BudgetSubject.objects.create(code='TOT2', name='Totals Subject 2', level=4, subject_type='expense')
+        self.user = User.objects.create_user(username='totals_user', password='StrongPass!234')
+        self.entry = BudgetEntry.objects.create(subject=self.subject, organization=self.org, year=2026, supplemental_round=0)
+        self.other_entry = BudgetEntry.objects.create(subject=self.other_subject, organization=self.org, year=2026, supplemental_round=0)
+
+    def _detail(self, entry, **kwargs):
+        values = {'name': 'Item', 'price': 1000, 'qty': 3, 'freq': 2, 'unit': 'EA', 'source': 'SELF'}
+        values.update(kwargs)
+        return BudgetDetail.objects.create(entry=entry, **values)
+
+    def _totals(self, entry):
+        entry.refresh_from_db()
+        return entry.total_amount, entry.executed_amount, entry.remaining_amount
+
+    def test_detail_create_update_move_delete_apply_deltas(self):
+        detail = self._detail(self.entry)
+        self._detail(self.entry, price=500, qty=10, freq=1, is_rate=True)
+        self.assertEqual(self._totals(self.entry), (6050, 0, 6050))
+
+        detail.price = 2000
+        detail.save()
+        self.assertEqual(self._totals(self.entry), (12050, 0, 12050))
+
+        detail.entry = self.other_entry
+        detail.save()
+        self.assertEqual(self._totals(self.entry), (50, 0, 50))
+        self.assertEqual(self._totals(self.other_entry), (12000, 0, 12000))
+
+        detail.delete()
+        self.assertEqual(self._totals(self.other_entry), (0, 0, 0))
+
+    def test_stale_instance_update_uses_stored_amount(self):
+        detail = self._detail(self.entry)
+        stale = BudgetDetail.objects.get(pk=detail.pk)
+        detail.qty = 5
+        detail.save()
+        stale.freq = 1
+        stale.save()
+        # Last writer wins on the row; totals follow the stored row, not the stale copy.
+        self.assertEqual(self._totals(self.entry), (3000, 0, 3000))
+        self.assertEqual(find_total_drift(), [])
+
+    def test_execution_changes_update_executed_and_remaining(self):
+        self._detail(self.entry)
+        execution = BudgetExecution.objects.create(
+            entry=self.entry, executed_at='2026-03-01', amount=1500, description='exec', created_by=self.user,
+        )
+        self.assertEqual(self._totals(self.entry), (6000, 1500, 4500))
+        execution.amount = 2500
+        execution.save()
+        self.assertEqual(self._totals(self.entry), (6000, 2500, 3500))
+        execution.delete()
+        self.assertEqual(self._totals(self.entry), (6000, 0, 6000))
+
+    def test_loaded_entry_is_kept_in_sync(self):
+        detail = self._detail(self.entry)
+        self.assertEqual(detail.entry.total_amount, 6000)
+        detail.price = 500
+        detail.save()
+        self.assertEqual(detail.entry.total_amount, 3000)
+        self.assertEqual(detail.entry.remaining_amount, 3000)
+
+    def test_drift_is_reported_and_fixed(self):
+        self._detail(self.entry)
+        BudgetEntry.objects.filter(pk=self.entry.pk).update(total_amount=1, remaining_amount=1)
+
+        drift = find_total_drift()
+        self.assertEqual(len(drift), 1)
+        self.assertEqual(drift[0]['entry_id'], self.entry.id)
+        self.assertEqual(drift[0]['expected']['total_amount'], 6000)
+
+        stdout = StringIO()
+        call_command('verify_entry_totals', '--year', '2026', '--fix', stdout=stdout)
+        self.assertIn('Fixed 1', stdout.getvalue())
+        self.assertEqual(self._totals(self.entry), (6000, 0, 6000))
+        self.assertEqual(find_total_drift(), [])
+
+    def test_deferred_totals_recomputes_once_on_exit(self):
+        with deferred_totals():
+            detail = self._detail(self.entry)
+            self._detail(self.entry, price=333, qty=7.5, freq=3)
+            self._detail(self.other_entry, price=12345, qty=3.3, is_rate=True)
+            detail.entry = self.other_entry
+            detail.save()
+            # Per-row handlers are suppressed inside the block.
+            self.assertEqual(self._totals(self.entry), (0, 0, 0))
+        self.assertEqual(self._totals(self.entry), (int(333 * 7.5 * 3), 0, int(333 * 7.5 * 3)))
+        expected_other = 6000 + int(12345 * (3.3 / 100))
+        self.assertEqual(self._totals(self.other_entry), (expected_other, 0, expected_other))
+        self.assertEqual(find_total_drift(), [])
+
+    def test_deferred_totals_as_decorator_and_bulk_marking(self):
+        @deferred_totals()
+        def load():
+            BudgetDetail.objects.bulk_create([
+                BudgetDetail(entry=self.entry, name=f'Bulk {i}', price=100, qty=i, freq=1, unit='EA', source='SELF')
+                for i in range(1, 5)
+            ])
+            mark_entries_dirty([self.entry.id])
+
+        load()
+        self.assertEqual(self._totals(self.entry), (1000, 0, 1000))
+
+    def test_deferred_totals_discards_on_rollback(self):
+        with self.assertRaises(RuntimeError):
+            with deferred_totals():
+                self._detail(self.entry)
+                raise RuntimeError('boom')
+        self.assertFalse(BudgetDetail.objects.filter(entry=self.entry).exists())
+        self._detail(self.entry, price=10, qty=1, freq=1)
+        self.assertEqual(self._totals(self.entry), (10, 0, 10))
+
+    def test_update_totals_recomputes_without_touching_other_fields(self):
+        self._detail(self.entry)
+        BudgetEntry.objects.filter(pk=self.entry.pk).update(total_amount=0, remaining_amount=0, status='PENDING')
+        self.entry.update_totals()
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.total_amount, 6000)
+        self.assertEqual(self.entry.status, 'PENDING')
+
+    def test_detail_amount_expression_matches_total_price(self):
+        details = [
+            self._detail(self.entry, price=1234, qty=0.7, freq=3),
+            self._detail(self.entry, price=999, qty=33.3, freq=1, is_rate=True),
+            self._detail(self.entry, price=150000, qty=2.5, freq=1, is_rate=True),
+            self._detail(self.other_entry, price=10, qty=0, freq=5),
+        ]
+        annotated = dict(BudgetDetail.objects.annotate(computed=detail_amount_expression()).values_list('id', 'computed'))
+        self.assertEqual(annotated, {d.id: d.total_price for d in details})
+
+        grouped = dict(
+            BudgetEntry.objects.annotate(detail_total=detail_amount_sum('details__')).values_list('id', 'detail_total')
+        )
+        self.assertEqual(grouped[self.entry.id], sum(d.total_price for d in details[:3]))
+        self.assertEqual(grouped[self.other_entry.id], 0)
+        self.assertEqual(find_total_drift(), [])
+
+    def test_stored_amount_follows_save_bulk_and_queryset_update(self):
+        detail = self._detail(self.entry)
+        self.assertEqual(detail.amount, 6000)
+        detail.qty = 5
+        detail.save(update_fields=['qty'])
+        self.assertEqual(BudgetDetail.objects.get(pk=detail.pk).amount, 10000)
+
+        created = BudgetDetail.objects.bulk_create([
+            BudgetDetail(entry=self.other_entry, name='Bulk', price=200, qty=1.5, freq=3, unit='EA', source='SELF'),
+            BudgetDetail(entry=self.other_entry, name='Rate', price=50000, qty=12.5, is_rate=True, unit='%', source='SELF'),
+        ])
+        created[0].price = 300
+        BudgetDetail.objects.bulk_update(created, ['price'])
+        BudgetDetail.objects.filter(pk=created[1].pk).update(is_rate=False, freq=2)
+
+        self.assertEqual(find_amount_drift(), [])
+        amounts = dict(BudgetDetail.objects.values_list('id', 'amount'))
+        self.assertEqual(amounts[created[0].pk], 1350)
+        self.assertEqual(amounts[created[1].pk], 1250000)
+
+    def test_backfill_command_repairs_stale_amounts(self):
+        detail = self._detail(self.entry)
+        BudgetDetail.objects.filter(pk=detail.pk).update(amount=1)
+        out = StringIO()
+        call_command('backfill_detail_amounts', '--check', stdout=out)
+        self.assertIn(f'detail={detail.pk}', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('backfill_detail_amounts', '--check', '--strict', stdout=StringIO())
+
+        call_command('backfill_detail_amounts', '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(find_amount_drift(), [])
+        self.assertEqual(BudgetDetail.objects.get(pk=detail.pk).amount, 6000)
+
+
+class BudgetRollupMaintenanceTest(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name='Rollup Dept', code='RU_D', org_type='dept')
+        self.expense = BudgetSubject.objects.create(code='RU1', name='Rollup Expense', level=4, subject_type='expense')
+        self.income = BudgetSubject.objects.create(code='RU2', name='Rollup Income', level=4, subject_type='income')
+        self.entry = BudgetEntry.objects.create(subject=self.expense, organization=self.org, year=2026, supplemental_round=0)
+
+    def _row(self, status='DRAFT', subject_type='expense'):
+        return BudgetRollup.objects.filter(
+            year=2026, supplemental_round=0, organization=self.org, status=status, subject_type=subject_type,
+        ).first()
+
+    def test_detail_status_and_delete_keep_rollups_consistent(self):
+        detail = BudgetDetail.objects.create(entry=self.entry, name='Item', price=1000, qty=2, freq=1, unit='EA', source='SELF')
+        row = self._row()
+        self.assertEqual((row.entry_count, row.total_amount), (1, 2000))
+
+        detail.price = 1500
+        detail.save()
+        self.assertEqual(self._row().total_amount, 3000)
+
+        self.entry.status = 'PENDING'
+        self.entry.save(update_fields=['status'])
+        self.assertIsNone(self._row('DRAFT'))
+        self.assertEqual(self._row('PENDING').total_amount, 3000)
+
+        income_entry = BudgetEntry.objects.create(subject=self.income, organization=self.org, year=2026, supplemental_round=0)
+        with deferred_totals():
+            BudgetDetail.objects.create(entry=income_entry, name='Fee', price=700, qty=1, freq=1, unit='EA', source='SELF')
+            self.assertEqual(self._row(subject_type='income').total_amount, 0)
+        self.assertEqual(self._row(subject_type='income').total_amount, 700)
+
+        self.entry.delete()
+        self.assertIsNone(self._row('PENDING'))
+        self.assertEqual(find_rollup_drift(year=2026), [])
+        self.assertEqual(
+            sorted(rollup_queryset(2026, 0).values_list('status', 'subject_type')),
+            [('DRAFT', 'income')],
+        )
+
+    def test_overlapping_refreshes_of_one_bucket_upsert_instead_of_colliding(self):
+        BudgetDetail.objects.create(entry=self.entry, name='Item', price=1000, qty=1, freq=1, unit='EA', source='SELF')
+        build_rows = rollups._build_rows
+        calls = []
+
+        def interleaved(aggregated):
+            rows = build_rows(aggregated)
+            if not calls:
+                # a second refresh of the same bucket writes between this one's read and write
+                calls.append(1)
+                refresh_rollups(buckets=[(2026, 0, self.org.id)])
+            return rows
+
+        with mock.patch('budget_mgmt.rollups._build_rows', side_effect=interleaved):
+            refresh_rollups(buckets=[(2026, 0, self.org.id)])
+        self.assertEqual(BudgetRollup.objects.filter(organization=self.org).count(), 1)
+        self.assertEqual(self._row().total_amount, 1000)
+
+        # keys that vanished are deleted, the rest upserted in place
+        row_id = self._row().id
+        BudgetEntry.objects.filter(pk=self.entry.pk).update(status='PENDING')
+        BudgetEntry.objects.create(subject=self.income, organization=self.org, year=2026, supplemental_round=0)
+        refresh_rollups(buckets=[(2026, 0, self.org.id)])
+        self.assertIsNone(self._row())
+        self.assertEqual(self._row('PENDING').total_amount, 1000)
+        self.assertNotEqual(self._row('DRAFT', 'income').id, row_id)
+        self.assertEqual(find_rollup_drift(year=2026), [])
+
+    def test_rebuild_command_repairs_drift(self):
+        BudgetDetail.objects.create(entry=self.entry, name='Item', price=1000, qty=1, freq=1, unit='EA', source='SELF')
+        BudgetRollup.objects.filter(organization=self.org).update(total_amount=1)
+        self.assertEqual(len(find_rollup_drift(year=2026)), 1)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_budget_rollups', '--year', '2026', '--check', stdout=StringIO())
+        call_command('rebuild_budget_rollups', '--year', '2026', stdout=StringIO())
+        self.assertEqual(find_rollup_drift(year=2026), [])
+        self.assertEqual(self._row().total_amount, 1000)
+
+
 class BudgetBookExportServiceTest(TestCase):
     def _make_template(self, include_official_sheets: bool = True) -> Path:
         wb = Workbook()
@@ -896,6 +2284,62 @@ class BudgetBookExportServiceTest(TestCase):
         wb.close()
         return tmp_path
 
+    def test_template_cache_parses_once_and_hands_out_independent_copies(self):
+        cache = TemplateCache()
+        template_path = self._make_template()
+        try:
+            with mock.patch(
+                'budget_mgmt.services.budget_book_template.load_workbook', wraps=load_workbook,
+            ) as parse:
+                first = cache.workbook(template_path)
+                first['예산목별조서']['F3'] = '변경됨'
+                second = cache.workbook(template_path)
+                self.assertEqual(parse.call_count, 1)
+                self.assertEqual(second['예산목별조서']['F3'].value, '기존부서1')
+                self.assertEqual(second['기본재산명세서'].merged_cells.ranges, first['기본재산명세서'].merged_cells.ranges)
+
+                # Same content with a new mtime is not re-parsed; changed content is.
+                os.utime(template_path, ns=(1, 1))
+                cache.workbook(template_path)
+                self.assertEqual(parse.call_count, 1)
+                updated = load_workbook(template_path)
+                updated['예산목별조서']['F3'] = '새부서'
+                updated.save(template_path)
+                parse.reset_mock()
+                self.assertEqual(cache.workbook(template_path)['예산목별조서']['F3'].value, '새부서')
+                self.assertEqual(parse.call_count, 1)
+        finally:
+            template_path.unlink(missing_ok=True)
+
+    def test_write_budget_book_streams_seed_rows_into_destination_file(self):
+        dept = Organization.objects.create(name='스트림부서', code='STRM', org_type='dept')
+        subject = BudgetSubject.objects.create(code='STRM_4', name='목 <A&B>', level=4, subject_type='expense')
+        version = BudgetVersion.objects.create(year=2026, round=0, name='2026년 본예산')
+        BudgetEntry.objects.bulk_create([
+            BudgetEntry(subject=subject, organization=dept, year=2026, supplemental_round=0, total_amount=index)
+            for index in range(600)
+        ])
+
+        template_path = self._make_template()
+        with tempfile.TemporaryDirectory() as out_dir:
+            out_path = Path(out_dir) / 'book.xlsx'
+            try:
+                with override_settings(BUDGET_BOOK_TEMPLATE_PATH=str(template_path)):
+                    _file_name, _disposition, meta = write_budget_book(version, out_path)
+            finally:
+                template_path.unlink(missing_ok=True)
+
+            self.assertEqual(meta['row_count'], 600)
+            wb = load_workbook(out_path)
+            ws = wb['IBMS_기초데이터']
+            self.assertEqual(ws.max_row, 601)
+            self.assertEqual(ws.freeze_panes, 'A2')
+            self.assertEqual(ws['I2'].value, '목 <A&B>')
+            self.assertEqual(sum(ws.cell(row=row, column=14).value for row in range(2, 602)), sum(range(600)))
+            self.assertEqual(wb['IBMS_지출총괄_자동'].cell(row=3, column=7).value, sum(range(600)))
+            self.assertIn('예산목별조서', wb.sheetnames)
+            wb.close()
+
     def test_build_budget_book_file_writes_template_totals_and_seed_sheets(self):
         dept = Organization.objects.create(name='테스트부서', code='TDEP', org_type='dept', sort_order=1)
         Organization.objects.create(name='예비부서', code='SDEP', org_type='dept', sort_order=2)
@@ -1296,6 +2740,78 @@ class BudgetBookExportApiTest(TestCase):
         self.assertIn('IBMS_총인건비_샘플', wb.sheetnames)
         wb.close()
 
+    def test_export_budget_book_is_cached_and_revalidated_with_etag(self):
+        client = APIClient()
+        user = User.objects.create_user(username='book_manager', password='StrongPass!234')
+        UserProfile.objects.create(user=user, role='ADMIN')
+        client.force_authenticate(user=user)
+        dept = Organization.objects.create(name='캐시부서', code='CACHED', org_type='dept')
+        leaf = BudgetSubject.objects.create(code='CACHE_EXP_1', name='캐시지출목', level=4, subject_type='expense')
+        version = BudgetVersion.objects.create(year=2026, round=0, name='2026년 본예산', status='PENDING')
+        entry = BudgetEntry.objects.create(subject=leaf, organization=dept, year=2026, supplemental_round=0)
+        BudgetDetail.objects.create(entry=entry, name='항목', price=1000, qty=1, freq=1)
+        url = f'/api/versions/{version.id}/export-budget-book/'
+
+        template_path = self._make_template()
+        try:
+            with tempfile.TemporaryDirectory() as cache_dir, override_settings(
+                BUDGET_BOOK_TEMPLATE_PATH=str(template_path), BUDGET_BOOK_CACHE_DIR=cache_dir,
+            ):
+                first = client.get(url)
+                first_bytes = b''.join(first.streaming_content)
+                second = client.get(url)
+                second_bytes = b''.join(second.streaming_content)
+                not_modified = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+                BudgetDetail.objects.create(entry=entry, name='추가', price=500, qty=1, freq=1)
+                changed = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+                b''.join(changed.streaming_content)
+                self.assertEqual(len(list(Path(cache_dir).glob('*.xlsx'))), 2)
+                self.assertEqual(evict_budget_book_cache(max_bytes=0, keep=changed['ETag'].strip('"')), 1)
+                self.assertEqual(len(list(Path(cache_dir).glob('*.xlsx'))), 1)
+        finally:
+            template_path.unlink(missing_ok=True)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['X-Export-Cache'], 'miss')
+        self.assertEqual(second['X-Export-Cache'], 'hit')
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertEqual(first_bytes, second_bytes)
+        self.assertIn('filename*=', second['Content-Disposition'])
+        self.assertGreaterEqual(int(second['X-Export-Template-Overrides']), 3)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_cache_key_tracks_moves_renames_and_descriptions(self):
+        dept = Organization.objects.create(name='키부서', code='KEYDEP', org_type='dept')
+        other = Organization.objects.create(name='키부서2', code='KEYDEP2', org_type='dept')
+        leaf = BudgetSubject.objects.create(code='KEY_EXP_1', name='키지출목', level=4, subject_type='expense')
+        project = EntrustedProject.objects.create(organization=dept, year=2026, code='KEY_P', name='사업')
+        version = BudgetVersion.objects.create(year=2026, round=0, name='2026년 본예산', status='PENDING')
+        entry = BudgetEntry.objects.create(subject=leaf, organization=dept, entrusted_project=project, year=2026)
+        detail = BudgetDetail.objects.create(entry=entry, name='항목', price=1000, qty=1, freq=1)
+
+        template_path = self._make_template()
+        try:
+            keys = [budget_book_cache_key(version, template_path)]
+            BudgetEntry.objects.filter(pk=entry.pk).update(organization=other)
+            keys.append(budget_book_cache_key(version, template_path))
+            EntrustedProject.objects.filter(pk=project.pk).update(name='새 사업')
+            keys.append(budget_book_cache_key(version, template_path))
+            leaf.description = '설명'
+            leaf.save(update_fields=['description'])
+            keys.append(budget_book_cache_key(version, template_path))
+            detail.name = '새 항목'
+            BudgetDetail.objects.bulk_update([detail], ['name'])
+            keys.append(budget_book_cache_key(version, template_path))
+            keys.append(budget_book_cache_key(version, template_path))
+        finally:
+            template_path.unlink(missing_ok=True)
+
+        self.assertEqual(len(set(keys[:-1])), 5)
+        self.assertEqual(keys[-1], keys[-2])
+
 
 class BudgetBookExportAuditCommandTest(TestCase):
     def _make_template(self) -> Path:
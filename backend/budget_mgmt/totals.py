@@ -0,0 +1,487 @@
+"""
+Incremental maintenance of BudgetEntry total/executed/remaining amounts.
+
+Detail and execution writes apply F() deltas (new amount - stored amount) to
+the parent entry instead of re-reading every child row. The stored row is
+locked before it changes so concurrent edits of the same detail cannot apply
+a delta against a stale "old" value. ``find_total_drift`` recomputes totals
+from scratch and reports (or fixes) entries whose stored values diverged.
+
+``deferred_totals()`` switches the per-row handlers off for bulk loads: it
+only collects the touched entry ids and recomputes them with one aggregate
+UPDATE per batch right before its transaction commits.
+
+Detail amounts are summed from the stored ``BudgetDetail.amount`` column.
+``detail_amount_expression()`` is the SQL form of ``total_price`` used to fill
+that column in bulk UPDATEs, backfills and the amount consistency check.
+"""
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connections, router, transaction
+from django.db.models import BigIntegerField, BooleanField, Case, ExpressionWrapper, F, FloatField, Func, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+TOTAL_FIELDS = ('total_amount', 'executed_amount', 'remaining_amount')
+# BudgetDetail columns that feed the stored ``amount`` column.
+DETAIL_AMOUNT_FIELDS = ('price', 'qty', 'freq', 'is_rate')
+AMOUNT_BACKFILL_BATCH_SIZE = 5000
+RECOMPUTE_BATCH_SIZE = 500
+
+_deferred = threading.local()
+
+
+def detail_amount(price, qty, freq, is_rate):
+    """Amount of a single detail line (same rule as BudgetDetail.total_price)."""
+    price = price or 0
+    qty = qty or 0
+    if is_rate:
+        return int(price * (qty / 100))
+    return int(price * qty * (freq or 0))
+
+
+class TruncToInt(Func):
+    """Truncate a float toward zero like Python's ``int()`` (CAST alone rounds on some backends)."""
+
+    template = 'CAST(%(expressions)s AS INTEGER)'
+    output_field = BigIntegerField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(TRUNC(%(expressions)s) AS BIGINT)', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(TRUNCATE(%(expressions)s, 0) AS SIGNED)', **extra_context)
+
+
+def detail_amount_expression(prefix='', **overrides):
+    """
+    Database-side ``BudgetDetail.total_price`` (both the is_rate and the
+    price*qty*freq branch, truncated per row). ``prefix`` is the lookup path
+    to the detail, e.g. ``'details__'`` when aggregating from BudgetEntry.
+    ``overrides`` replace column references with new values, so an UPDATE
+    can set ``amount`` from the values it is writing in the same statement.
+    """
+    def column(name):
+        if name not in overrides:
+            return F(f'{prefix}{name}')
+        value = overrides[name]
+        return value if hasattr(value, 'resolve_expression') else Value(value)
+
+    price = column('price')
+    qty = Coalesce(column('qty'), Value(0.0))
+    rate_amount = price * (qty / Value(100.0))
+    plain_amount = price * qty * Coalesce(column('freq'), Value(0))
+    if 'is_rate' not in overrides:
+        is_rate = Q(**{f'{prefix}is_rate': True})
+    elif hasattr(overrides['is_rate'], 'resolve_expression'):
+        is_rate = ExpressionWrapper(overrides['is_rate'], output_field=BooleanField())
+    else:
+        is_rate = Value(bool(overrides['is_rate']))
+    amount = Case(When(is_rate, then=rate_amount), default=plain_amount, output_field=FloatField())
+    return TruncToInt(Coalesce(amount, Value(0.0)))
+
+
+def detail_amount_sum(prefix=''):
+    """``SUM(amount)`` over details that yields 0 (not NULL) for empty groups."""
+    return Coalesce(Sum(f'{prefix}amount'), Value(0), output_field=BigIntegerField())
+
+
+def _db_for_write(instance, using=None):
+    return using or router.db_for_write(type(instance), instance=instance)
+
+
+def stored_detail_amount(detail, using):
+    if detail.pk is None:
+        return None
+    row = (
+        type(detail)._base_manager.using(using)
+        .select_for_update()
+        .filter(pk=detail.pk)
+        .values('entry_id', 'amount')
+        .first()
+    )
+    if row is None:
+        return None
+    return row['entry_id'], int(row['amount'] or 0)
+
+
+def stored_execution_amount(execution, using):
+    if execution.pk is None:
+        return None
+    row = (
+        type(execution)._base_manager.using(using)
+        .select_for_update()
+        .filter(pk=execution.pk)
+        .values('entry_id', 'amount')
+        .first()
+    )
+    if row is None:
+        return None
+    return row['entry_id'], int(row['amount'] or 0)
+
+
+def locked_write(instance, write, capture, *, using=None):
+    """
+    Run ``write()`` (a save/delete of a detail or execution) in a transaction
+    after locking the stored row and remembering its (entry_id, amount) via
+    ``capture``. The post_save/post_delete receivers read the remembered value
+    to build the delta.
+    """
+    using = _db_for_write(instance, using)
+    with transaction.atomic(using=using):
+        instance._totals_previous = capture(instance, using)
+        try:
+            return write()
+        finally:
+            instance._totals_previous = None
+
+
+def apply_entry_delta(entry_id, *, total=0, executed=0, using=None):
+    """Shift one entry's totals by the given deltas in a single UPDATE."""
+    if not entry_id or (not total and not executed):
+        return 0
+    from . import rollups
+    from .models import BudgetEntry
+
+    using = using or router.db_for_write(BudgetEntry)
+    updated = BudgetEntry.objects.using(using).filter(pk=entry_id).update(
+        total_amount=F('total_amount') + total,
+        executed_amount=F('executed_amount') + executed,
+        remaining_amount=F('remaining_amount') + (total - executed),
+    )
+    if updated:
+        rollups.apply_amount_delta(entry_id, total=total, executed=executed, using=using)
+    return updated
+
+
+def _sync_cached_entry(instance, entry_id, total, executed):
+    # Keep an already-loaded ``instance.entry`` in step with the database so
+    # callers reading it after save do not see pre-delta values.
+    field = instance._meta.get_field('entry')
+    if not field.is_cached(instance):
+        return
+    entry = field.get_cached_value(instance)
+    if entry is None or entry.pk != entry_id:
+        return
+    entry.total_amount = int(entry.total_amount or 0) + total
+    entry.executed_amount = int(entry.executed_amount or 0) + executed
+    entry.remaining_amount = int(entry.remaining_amount or 0) + (total - executed)
+
+
+def _apply_change(instance, previous, current, *, kind, using):
+    """
+    previous/current: (entry_id, amount) or None.
+    kind: 'total' for details, 'executed' for executions.
+    """
+    if _deferred_ids() is not None:
+        mark_entries_dirty(
+            item[0] for item in (previous, current) if item is not None and item[0]
+        )
+        return
+    deltas = defaultdict(int)
+    if previous is not None and previous[0]:
+        deltas[previous[0]] -= previous[1]
+    if current is not None and current[0]:
+        deltas[current[0]] += current[1]
+    for entry_id, delta in deltas.items():
+        if not delta:
+            continue
+        if kind == 'total':
+            apply_entry_delta(entry_id, total=delta, using=using)
+            _sync_cached_entry(instance, entry_id, delta, 0)
+        else:
+            apply_entry_delta(entry_id, executed=delta, using=using)
+            _sync_cached_entry(instance, entry_id, 0, delta)
+
+
+def _previous_or_loaded(instance, loaded):
+    previous = getattr(instance, '_totals_previous', None)
+    return previous if previous is not None else loaded
+
+
+def on_detail_saved(detail, using=None):
+    current = (detail.entry_id, int(detail.amount or 0))
+    _apply_change(detail, getattr(detail, '_totals_previous', None), current, kind='total', using=using)
+
+
+def on_detail_deleted(detail, using=None):
+    previous = _previous_or_loaded(detail, (detail.entry_id, int(detail.amount or 0)))
+    _apply_change(detail, previous, None, kind='total', using=using)
+
+
+def on_execution_saved(execution, using=None):
+    current = (execution.entry_id, int(execution.amount or 0))
+    _apply_change(execution, getattr(execution, '_totals_previous', None), current, kind='executed', using=using)
+
+
+def on_execution_deleted(execution, using=None):
+    previous = _previous_or_loaded(execution, (execution.entry_id, int(execution.amount or 0)))
+    _apply_change(execution, previous, None, kind='executed', using=using)
+
+
+def compute_entry_totals(entry_ids=None):
+    """
+    Full recompute from child rows with one grouped query per child table.
+    Returns {entry_id: (total_amount, executed_amount)} for entries that have
+    at least one detail or execution (missing ids mean 0/0).
+    """
+    from .models import BudgetDetail, BudgetExecution
+
+    details = BudgetDetail.objects.all()
+    executions = BudgetExecution.objects.all()
+    if entry_ids is not None:
+        entry_ids = list(entry_ids)
+        details = details.filter(entry_id__in=entry_ids)
+        executions = executions.filter(entry_id__in=entry_ids)
+
+    totals = {
+        row['entry_id']: int(row['total'] or 0)
+        for row in details.values('entry_id').annotate(total=detail_amount_sum()).order_by()
+    }
+
+    executed = {
+        row['entry_id']: int(row['total'] or 0)
+        for row in executions.values('entry_id').annotate(total=Sum('amount')).order_by()
+    }
+    result = {}
+    for entry_id in set(totals) | set(executed):
+        result[entry_id] = (totals.get(entry_id, 0), executed.get(entry_id, 0))
+    return result
+
+
+def find_total_drift(queryset=None, *, fix=False, chunk_size=2000):
+    """
+    Compare stored entry totals with a full recompute.
+
+    Returns a list of drift records. With ``fix=True`` the drifted entries are
+    rewritten with the recomputed values (only the three total columns).
+    """
+    from . import rollups
+    from .models import BudgetEntry
+
+    if queryset is None:
+        queryset = BudgetEntry.objects.all()
+
+    drift = []
+    stored_rows = queryset.order_by('id').values_list('id', *TOTAL_FIELDS)
+    batch = []
+
+    def check(batch_rows):
+        expected = compute_entry_totals([row[0] for row in batch_rows])
+        for entry_id, total_amount, executed_amount, remaining_amount in batch_rows:
+            exp_total, exp_executed = expected.get(entry_id, (0, 0))
+            exp_remaining = exp_total - exp_executed
+            if (total_amount, executed_amount, remaining_amount) == (exp_total, exp_executed, exp_remaining):
+                continue
+            drift.append({
+                'entry_id': entry_id,
+                'stored': {
+                    'total_amount': total_amount,
+                    'executed_amount': executed_amount,
+                    'remaining_amount': remaining_amount,
+                },
+                'expected': {
+                    'total_amount': exp_total,
+                    'executed_amount': exp_executed,
+                    'remaining_amount': exp_remaining,
+                },
+            })
+
+    for row in stored_rows.iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            check(batch)
+            batch = []
+    if batch:
+        check(batch)
+
+    if fix and drift:
+        with transaction.atomic():
+            for item in drift:
+                expected = item['expected']
+                BudgetEntry.objects.filter(pk=item['entry_id']).update(**expected)
+            rollups.mark_rollup_entries([item['entry_id'] for item in drift])
+        logger.warning('entry totals drift fixed: %s entries', len(drift))
+    return drift
+
+
+class _DeferredState:
+    def __init__(self):
+        self.entry_ids = set()  # totals to recompute
+        self.rollup_entry_ids = set()  # rollup buckets to refresh, by entry
+        self.rollup_buckets = set()  # rollup buckets to refresh, (year, round, org_id)
+
+
+def deferred_state():
+    """Active ``deferred_totals()`` state of this thread, or None."""
+    return getattr(_deferred, 'state', None)
+
+
+def _deferred_ids():
+    state = deferred_state()
+    return state.entry_ids if state is not None else None
+
+
+def mark_entries_dirty(entry_ids, *, using=None):
+    """
+    Flag entries whose details/executions changed without per-row handlers
+    (bulk_create, queryset.update, ...). Inside ``deferred_totals()`` they are
+    recomputed on exit; otherwise right away.
+    """
+    pending = _deferred_ids()
+    if pending is not None:
+        pending.update(entry_id for entry_id in entry_ids if entry_id)
+        return
+    recompute_entry_totals(entry_ids, using=using)
+
+
+@contextmanager
+def deferred_totals(using=None):
+    """
+    Defer entry total maintenance for a bulk block (context manager or
+    decorator). The block runs in ``transaction.atomic``; touched entries are
+    recomputed in aggregate (and their rollup buckets refreshed) as the last
+    statements before commit. Nested use joins the outermost block.
+    """
+    if deferred_state() is not None:
+        yield
+        return
+
+    from . import rollups
+    from .models import BudgetEntry
+
+    using = using or router.db_for_write(BudgetEntry)
+    state = _DeferredState()
+    _deferred.state = state
+    try:
+        with transaction.atomic(using=using):
+            yield
+            _deferred.state = None
+            recompute_entry_totals(state.entry_ids, using=using, refresh_rollups=False)
+            rollups.refresh_rollups(
+                entry_ids=state.entry_ids | state.rollup_entry_ids,
+                buckets=state.rollup_buckets,
+                using=using,
+            )
+    finally:
+        _deferred.state = None
+
+
+def recompute_entry_totals(entry_ids, *, using=None, batch_size=RECOMPUTE_BATCH_SIZE, refresh_rollups=True):
+    """
+    Recompute totals for the given entries from their child rows with one
+    ``UPDATE ... FROM (SELECT entry_id, SUM(...))`` statement per batch.
+    Returns the number of entries updated.
+    """
+    from . import rollups
+    from .models import BudgetEntry
+
+    entry_ids = sorted({int(entry_id) for entry_id in entry_ids if entry_id})
+    if not entry_ids:
+        return 0
+    using = using or router.db_for_write(BudgetEntry)
+    connection = connections[using]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        updated = _recompute_entry_totals_orm(entry_ids, using=using)
+    else:
+        updated = _recompute_entry_totals_sql(entry_ids, connection, batch_size)
+    if refresh_rollups:
+        rollups.mark_rollup_entries(entry_ids, using=using)
+    return updated
+
+
+def _recompute_entry_totals_sql(entry_ids, connection, batch_size):
+    from .models import BudgetDetail, BudgetEntry, BudgetExecution
+
+    entry_table = connection.ops.quote_name(BudgetEntry._meta.db_table)
+
+    def grouped_sql(queryset):
+        return queryset.order_by().query.get_compiler(using=connection.alias).as_sql()
+
+    updated = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(entry_ids), batch_size):
+            batch = entry_ids[start:start + batch_size]
+            placeholders = ', '.join(['%s'] * len(batch))
+            detail_sql, detail_params = grouped_sql(
+                BudgetDetail.objects.using(connection.alias).filter(entry_id__in=batch)
+                .values('entry_id').annotate(total=Sum('amount'))
+            )
+            execution_sql, execution_params = grouped_sql(
+                BudgetExecution.objects.using(connection.alias).filter(entry_id__in=batch)
+                .values('entry_id').annotate(executed=Sum('amount'))
+            )
+            sql = (
+                f'UPDATE {entry_table} SET '
+                f'total_amount = agg.total, '
+                f'executed_amount = agg.executed, '
+                f'remaining_amount = agg.total - agg.executed '
+                f'FROM ('
+                f'SELECT e.id AS entry_id, COALESCE(dt.total, 0) AS total, COALESCE(ex.executed, 0) AS executed '
+                f'FROM {entry_table} e '
+                f'LEFT JOIN ({detail_sql}) dt ON dt.entry_id = e.id '
+                f'LEFT JOIN ({execution_sql}) ex ON ex.entry_id = e.id '
+                f'WHERE e.id IN ({placeholders})'
+                f') agg '
+                f'WHERE {entry_table}.id = agg.entry_id'
+            )
+            cursor.execute(sql, (*detail_params, *execution_params, *batch))
+            updated += max(cursor.rowcount, 0)
+    return updated
+
+
+def _recompute_entry_totals_orm(entry_ids, *, using):
+    from .models import BudgetEntry
+
+    expected = compute_entry_totals(entry_ids)
+    with transaction.atomic(using=using):
+        for entry_id in entry_ids:
+            total_amount, executed_amount = expected.get(entry_id, (0, 0))
+            BudgetEntry.objects.using(using).filter(pk=entry_id).update(
+                total_amount=total_amount,
+                executed_amount=executed_amount,
+                remaining_amount=total_amount - executed_amount,
+            )
+    return len(entry_ids)
+
+
+def find_amount_drift(queryset=None):
+    """Details whose stored ``amount`` differs from the recomputed total_price."""
+    from .models import BudgetDetail
+
+    queryset = BudgetDetail.objects.all() if queryset is None else queryset
+    rows = (
+        queryset.exclude(amount=detail_amount_expression())
+        .annotate(expected=detail_amount_expression())
+        .values_list('id', 'entry_id', 'amount', 'expected')
+        .order_by('id')
+    )
+    return [
+        {'detail_id': detail_id, 'entry_id': entry_id, 'stored': int(amount or 0), 'expected': int(expected or 0)}
+        for detail_id, entry_id, amount, expected in rows
+    ]
+
+
+def backfill_detail_amounts(queryset=None, *, batch_size=AMOUNT_BACKFILL_BATCH_SIZE):
+    """
+    Rewrite ``amount`` from price/qty/freq/is_rate in primary-key ranges of
+    ``batch_size`` (one short UPDATE per range). Returns the rows changed.
+    """
+    from .models import BudgetDetail
+
+    queryset = BudgetDetail.objects.all() if queryset is None else queryset
+    bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return 0
+    updated = 0
+    for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+        updated += (
+            queryset.filter(id__gte=start, id__lt=start + batch_size)
+            .exclude(amount=detail_amount_expression())
+            .update(amount=detail_amount_expression())
+        )
+    return updated
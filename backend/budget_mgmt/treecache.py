@@ -0,0 +1,195 @@
+"""
+In-memory hierarchy indexes (see orgtree.py and subjecttree.py).
+
+``ForestIndex`` precomputes ancestors and subtrees of a parent-pointer
+forest. ``ProcessTreeCache`` keeps one index per process.
+
+Each index is built by a loader and tagged with a generation; every
+process rebuilds on its next ``get()`` after ``invalidate()`` bumps it, or
+once the index is older than its max-age setting. With a shared cache
+(Redis) the generation is a cache key, bumped again on commit so no process
+keeps an index loaded before the change became visible. A per-process cache
+(LocMemCache, REDIS_URL unset) cannot tell other workers, so there it is a
+TreeGeneration row rewritten in the changing transaction and read at most
+once per request.
+"""
+import dataclasses
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.signals import request_finished, request_started
+from django.db import IntegrityError, router, transaction
+
+_request = threading.local()
+
+
+def _start_request_memo(**kwargs):
+    _request.generations = {}
+
+
+def _end_request_memo(**kwargs):
+    _request.generations = None
+
+
+request_started.connect(_start_request_memo)
+request_finished.connect(_end_request_memo)
+
+
+def _per_process_cache():
+    return isinstance(caches['default'], LocMemCache)
+
+
+class ProcessTreeCache:
+    def __init__(self, name, loader, max_age_setting):
+        self.name = name
+        self.generation_key = f'{name}:generation'
+        self.loader = loader
+        self.max_age_setting = max_age_setting
+        self._lock = threading.Lock()
+        self._cached = None  # (generation, built_at, index)
+
+    def _db_generation(self):
+        from .models import TreeGeneration
+
+        memo = getattr(_request, 'generations', None)
+        if memo is not None and self.name in memo:
+            return memo[self.name]
+        generation = TreeGeneration.objects.filter(name=self.name).values_list('generation', flat=True).first() or ''
+        if memo is not None:
+            memo[self.name] = generation
+        return generation
+
+    def _bump_db_generation(self, using=None):
+        # A fresh token rather than a counter: a rolled-back bump is never reused
+        from .models import TreeGeneration
+
+        using = using or router.db_for_write(TreeGeneration)
+        generation = uuid.uuid4().hex
+        rows = TreeGeneration.objects.using(using).filter(name=self.name)
+        if not rows.update(generation=generation):
+            try:
+                with transaction.atomic(using=using):
+                    TreeGeneration.objects.using(using).create(name=self.name, generation=generation)
+            except IntegrityError:
+                rows.update(generation=generation)
+        memo = getattr(_request, 'generations', None)
+        if memo is not None:
+            memo.pop(self.name, None)
+
+    def generation(self):
+        if _per_process_cache():
+            return self._db_generation()
+        generation = cache.get(self.generation_key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            if not cache.add(self.generation_key, generation, None):
+                generation = cache.get(self.generation_key, generation)
+        return generation
+
+    def get(self):
+        generation = self.generation()
+        max_age = getattr(settings, self.max_age_setting)
+        current = self._cached
+        if current is not None and current[0] == generation and time.monotonic() - current[1] < max_age:
+            return current[2]
+        with self._lock:
+            index = self.loader()
+            self._cached = (generation, time.monotonic(), index)
+        return index
+
+    def _bump(self):
+        cache.set(self.generation_key, uuid.uuid4().hex, None)
+        self._cached = None
+
+    def invalidate(self, using=None):
+        if _per_process_cache():
+            # Visible to other workers exactly when the change commits
+            self._bump_db_generation(using)
+            self._cached = None
+            return
+        self._bump()
+        transaction.on_commit(self._bump, using=using)
+
+
+class ForestIndex:
+    """Ancestors/subtrees of a parent-pointer forest of nodes with id, parent_id and sort_order."""
+
+    def __init__(self, nodes):
+        nodes = sorted(nodes, key=lambda n: (n.sort_order, n.id))  # Meta.ordering of both models
+        self.nodes = {node.id: node for node in nodes}
+        self._children = {}
+        for node in nodes:
+            parent_id = node.parent_id if node.parent_id in self.nodes else None
+            self._children.setdefault(parent_id, []).append(node.id)
+
+        # Depth-first from the roots; a node caught in a parent cycle becomes a root.
+        self._ancestors = {}
+        order = []
+        for start in self._children.get(None, []) + list(self.nodes):
+            if start in self._ancestors:
+                continue
+            self._ancestors[start] = ()
+            pending = [start]
+            while pending:
+                node_id = pending.pop()
+                order.append(node_id)
+                for child_id in self._children.get(node_id, ()):
+                    if child_id not in self._ancestors:
+                        self._ancestors[child_id] = (node_id,) + self._ancestors[node_id]
+                        pending.append(child_id)
+        self._subtree = {node_id: {node_id} for node_id in order}
+        for node_id in reversed(order):
+            ancestors = self._ancestors[node_id]
+            if ancestors:
+                self._subtree[ancestors[0]] |= self._subtree[node_id]
+        self._subtree = {node_id: frozenset(ids) for node_id, ids in self._subtree.items()}
+        self._digest = None
+
+    def __contains__(self, node_id):
+        return node_id in self.nodes
+
+    def get(self, node_id):
+        return self.nodes.get(node_id)
+
+    def children(self, node_id):
+        """Direct children ids in sort order (``None`` for top-level nodes)."""
+        return tuple(self._children.get(node_id, ()))
+
+    def ancestors(self, node_id):
+        """Ancestor ids, nearest parent first."""
+        return self._ancestors.get(node_id, ())
+
+    def subtree(self, node_id):
+        """The node id and all of its descendant ids (empty for unknown ids)."""
+        return self._subtree.get(node_id, frozenset())
+
+    def descendants(self, node_id):
+        return self.subtree(node_id) - {node_id}
+
+    def depth(self, node_id):
+        return len(self._ancestors.get(node_id, ()))
+
+    def root_id(self, node_id):
+        ancestors = self._ancestors.get(node_id)
+        if ancestors is None:
+            return None
+        return ancestors[-1] if ancestors else node_id
+
+    def digest(self):
+        """Hash of every node's fields; equal trees give equal digests in any process."""
+        if self._digest is None:
+            payload = repr(sorted(dataclasses.astuple(node) for node in self.nodes.values()))
+            self._digest = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+        return self._digest
+
+    def closure_rows(self):
+        """(ancestor_id, descendant_id, depth) for every pair, including self at depth 0."""
+        for node_id, ancestors in self._ancestors.items():
+            yield node_id, node_id, 0
+            for distance, ancestor_id in enumerate(ancestors, start=1):
+                yield ancestor_id, node_id, distance
@@ -18,11 +18,15 @@ router.register(r'notifications', NotificationViewSet)
 router.register(r'erpnext', ERPNextViewSet, basename='erpnext')
 router.register(r'comments', SubmissionCommentViewSet, basename='comments')
 router.register(r'supporting-docs', SupportingDocumentViewSet, basename='supporting-docs')
+router.register(r'imports', BudgetImportViewSet, basename='imports')
+router.register(r'jobs', JobViewSet, basename='jobs')
 
 urlpatterns = [
     path('auth/signup/', AuthSignUpView.as_view()),
     path('auth/login/', AuthLoginView.as_view()),
     path('auth/logout/', AuthLogoutView.as_view()),
+    path('auth/sessions/', AuthSessionsView.as_view()),
+    path('auth/sessions/<int:token_id>/', AuthSessionDetailView.as_view()),
     path('auth/me/', AuthMeView.as_view()),
     path('auth/find-id/', AuthFindIdView.as_view()),
     path('auth/withdraw/', AuthWithdrawView.as_view()),
@@ -2,27 +2,48 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.http import HttpResponse
-from .models import Organization, BudgetSubject, BudgetEntry, BudgetDetail, BudgetTransfer, ApprovalLog, Notification, UserProfile, BudgetExecution, SpendingLimitRule, BudgetVersion, EntrustedProject, SubmissionComment, SupportingDocument
+from rest_framework.pagination import CursorPagination
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from .models import AuthToken, Organization, BudgetSubject, BudgetEntry, BudgetDetail, BudgetTransfer, ApprovalLog, Notification, UserProfile, BudgetExecution, SpendingLimitRule, BudgetVersion, EntrustedProject, SubmissionComment, SupportingDocument, Job
 from .serializers import *
 from .calculation import parse_calc_expression
 from django.db import transaction, IntegrityError, DatabaseError
-from django.db.models import Sum, Max, Q, F, Prefetch
+from django.db.models import CharField, Sum, Max, Q, F, Value
+from django.db.models.functions import Cast, Concat
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
 from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
-from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import ValidationError as DRFValidationError, PermissionDenied, APIException
 from .erpnext_client import get_erpnext_client, ERPNextError
-from .audit import write_audit_log
+from .jobs import cancel_job, defer_request, is_resumable, resume_job
+from .audit import record_entry_activity, write_audit_log
+from .authentication import issue_token, revoke_tokens, revoke_user_tokens
+from .log_archive import LogFilter, LogHistory
+from .log_export import CONTENT_TYPES, export_lines, iter_export_rows
+from .orgtree import get_org_tree, invalidate_org_tree
+from .scope import cached_org_scope
+from .subjecttree import batched_invalidation, get_subject_tree, invalidate_subject_tree, subtree_ids_from_db
+from .annotations import comment_status_annotations, entry_summary_annotations
+from .totals import deferred_totals, mark_entries_dirty
+from .rollups import mark_rollup_entries, rollup_queryset
+from .services.budget_book_cache import budget_book_cache_key, get_budget_book
+from .services.budget_book_export import XLSX_CONTENT_TYPE
+from .services.budget_import import start_import_job, store_upload
+from .services.project_clone import ProjectClonePlan, clone_projects, generate_project_codes
+from .services.version_clone import clone_entries_into_version, start_clone_job
 from pathlib import Path
+from django.core.files import File
+from django.core.files.storage import default_storage
+import tempfile
 import json
 import re
 import logging
+import time
 import uuid
 
 USERNAME_RE = re.compile(r'^[a-zA-Z0-9_.-]{4,50}$')
@@ -74,6 +95,7 @@ def _scope_org_ids_for_user(user_or_request):
     Returns:
       - None: unrestricted scope (ADMIN)
       - set[int]: allowed organization ids
+    Memoized per request and in the shared cache (see scope.py).
     """
     if _is_admin(user_or_request):
         return None
@@ -81,28 +103,20 @@ def _scope_org_ids_for_user(user_or_request):
     profile = getattr(user, 'profile', None)
     if profile is None:
         return set()
+    return cached_org_scope(user, profile, _resolve_scope_org_ids)
 
-    scope = set()
-    if getattr(profile, 'team_id', None):
-        scope.add(int(profile.team_id))
-        return scope
+
+def _resolve_scope_org_ids(profile):
+    # A team or department sees its whole subtree (any depth), see orgtree.py.
+    tree = get_org_tree()
+    team_id = getattr(profile, 'team_id', None)
+    if team_id:
+        return set(tree.subtree(int(team_id)) or {int(team_id)})
 
     org_id = getattr(profile, 'organization_id', None)
     if org_id is None:
-        return scope
-
-    org = Organization.objects.filter(id=org_id).only('id', 'org_type', 'parent_id').first()
-    if org is None:
-        return scope
-    if _is_team_organization(org):
-        scope.add(int(org.id))
-        return scope
-
-    scope.add(int(org.id))
-    scope.update(
-        Organization.objects.filter(parent_id=org.id).values_list('id', flat=True)
-    )
-    return scope
+        return set()
+    return set(tree.subtree(int(org_id)))
 
 
 def _org_in_scope(user_or_request, organization_id):
@@ -134,6 +148,27 @@ def _require_roles_response(request, allowed_roles, *, message='No permission'):
     return Response({'error': message}, status=status.HTTP_403_FORBIDDEN)
 
 
+def _as_int(value, default=None):
+    try:
+        if value is None or value == '':
+            return default
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _wants_background(request):
+    data = request.data if hasattr(request.data, 'get') else {}
+    value = data.get('background', request.query_params.get('background'))
+    return str(value or '').strip().lower() in ('1', 'true', 'yes')
+
+
+def _deferred_response(request):
+    """Queue the request as a background job and answer 202 with the job."""
+    job = defer_request(request)
+    return Response({'job': JobSerializer(job).data}, status=status.HTTP_202_ACCEPTED)
+
+
 def _is_team_organization(org):
     if not org:
         return False
@@ -254,7 +289,7 @@ class AuthSignUpView(APIView):
         )
         default_role = 'ADMIN' if not UserProfile.objects.exists() else 'STAFF'
         UserProfile.objects.create(user=user, organization=organization, team=team, role=default_role)
-        token, _ = Token.objects.get_or_create(user=user)
+        _token, key = issue_token(user, request)
         _log_auth_event(
             request,
             action='SIGNUP',
@@ -263,7 +298,7 @@ class AuthSignUpView(APIView):
             status_code=status.HTTP_201_CREATED,
             metadata={'username': user.username, 'email': user.email},
         )
-        return Response({'token': token.key, **_serialize_user_context(user)}, status=status.HTTP_201_CREATED)
+        return Response({'token': key, **_serialize_user_context(user)}, status=status.HTTP_201_CREATED)
 
 
 class AuthLoginView(APIView):
@@ -299,8 +334,8 @@ class AuthLoginView(APIView):
             )
             return Response({'error': 'invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        Token.objects.filter(user=user).delete()
-        token = Token.objects.create(user=user)
+        # Each login is its own device session; other sessions stay signed in.
+        token, key = issue_token(user, request, name=request.data.get('device'))
         _log_auth_event(
             request,
             action='LOGIN',
@@ -309,7 +344,7 @@ class AuthLoginView(APIView):
             status_code=status.HTTP_200_OK,
             metadata={'identifier': identifier},
         )
-        return Response({'token': token.key, **_serialize_user_context(user)})
+        return Response({'token': key, 'expires_at': token.expires_at, **_serialize_user_context(user)})
 
 
 class AuthLogoutView(APIView):
@@ -323,10 +358,47 @@ class AuthLogoutView(APIView):
             reason='logout',
             status_code=status.HTTP_200_OK,
         )
-        Token.objects.filter(user=request.user).delete()
+        logout_all = str(request.data.get('all') or '').strip().lower() in ('1', 'true', 'yes')
+        if isinstance(request.auth, AuthToken) and not logout_all:
+            revoke_tokens(AuthToken.objects.filter(pk=request.auth.pk))
+        else:
+            revoke_user_tokens(request.user)
         return Response({'status': 'logged_out'})
 
 
+class AuthSessionsView(APIView):
+    """The current user's active device sessions."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        current_id = getattr(request.auth, 'pk', None)
+        tokens = AuthToken.objects.filter(user=request.user, revoked_at__isnull=True).filter(
+            Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())
+        )
+        return Response([
+            {
+                'id': token.id,
+                'name': token.name,
+                'key_prefix': token.key_prefix,
+                'ip_address': token.ip_address,
+                'created_at': token.created_at,
+                'last_used_at': token.last_used_at,
+                'expires_at': token.expires_at,
+                'current': token.id == current_id,
+            }
+            for token in tokens
+        ])
+
+
+class AuthSessionDetailView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def delete(self, request, token_id):
+        if not revoke_tokens(AuthToken.objects.filter(pk=token_id, user=request.user)):
+            return Response({'error': 'session not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': 'revoked'})
+
+
 class AuthMeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -343,7 +415,7 @@ class AuthWithdrawView(APIView):
         if not request.user.check_password(password):
             return Response({'error': 'password mismatch'}, status=status.HTTP_400_BAD_REQUEST)
         user = request.user
-        Token.objects.filter(user=user).delete()
+        revoke_user_tokens(user)
         user.delete()
         return Response({'status': 'withdrawn'})
 
@@ -569,7 +641,7 @@ class AuthAdminUserDetailView(APIView):
             except DjangoValidationError as exc:
                 return Response({'error': 'invalid password', 'details': list(exc.messages)}, status=status.HTTP_400_BAD_REQUEST)
             user.set_password(reset_password)
-            Token.objects.filter(user=user).delete()
+            revoke_user_tokens(user)
         user.save()
 
         profile, _ = UserProfile.objects.get_or_create(user=user, defaults={'role': 'STAFF'})
@@ -628,7 +700,7 @@ class AuthAdminUserDetailView(APIView):
         if user.id == request.user.id:
             return Response({'error': 'cannot delete yourself'}, status=status.HTTP_400_BAD_REQUEST)
         target_username = user.username
-        Token.objects.filter(user=user).delete()
+        revoke_user_tokens(user)
         user.delete()
         write_audit_log(
             request=request,
@@ -661,9 +733,10 @@ class AuthChangePasswordView(APIView):
 
         request.user.set_password(new_password)
         request.user.save()
-        Token.objects.filter(user=request.user).delete()
-        token = Token.objects.create(user=request.user)
-        return Response({'status': 'password_changed', 'token': token.key})
+        # Every session signs in again; this device gets a fresh token.
+        revoke_user_tokens(request.user)
+        _token, key = issue_token(request.user, request, name=getattr(request.auth, 'name', ''))
+        return Response({'status': 'password_changed', 'token': key})
 
 
 class AuthPasswordPolicyView(APIView):
@@ -764,6 +837,7 @@ class OrganizationViewSet(viewsets.ModelViewSet):
                 updated.append(obj)
         if updated:
             Organization.objects.bulk_update(updated, ['sort_order'])
+            invalidate_org_tree()
         return Response({'updated': len(updated)})
 
 class BudgetSubjectViewSet(viewsets.ModelViewSet):
@@ -904,6 +978,8 @@ class BudgetSubjectViewSet(viewsets.ModelViewSet):
         denied = self._ensure_subject_editor(request)
         if denied is not None:
             return denied
+        if _wants_background(request):
+            return _deferred_response(request)
         subject_type = str(request.data.get('subject_type') or '').strip().lower()
         if subject_type not in ('income', 'expense', 'all'):
             return Response({'error': 'subject_type must be one of income, expense, all'}, status=status.HTTP_400_BAD_REQUEST)
@@ -929,47 +1005,50 @@ class BudgetSubjectViewSet(viewsets.ModelViewSet):
         skipped = 0
 
         if force:
-            BudgetEntry.objects.filter(subject__subject_type__in=target_types).delete()
+            with deferred_totals():
+                BudgetEntry.objects.filter(subject__subject_type__in=target_types).delete()
         protected_subject_ids = set(
             BudgetEntry.objects.filter(subject__subject_type__in=target_types)
             .values_list('subject_id', flat=True)
         )
 
-        records_sorted = sorted(records, key=lambda rec: (rec['level'], rec['sort_order']))
-        code_to_obj = {obj.code: obj for obj in BudgetSubject.objects.all().select_related('parent')}
-
-        for rec in records_sorted:
-            parent_obj = code_to_obj.get(rec['parent_code']) if rec['parent_code'] else None
-            defaults = {
-                'name': rec['name'],
-                'description': rec['description'],
-                'level': rec['level'],
-                'parent': parent_obj,
-                'subject_type': rec['subject_type'],
-                'sort_order': rec['sort_order'],
-            }
-            obj, was_created = BudgetSubject.objects.update_or_create(code=rec['code'], defaults=defaults)
-            code_to_obj[rec['code']] = obj
-            if was_created:
-                created += 1
-            else:
-                updated += 1
+        # One subject-tree invalidation for the whole restore, not one per saved row
+        with batched_invalidation():
+            records_sorted = sorted(records, key=lambda rec: (rec['level'], rec['sort_order']))
+            code_to_obj = {obj.code: obj for obj in BudgetSubject.objects.all().select_related('parent')}
+
+            for rec in records_sorted:
+                parent_obj = code_to_obj.get(rec['parent_code']) if rec['parent_code'] else None
+                defaults = {
+                    'name': rec['name'],
+                    'description': rec['description'],
+                    'level': rec['level'],
+                    'parent': parent_obj,
+                    'subject_type': rec['subject_type'],
+                    'sort_order': rec['sort_order'],
+                }
+                obj, was_created = BudgetSubject.objects.update_or_create(code=rec['code'], defaults=defaults)
+                code_to_obj[rec['code']] = obj
+                if was_created:
+                    created += 1
+                else:
+                    updated += 1
 
-        stale_subjects = list(
-            BudgetSubject.objects
-            .filter(subject_type__in=target_types)
-            .exclude(code__in=incoming_codes)
-            .order_by('-level', '-id')
-        )
-        for subject in stale_subjects:
-            if subject.id in protected_subject_ids:
-                skipped += 1
-                continue
-            try:
-                subject.delete()
-                deleted += 1
-            except Exception:
-                skipped += 1
+            stale_subjects = list(
+                BudgetSubject.objects
+                .filter(subject_type__in=target_types)
+                .exclude(code__in=incoming_codes)
+                .order_by('-level', '-id')
+            )
+            for subject in stale_subjects:
+                if subject.id in protected_subject_ids:
+                    skipped += 1
+                    continue
+                try:
+                    subject.delete()
+                    deleted += 1
+                except Exception:
+                    skipped += 1
 
         return Response({
             'status': 'ok',
@@ -992,7 +1071,8 @@ class BudgetSubjectViewSet(viewsets.ModelViewSet):
         if not isinstance(updates, list) or len(updates) == 0:
             return Response({'error': 'updates array is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        subjects = BudgetSubject.objects.select_related('parent').all()
+        started = time.monotonic()
+        subjects = list(BudgetSubject.objects.all())
         subject_by_id_obj = {s.id: s for s in subjects}
         final_by_id = {
             s.id: {
@@ -1048,51 +1128,9 @@ class BudgetSubjectViewSet(viewsets.ModelViewSet):
                     except (TypeError, ValueError):
                         return Response({'error': f'[{sid}] invalid parent value.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Parent reference + level/type consistency
-        for sid, state in final_by_id.items():
-            parent_id = state.get('parent')
-            if parent_id is None:
-                if int(state['level']) != 1:
-                    return Response({'error': f'[{sid}] level must be 1 when parent is null.'}, status=status.HTTP_400_BAD_REQUEST)
-                continue
-            parent = final_by_id.get(parent_id)
-            if parent is None:
-                return Response({'error': f'[{sid}] parent item ({parent_id}) does not exist.'}, status=status.HTTP_400_BAD_REQUEST)
-            if parent_id == sid:
-                return Response({'error': f'[{sid}] cannot set self as parent.'}, status=status.HTTP_400_BAD_REQUEST)
-            expected_level = int(parent['level']) + 1
-            if int(state['level']) != expected_level:
-                return Response({'error': f'[{sid}] level must be parent level + 1.'}, status=status.HTTP_400_BAD_REQUEST)
-            if state['subject_type'] != parent['subject_type']:
-                return Response({'error': f'[{sid}] subject_type must match parent.'}, status=status.HTTP_400_BAD_REQUEST)
-            if int(state['level']) < 1 or int(state['level']) > 4:
-                return Response({'error': f'[{sid}] level must be in range 1..4.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Cycle detection on final graph
-        for sid in final_by_id.keys():
-            seen = set()
-            cursor = sid
-            while cursor is not None:
-                if cursor in seen:
-                    return Response({'error': f'Cycle detected. (subject id: {sid})'}, status=status.HTTP_400_BAD_REQUEST)
-                seen.add(cursor)
-                cursor_state = final_by_id.get(cursor)
-                cursor = cursor_state.get('parent') if cursor_state else None
-
-        # Global unique code check
-        code_owner = {}
-        for sid, state in final_by_id.items():
-            code = self._norm_code(state['code'])
-            owner = code_owner.get(code)
-            if owner is not None and owner != sid:
-                return Response({'error': f'Duplicate code: {code}'}, status=status.HTTP_400_BAD_REQUEST)
-            code_owner[code] = sid
-
-        # Code format rule validation
-        for sid, state in final_by_id.items():
-            msg = self._validate_code_rule(state, final_by_id)
-            if msg:
-                return Response({'error': msg}, status=status.HTTP_400_BAD_REQUEST)
+        msg = self._validate_final_tree(final_by_id)
+        if msg:
+            return Response({'error': msg}, status=status.HTTP_400_BAD_REQUEST)
 
         changed_ids = []
         code_changed_ids = []
@@ -1110,14 +1148,18 @@ class BudgetSubjectViewSet(viewsets.ModelViewSet):
                     code_changed_ids.append(sid)
 
         if not changed_ids:
-            return Response({'updated_count': 0, 'subjects': []}, status=status.HTTP_200_OK)
-
-        # Temporary code detour to avoid unique collisions (swap, rotate, etc.)
-        tmp_prefix = f"TMP{uuid.uuid4().hex[:8]}_"
-        for idx, sid in enumerate(code_changed_ids):
-            obj = subject_by_id_obj[sid]
-            obj.code = f"{tmp_prefix}{idx}"
-            obj.save(update_fields=['code'])
+            return Response({
+                'updated_count': 0,
+                'subjects': [],
+                'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+            }, status=status.HTTP_200_OK)
+
+        # Temporary code detour to avoid unique collisions (swap, rotate, etc.), one UPDATE
+        if code_changed_ids:
+            tmp_prefix = f"TMP{uuid.uuid4().hex[:8]}_"
+            BudgetSubject.objects.filter(id__in=code_changed_ids).update(
+                code=Concat(Value(tmp_prefix), Cast('id', output_field=CharField()))
+            )
 
         updated_subjects = []
         for sid in changed_ids:
@@ -1127,11 +1169,71 @@ class BudgetSubjectViewSet(viewsets.ModelViewSet):
             obj.name = state['name']
             obj.level = int(state['level'])
             obj.parent_id = state['parent']
-            obj.save(update_fields=['code', 'name', 'level', 'parent'])
             updated_subjects.append(obj)
+        BudgetSubject.objects.bulk_update(updated_subjects, ['code', 'name', 'level', 'parent'])
+        # bulk_update skips the post_save receivers
+        invalidate_subject_tree()
 
         payload = BudgetSubjectSerializer(updated_subjects, many=True).data
-        return Response({'updated_count': len(updated_subjects), 'subjects': payload}, status=status.HTTP_200_OK)
+        return Response({
+            'updated_count': len(updated_subjects),
+            'code_changed_count': len(code_changed_ids),
+            'subjects': payload,
+            'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+        }, status=status.HTTP_200_OK)
+
+    def _validate_final_tree(self, final_by_id):
+        """
+        Validate the final subject graph in one topological pass (parents before
+        children). Returns an error message or None.
+        """
+        children = {}
+        for sid, state in final_by_id.items():
+            children.setdefault(state.get('parent'), []).append(sid)
+
+        code_owner = {}
+        visited = set()
+        pending = list(children.get(None, []))
+        while pending:
+            sid = pending.pop()
+            visited.add(sid)
+            state = final_by_id[sid]
+            level = int(state['level'])
+            parent_id = state.get('parent')
+            if parent_id is None:
+                if level != 1:
+                    return f'[{sid}] level must be 1 when parent is null.'
+            else:
+                parent = final_by_id[parent_id]
+                if level != int(parent['level']) + 1:
+                    return f'[{sid}] level must be parent level + 1.'
+                if state['subject_type'] != parent['subject_type']:
+                    return f'[{sid}] subject_type must match parent.'
+                if level < 1 or level > 4:
+                    return f'[{sid}] level must be in range 1..4.'
+
+            code = self._norm_code(state['code'])
+            if code in code_owner:
+                return f'Duplicate code: {code}'
+            code_owner[code] = sid
+
+            msg = self._validate_code_rule(state, final_by_id)
+            if msg:
+                return msg
+            pending.extend(children.get(sid, ()))
+
+        if len(visited) == len(final_by_id):
+            return None
+        # Nodes never reached from a root: dangling parent, self parent or a cycle.
+        unreached = [sid for sid in final_by_id if sid not in visited]
+        for sid in unreached:
+            parent_id = final_by_id[sid].get('parent')
+            if parent_id not in final_by_id:
+                return f'[{sid}] parent item ({parent_id}) does not exist.'
+            if parent_id == sid:
+                return f'[{sid}] cannot set self as parent.'
+        return f'Cycle detected. (subject id: {min(unreached)})'
+
 
     @action(detail=True, methods=['delete'], url_path='force-delete')
     @transaction.atomic
@@ -1146,32 +1248,26 @@ class BudgetSubjectViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Subject delete is allowed only for MANAGER or ADMIN.'}, status=status.HTTP_403_FORBIDDEN)
         subject = self.get_object()
 
-        # 1) Collect target + descendant ids (iterative BFS, avoids recursion limit)
-        target_ids = []
-        queue = [subject.id]
-        while queue:
-            current_id = queue.pop(0)
-            target_ids.append(current_id)
-            children_ids = list(
-                BudgetSubject.objects.filter(parent_id=current_id).values_list('id', flat=True)
-            )
-            queue.extend(children_ids)
-
-        # 2) Reject when linked BudgetEntry exists
-        from .models import BudgetEntry
-        linked_entry_count = BudgetEntry.objects.filter(subject_id__in=target_ids).count()
-        if linked_entry_count > 0:
-            return Response(
-                {
-                    'error': f'Cannot delete: linked budget entries exist ({linked_entry_count}). '
-                             f'Remove linked entries first and retry.',
-                    'linked_entry_count': linked_entry_count,
-                },
-                status=status.HTTP_409_CONFLICT,
-            )
+        with transaction.atomic():
+            # 1) Collect target + descendant ids from the database (not the cached tree)
+            target_ids = subtree_ids_from_db(subject.id)
+
+            # 2) Reject when linked BudgetEntry exists
+            from .models import BudgetEntry
+            linked_entry_count = BudgetEntry.objects.filter(subject_id__in=target_ids).count()
+            if linked_entry_count > 0:
+                return Response(
+                    {
+                        'error': f'Cannot delete: linked budget entries exist ({linked_entry_count}). '
+                                 f'Remove linked entries first and retry.',
+                        'linked_entry_count': linked_entry_count,
+                    },
+                    status=status.HTTP_409_CONFLICT,
+                )
 
-        # 3) Delete only when no linked entries
-        subject.delete()
+            # 3) Delete only when no linked entries (descendants cascade; one tree invalidation)
+            with batched_invalidation():
+                subject.delete()
 
         return Response({
             'status': 'ok',
@@ -1216,6 +1312,7 @@ class BudgetSubjectViewSet(viewsets.ModelViewSet):
                 updated.append(obj)
         if updated:
             BudgetSubject.objects.bulk_update(updated, ['sort_order'])
+            invalidate_subject_tree()
         return Response({'updated': len(updated)})
 
 class EntrustedProjectViewSet(viewsets.ModelViewSet):
@@ -1232,13 +1329,6 @@ class EntrustedProjectViewSet(viewsets.ModelViewSet):
             return denied
         return None
 
-    def _generate_code(self):
-        """Generate project code with low collision risk."""
-        import time, random, string
-        ts = hex(int(time.time() * 1000))[2:].upper()
-        rand = ''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
-        return f"EP_{ts}_{rand}"
-
     def get_queryset(self):
         queryset = _scope_queryset_by_org(super().get_queryset(), self.request, org_field='organization_id')
         org_id = self.request.query_params.get('org_id')
@@ -1281,11 +1371,7 @@ class EntrustedProjectViewSet(viewsets.ModelViewSet):
         organization = serializer.validated_data.get('organization')
         if not _org_in_scope(self.request, getattr(organization, 'id', None)):
             raise PermissionDenied('No permission to create project for this organization.')
-        code = self._generate_code()
-        # Retry on code collision
-        while EntrustedProject.objects.filter(code=code).exists():
-            code = self._generate_code()
-        serializer.save(code=code)
+        serializer.save(code=generate_project_codes(1)[0])
 
     def destroy(self, request, *args, **kwargs):
         """Reject project delete when linked budget entries exist."""
@@ -1326,7 +1412,7 @@ class EntrustedProjectViewSet(viewsets.ModelViewSet):
             return Response(exc.detail, status=status.HTTP_409_CONFLICT)
 
     @action(detail=True, methods=['delete'], url_path='force-delete')
-    @transaction.atomic
+    @deferred_totals()
     def force_delete_project(self, request, pk=None):  # noqa: ARG002
         """Force-delete a project and all linked budget entries/details. ADMIN-only."""
         role = _normalize_role(_role(request))
@@ -1365,57 +1451,107 @@ class EntrustedProjectViewSet(viewsets.ModelViewSet):
         if not _org_in_scope(request, org.id):
             return Response({'error': 'No permission for target organization.'}, status=status.HTTP_403_FORBIDDEN)
 
-        code = self._generate_code()
-        while EntrustedProject.objects.filter(code=code).exists():
-            code = self._generate_code()
+        with deferred_totals():
+            new_proj, = clone_projects(
+                [ProjectClonePlan(source=source, organization_id=org.id, year=new_year, name=new_name)],
+                copy_entries=bool(copy_entries),
+            )
 
-        with transaction.atomic():
-            new_proj = EntrustedProject.objects.create(
-                organization=org,
+        serializer = self.get_serializer(new_proj)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='bulk-clone')
+    def bulk_clone(self, request):
+        """
+        Clone many projects into another year in one request.
+        Sources: ids=[...] or source_year (+ org_id: a department includes its teams).
+        Each clone keeps its organization unless organization is given.
+        Projects already cloned from the same source into the target year are skipped.
+        """
+        denied = self._ensure_project_editor(request)
+        if denied is not None:
+            return denied
+        try:
+            new_year = int(request.data.get('year'))
+        except (TypeError, ValueError):
+            return Response({'error': 'year is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        copy_entries = request.data.get('copy_entries', True)
+
+        sources = _scope_queryset_by_org(EntrustedProject.objects.all(), request, org_field='organization_id')
+        ids = request.data.get('ids')
+        if ids:
+            if not isinstance(ids, list):
+                return Response({'error': 'ids must be an array.'}, status=status.HTTP_400_BAD_REQUEST)
+            sources = sources.filter(id__in=[_as_int(v) for v in ids])
+        else:
+            source_year = _as_int(request.data.get('source_year'))
+            if source_year is None:
+                return Response({'error': 'ids or source_year is required.'}, status=status.HTTP_400_BAD_REQUEST)
+            sources = sources.filter(year=source_year)
+            org_id = _as_int(request.data.get('org_id'))
+            if org_id is not None:
+                sources = sources.filter(organization_id__in=get_org_tree().subtree(org_id))
+
+        target_org_id = _as_int(request.data.get('organization'))
+        if target_org_id is not None:
+            if not Organization.objects.filter(pk=target_org_id).exists():
+                return Response({'error': 'Organization not found.'}, status=status.HTTP_400_BAD_REQUEST)
+            if not _org_in_scope(request, target_org_id):
+                return Response({'error': 'No permission for target organization.'}, status=status.HTTP_403_FORBIDDEN)
+
+        sources = list(sources.order_by('organization_id', 'id'))
+        already_cloned = set(
+            EntrustedProject.objects.filter(year=new_year, source_project__in=sources)
+            .values_list('source_project_id', flat=True)
+        )
+        plans = [
+            ProjectClonePlan(
+                source=src,
+                organization_id=target_org_id or src.organization_id,
                 year=new_year,
-                code=code,
-                name=new_name,
-                status='PLANNED',
-                source_project=source,
+                name=src.name,
             )
+            for src in sources
+            if src.id not in already_cloned and src.year != new_year
+        ]
+        with deferred_totals():
+            projects = clone_projects(plans, copy_entries=bool(copy_entries))
 
-            if copy_entries:
-                # Clone BudgetEntry rows from source project (keep amount/formula, no history)
-                for entry in source.entries.select_related('subject').prefetch_related('details').all():
-                    new_entry = BudgetEntry.objects.create(
-                        subject=entry.subject,
-                        organization=org,
-                        entrusted_project=new_proj,
-                        year=new_year,
-                        status='DRAFT',
-                        last_year_amount=entry.total_amount,  # keep source amount as last-year baseline
-                        budget_category='ORIGINAL',
-                        supplemental_round=0,
-                        carryover_type='NONE',
-                    )
-                    for detail in entry.details.all():
-                        BudgetDetail.objects.create(
-                            entry=new_entry,
-                            name=detail.name,
-                            price=detail.price,
-                            qty=detail.qty,
-                            freq=detail.freq,
-                            currency_unit=detail.currency_unit,
-                            unit=detail.unit,
-                            freq_unit=detail.freq_unit,
-                            sort_order=detail.sort_order,
-                            sub_label=detail.sub_label,
-                            source=detail.source,
-                            organization=detail.organization,
-                        )
+        return Response({
+            'cloned_count': len(projects),
+            'skipped_count': len(sources) - len(plans),
+            'entry_count': BudgetEntry.objects.filter(entrusted_project__in=projects).count() if projects else 0,
+            'projects': self.get_serializer(projects, many=True).data,
+        }, status=status.HTTP_201_CREATED)
+
+class EntryKeysetPagination(CursorPagination):
+    """Keyset pagination on id (``?cursor=``) so large entry grids can be read page by page."""
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
 
-        serializer = self.get_serializer(new_proj)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 class BudgetEntryViewSet(viewsets.ModelViewSet):
     queryset = BudgetEntry.objects.all()
     serializer_class = BudgetEntrySerializer
 
+    def _summary_mode(self):
+        return self.action == 'list' and self.request.query_params.get('view') == 'summary'
+
+    @property
+    def paginator(self):
+        # ?view=summary (or ?pagination=keyset) reads the list with keyset pagination on id.
+        if not hasattr(self, '_paginator') and (
+            self._summary_mode() or self.request.query_params.get('pagination') == 'keyset'
+        ):
+            self._paginator = EntryKeysetPagination()
+        return super().paginator
+
+    def get_serializer_class(self):
+        if self._summary_mode():
+            return BudgetEntrySummarySerializer
+        return super().get_serializer_class()
+
     def _role(self, user):
         """Return normalized role value."""
         profile = getattr(user, 'profile', None)
@@ -1468,16 +1604,19 @@ class BudgetEntryViewSet(viewsets.ModelViewSet):
         serializer.save()
 
     def get_queryset(self):
-        prefetch_logs = Prefetch(
-            'approval_logs',
-            queryset=ApprovalLog.objects.select_related('actor').order_by('-created_at'),
-        )
         queryset = (
             BudgetEntry.objects
-            .select_related('organization', 'subject', 'entrusted_project')
-            .prefetch_related('details', 'details__organization', prefetch_logs, 'comments')
+            .select_related('organization', 'subject', 'entrusted_project', 'submitted_by', 'latest_action_by')
             .order_by('id')
         )
+        if self._summary_mode():
+            queryset = queryset.annotate(**entry_summary_annotations())
+        else:
+            queryset = (
+                queryset
+                .annotate(**comment_status_annotations())
+                .prefetch_related('details', 'details__organization')
+            )
         queryset = _scope_queryset_by_org(queryset, self.request, org_field='organization_id')
         org_id = self.request.query_params.get('org_id')
         year = self.request.query_params.get('year')
@@ -1641,6 +1780,7 @@ class BudgetEntryViewSet(viewsets.ModelViewSet):
         })
 
     @action(detail=True, methods=['post'], url_path='note')
+    @transaction.atomic
     def note(self, request, pk=None):
         """
         Write a note log without changing status.
@@ -1759,6 +1899,7 @@ class BudgetEntryViewSet(viewsets.ModelViewSet):
 
         with transaction.atomic():
             updated = BudgetEntry.objects.filter(id__in=target_ids).update(status=to_status)
+            mark_rollup_entries(target_ids)
 
             updated_entries = BudgetEntry.objects.filter(id__in=target_ids).values_list('id', flat=True)
             approval_logs = [
@@ -1772,6 +1913,7 @@ class BudgetEntryViewSet(viewsets.ModelViewSet):
                 for entry_id in updated_entries
             ]
             ApprovalLog.objects.bulk_create(approval_logs)
+            record_entry_activity(approval_logs)
 
             try:
                 org = Organization.objects.get(id=org_id)
@@ -1830,113 +1972,23 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
             return denied
         return super().partial_update(request, *args, **kwargs)
 
-    @staticmethod
-    def _as_int(value, default=None):
-        try:
-            if value is None or value == '':
-                return default
-            return int(value)
-        except (TypeError, ValueError):
-            return default
-
-    @staticmethod
-    def _detail_snapshot(detail):
-        return {
-            'detail_id': detail.id,
-            'entry_id': detail.entry_id,
-            'name': detail.name,
-            'price': detail.price,
-            'qty': detail.qty,
-            'freq': detail.freq,
-            'currency_unit': detail.currency_unit,
-            'unit': detail.unit,
-            'freq_unit': detail.freq_unit,
-            'source': detail.source,
-            'sub_label': detail.sub_label,
-            'sort_order': detail.sort_order,
-            'is_rate': detail.is_rate,
-            'organization': detail.organization_id,
-            'total_price': detail.total_price,
-        }
+    _as_int = staticmethod(_as_int)
+    _wants_background = staticmethod(_wants_background)
 
     def _clone_entries_into_version(self, source_entries, target_version, *, budget_category):
-        created_entries = 0
-        detail_rows = []
-        target_year = target_version.year
-        project_mapping = {}
-        for src in source_entries:
-            src_detail_total = sum(detail.total_price for detail in src.details.all())
-            src_total_amount = int(getattr(src, 'total_amount', 0) or 0)
-            if src_total_amount == 0:
-                src_total_amount = src_detail_total
-            # Entrusted project mapping: create or map project for target year if missing
-            target_proj = src.entrusted_project
-            if target_proj and target_proj.year != target_year:
-                if target_proj.id not in project_mapping:
-                    existing = EntrustedProject.objects.filter(
-                        organization=target_proj.organization, year=target_year, code=target_proj.code
-                    ).first() or EntrustedProject.objects.filter(
-                        organization=target_proj.organization, year=target_year, name=target_proj.name
-                    ).first()
-
-                    if existing:
-                        project_mapping[target_proj.id] = existing
-                    else:
-                        project_mapping[target_proj.id] = EntrustedProject.objects.create(
-                            organization=target_proj.organization,
-                            year=target_year,
-                            code=target_proj.code,
-                            name=target_proj.name,
-                            status='PLANNED',
-                            source_project=target_proj
-                        )
-                target_proj = project_mapping[target_proj.id]
-
-            new_entry = BudgetEntry.objects.create(
-                subject=src.subject,
-                organization=src.organization,
-                entrusted_project=target_proj,
-                year=target_year,
-                supplemental_round=target_version.round,
-                status='DRAFT',
-                last_year_amount=src_total_amount,
-                budget_category=budget_category,
-                carryover_type=src.carryover_type,
-                total_amount=src_total_amount,
-                executed_amount=0,
-                remaining_amount=src_total_amount,
-            )
-            created_entries += 1
-
-            for detail in src.details.all():
-                detail_rows.append(BudgetDetail(
-                    entry=new_entry,
-                    name=detail.name,
-                    price=detail.price,
-                    qty=detail.qty,
-                    freq=detail.freq,
-                    currency_unit=detail.currency_unit,
-                    unit=detail.unit,
-                    freq_unit=detail.freq_unit,
-                    sub_label=detail.sub_label,
-                    sort_order=detail.sort_order,
-                    source=detail.source,
-                    is_rate=detail.is_rate,
-                    organization=detail.organization,
-                    region_context=detail.region_context,
-                    weather_context=detail.weather_context,
-                    evidence_source_name=detail.evidence_source_name,
-                    evidence_source_url=detail.evidence_source_url,
-                    evidence_as_of=detail.evidence_as_of,
-                    transfer_source_detail=detail,
-                    before_snapshot=self._detail_snapshot(detail),
-                ))
-
-        created_details = len(detail_rows)
-        if detail_rows:
-            BudgetDetail.objects.bulk_create(detail_rows)
-
-        return created_entries, created_details
+        return clone_entries_into_version(source_entries, target_version, budget_category=budget_category)
+
+    def _start_clone_job(self, request, target_version, *, source_year, source_round, source_status='', budget_category):
+        job = start_clone_job(
+            target_version,
+            source_year=source_year,
+            source_round=source_round,
+            source_status=source_status,
+            budget_category=budget_category,
+            chunk_size=self._as_int(request.data.get('chunk_size'), default=settings.BUDGET_CLONE_CHUNK_SIZE),
+            user=request.user,
+        )
+        return JobSerializer(job).data
 
     @action(detail=False, methods=['post'])
     def create_next_round(self, request):
@@ -1973,6 +2025,7 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
 
         source_version = None
         source_entries = None
+        source_status = ''
         clone_budget_category = 'SUPPLEMENTAL' if next_round > 0 else 'ORIGINAL'
 
         if creation_mode == 'TRANSFER':
@@ -1991,9 +2044,10 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
                 return Response({'error': 'source version has no entries'}, status=status.HTTP_404_NOT_FOUND)
         elif next_round > 0 and latest:
             source_version = latest
+            source_status = 'FINALIZED'
             source_entries = (
                 BudgetEntry.objects
-                .filter(year=year, supplemental_round=latest.round, status='FINALIZED')
+                .filter(year=year, supplemental_round=latest.round, status=source_status)
                 .select_related('subject', 'organization', 'entrusted_project')
                 .prefetch_related('details')
             )
@@ -2011,6 +2065,8 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
 
         cloned_count = 0
         cloned_detail_count = 0
+        background = self._wants_background(request)
+        clone_job = None
         if not created:
             existing_entry_count = BudgetEntry.objects.filter(
                 year=version.year,
@@ -2029,11 +2085,18 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
                     version.creation_mode = 'TRANSFER'
                     version.source_version = source_version
                     version.save(update_fields=['creation_mode', 'source_version'])
-                    cloned_count, cloned_detail_count = self._clone_entries_into_version(
-                        source_entries=source_entries,
-                        target_version=version,
-                        budget_category=clone_budget_category,
-                    )
+                    if background:
+                        clone_job = self._start_clone_job(
+                            request, version,
+                            source_year=source_version.year, source_round=source_version.round,
+                            source_status=source_status, budget_category=clone_budget_category,
+                        )
+                    else:
+                        cloned_count, cloned_detail_count = self._clone_entries_into_version(
+                            source_entries=source_entries,
+                            target_version=version,
+                            budget_category=clone_budget_category,
+                        )
                 existing_entry_count = BudgetEntry.objects.filter(
                     year=version.year,
                     supplemental_round=version.round,
@@ -2044,6 +2107,9 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
             payload['cloned_detail_count'] = cloned_detail_count
             payload['already_exists'] = True
             payload['existing_entry_count'] = existing_entry_count
+            if clone_job is not None:
+                payload['clone_job'] = clone_job
+                return Response(payload, status=status.HTTP_202_ACCEPTED)
             return Response(payload, status=status.HTTP_200_OK)
 
         with transaction.atomic():
@@ -2062,17 +2128,59 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
             version.save()
 
             if source_entries is not None and source_entries.exists():
-                cloned_count, cloned_detail_count = self._clone_entries_into_version(
-                    source_entries=source_entries,
-                    target_version=version,
-                    budget_category=clone_budget_category,
-                )
+                if background:
+                    clone_job = self._start_clone_job(
+                        request, version,
+                        source_year=source_version.year, source_round=source_version.round,
+                        source_status=source_status, budget_category=clone_budget_category,
+                    )
+                else:
+                    cloned_count, cloned_detail_count = self._clone_entries_into_version(
+                        source_entries=source_entries,
+                        target_version=version,
+                        budget_category=clone_budget_category,
+                    )
 
         payload = BudgetVersionSerializer(version).data
         payload['cloned_count'] = cloned_count
         payload['cloned_detail_count'] = cloned_detail_count
+        if clone_job is not None:
+            payload['clone_job'] = clone_job
+            return Response(payload, status=status.HTTP_202_ACCEPTED)
         return Response(payload, status=status.HTTP_201_CREATED)
 
+    @action(detail=True, methods=['get'], url_path='export-budget-book')
+    def export_budget_book(self, request, pk=None):
+        """
+        Official budget book (.xlsx) filled from the version's entries; ?background=1 queues it.
+        Files are cached by data fingerprint + template checksum and revalidated with ETag.
+        """
+        version = self.get_object()
+        if _wants_background(request):
+            return _deferred_response(request)
+        key = budget_book_cache_key(version)
+        etag = f'"{key}"'
+        if_none_match = [tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))]
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+
+        book = get_budget_book(version, key=key)
+        try:
+            stream = book.open()
+        except FileNotFoundError:  # evicted in between
+            book = get_budget_book(version, key=key)
+            stream = book.open()
+        response = FileResponse(stream, content_type=XLSX_CONTENT_TYPE)
+        response['Content-Disposition'] = book.disposition
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        response['X-Export-Cache'] = 'hit' if book.hit else 'miss'
+        response['X-Export-Template-Warnings'] = str(book.meta['template_warning_count'])
+        response['X-Export-Template-Overrides'] = str(len(book.meta['template_overrides']))
+        return response
+
     @action(detail=True, methods=['get'], url_path='export-department-budget')
     def export_department_budget(self, request, pk=None):
         version = self.get_object()
@@ -2094,7 +2202,7 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
             return Response({'error': 'No permission for this organization.'}, status=status.HTTP_403_FORBIDDEN)
         
         org_name = org.name
-        org_ids = [org.id] + list(Organization.objects.filter(parent_id=org.id).values_list('id', flat=True))
+        subject_tree = get_subject_tree()
         
         wb = Workbook()
         if wb.active:
@@ -2157,12 +2265,9 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
             entries = BudgetEntry.objects.filter(
                 year=version.year,
                 supplemental_round=version.round,
-                organization_id__in=org_ids,
+                organization__ancestor_links__ancestor_id=org.id,
                 subject__subject_type=subject_type
-            ).select_related(
-                'subject', 'subject__parent', 'subject__parent__parent', 
-                'subject__parent__parent__parent', 'organization'
-            ).prefetch_related('details').order_by('subject__code', 'organization__id')
+            ).select_related('subject', 'organization').prefetch_related('details').order_by('subject__code', 'organization__id')
 
             row_num = 4
             
@@ -2197,18 +2302,7 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
             
             tree = Node("Root")
             for entry in entries:
-                subject = entry.subject
-                by_level = {}
-                cursor = subject
-                while cursor:
-                    lvl = int(getattr(cursor, 'level', 0) or 0)
-                    if lvl > 0: by_level[lvl] = cursor.name
-                    cursor = getattr(cursor, 'parent', None)
-                
-                jang = by_level.get(1, "") or ""
-                gwan = by_level.get(2, "") or ""
-                hang = by_level.get(3, "") or ""
-                mok = by_level.get(4, "") or ""
+                jang, gwan, hang, mok = subject_tree.path(entry.subject_id)
                 
                 if jang not in tree.children: tree.children[jang] = Node(jang)
                 if gwan not in tree.children[jang].children: tree.children[jang].children[gwan] = Node(gwan)
@@ -2348,7 +2442,7 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
     @action(detail=True, methods=['delete'], url_path='force-delete')
-    @transaction.atomic
+    @deferred_totals()
     def force_delete_version(self, request, pk=None):  # noqa: ARG002
         """Force-delete a version and all linked budget entries/details. ADMIN-only."""
         if _normalize_role(_role(request)) != 'ADMIN':
@@ -2413,6 +2507,17 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
         source_version = BudgetVersion.objects.filter(year=source_year, round=source_round).first()
         budget_category = 'SUPPLEMENTAL' if target_version.round > 0 else 'ORIGINAL'
 
+        if self._wants_background(request):
+            with transaction.atomic():
+                target_version.creation_mode = 'TRANSFER'
+                target_version.source_version = source_version
+                target_version.save(update_fields=['creation_mode', 'source_version'])
+                clone_job = self._start_clone_job(
+                    request, target_version,
+                    source_year=source_year, source_round=source_round, budget_category=budget_category,
+                )
+            return Response({'status': 'accepted', 'clone_job': clone_job}, status=status.HTTP_202_ACCEPTED)
+
         with transaction.atomic():
             cloned_count, cloned_detail_count = self._clone_entries_into_version(
                 source_entries=source_entries,
@@ -2455,7 +2560,8 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
                     continue
                 
                 if force:
-                    BudgetEntry.objects.filter(year=version.year, supplemental_round=version.round).delete()
+                    with deferred_totals():
+                        BudgetEntry.objects.filter(year=version.year, supplemental_round=version.round).delete()
                 
                 version.delete()
                 deleted_ids.append(v_id)
@@ -2525,15 +2631,10 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
         orgs = orgs_qs.values('id', 'name', 'code', 'parent_id', 'org_type')
         org_map = {o['id']: o for o in orgs}
 
-        # 2. Get entries for this version
-        entries = BudgetEntry.objects.filter(year=version.year, supplemental_round=version.round).prefetch_related('details')
-        if allowed_org_ids is not None:
-            entries = entries.filter(organization_id__in=allowed_org_ids)
-
+        # 2. Aggregate from the maintained rollup rows (see rollups.py)
         stats = {}
-        
-        for entry in entries:
-            org_id = entry.organization_id
+        for row in rollup_queryset(version.year, version.round, allowed_org_ids):
+            org_id = row.organization_id
             if org_id not in stats:
                 stats[org_id] = {
                     'org_id': org_id,
@@ -2544,11 +2645,11 @@ class BudgetVersionViewSet(viewsets.ModelViewSet):
                     'total_amount': 0,
                     'status_counts': {'DRAFT': 0, 'PENDING': 0, 'REVIEWING': 0, 'FINALIZED': 0}
                 }
-            
+
             s = stats[org_id]
-            s['total_entries'] += 1
-            s['total_amount'] += entry.total_amount
-            s['status_counts'][entry.status] = s['status_counts'].get(entry.status, 0) + 1
+            s['total_entries'] += row.entry_count
+            s['total_amount'] += row.total_amount
+            s['status_counts'][row.status] = s['status_counts'].get(row.status, 0) + row.entry_count
 
         # Calculate logical status for the department
         # Logic: If all FINALIZED -> Completed. If any REVIEWING/PENDING -> Submitted. Else -> Writing.
@@ -3000,123 +3101,41 @@ class ApprovalLogViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = ApprovalLogSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    @staticmethod
-    def _parse_int_list(raw_value):
-        if raw_value is None:
-            return []
-        tokens = str(raw_value).split(',')
-        values = []
-        for token in tokens:
-            token = token.strip()
-            if token.isdigit():
-                values.append(int(token))
-        return values
-
-    @staticmethod
-    def _parse_csv_list(raw_value):
-        if raw_value is None:
-            return []
-        return [token.strip() for token in str(raw_value).split(',') if token.strip()]
+    def _log_filter(self):
+        return LogFilter.from_request(self.request, _scope_org_ids_for_user(self.request))
 
     def get_queryset(self):
-        queryset = ApprovalLog.objects.select_related('actor', 'entry').order_by('-created_at')
-        allowed = _scope_org_ids_for_user(self.request)
-        if allowed is not None:
-            user_id_str = str(getattr(self.request.user, 'id', ''))
-            if allowed:
-                queryset = queryset.filter(
-                    Q(entry__organization_id__in=allowed) |
-                    Q(actor=self.request.user) |
-                    Q(resource_type='auth', resource_id=user_id_str)
-                )
-            else:
-                queryset = queryset.filter(
-                    Q(actor=self.request.user) |
-                    Q(resource_type='auth', resource_id=user_id_str)
-                )
-
-        entry_id = self.request.query_params.get('entry')
-        if str(entry_id).isdigit():
-            queryset = queryset.filter(entry_id=int(entry_id))
-
-        entry_ids = self._parse_int_list(self.request.query_params.get('entry_ids'))
-        if entry_ids:
-            queryset = queryset.filter(entry_id__in=entry_ids)
-
-        year = self.request.query_params.get('year')
-        if str(year).isdigit():
-            queryset = queryset.filter(entry__year=int(year))
-
-        round_no = self.request.query_params.get('round')
-        if str(round_no).isdigit():
-            queryset = queryset.filter(entry__supplemental_round=int(round_no))
-
-        org_id = self.request.query_params.get('org_id')
-        if str(org_id).isdigit():
-            queryset = queryset.filter(entry__organization_id=int(org_id))
-
-        org_ids = self._parse_int_list(self.request.query_params.get('org_ids'))
-        if org_ids:
-            queryset = queryset.filter(entry__organization_id__in=org_ids)
-
-        log_types = self._parse_csv_list(self.request.query_params.get('log_type'))
-        if log_types:
-            queryset = queryset.filter(log_type__in=log_types)
-
-        actions = self._parse_csv_list(self.request.query_params.get('action'))
-        if actions:
-            queryset = queryset.filter(action__in=actions)
-
-        resource_type = self.request.query_params.get('resource_type')
-        if resource_type:
-            queryset = queryset.filter(resource_type=resource_type)
-
-        resource_id = self.request.query_params.get('resource_id')
-        if resource_id:
-            queryset = queryset.filter(resource_id=str(resource_id))
-
-        method = self.request.query_params.get('method')
-        if method:
-            queryset = queryset.filter(method__iexact=method)
-
-        actor = self.request.query_params.get('actor')
-        if actor:
-            queryset = queryset.filter(
-                Q(actor__username__icontains=actor) |
-                Q(actor__first_name__icontains=actor)
-            )
-
-        status_value = self.request.query_params.get('status')
-        if status_value:
-            queryset = queryset.filter(
-                Q(from_status__iexact=status_value) |
-                Q(to_status__iexact=status_value)
-            )
-
-        status_code = self.request.query_params.get('status_code')
-        if str(status_code).isdigit():
-            queryset = queryset.filter(status_code=int(status_code))
-
-        from_date = self.request.query_params.get('from_date') or self.request.query_params.get('from')
-        if from_date:
-            queryset = queryset.filter(created_at__date__gte=from_date)
-
-        to_date = self.request.query_params.get('to_date') or self.request.query_params.get('to')
-        if to_date:
-            queryset = queryset.filter(created_at__date__lte=to_date)
-
-        keyword = self.request.query_params.get('q')
-        if keyword:
-            queryset = queryset.filter(
-                Q(reason__icontains=keyword) |
-                Q(path__icontains=keyword) |
-                Q(resource_type__icontains=keyword) |
-                Q(resource_id__icontains=keyword) |
-                Q(actor__username__icontains=keyword) |
-                Q(actor__first_name__icontains=keyword)
-            )
-
-        return queryset
+        queryset = ApprovalLog.objects.select_related('actor', 'entry').order_by('-created_at', '-id')
+        return self._log_filter().apply(queryset)
+
+    def list(self, request, *args, **kwargs):
+        # Archived months (archive_audit_logs) follow the table rows; archived=0 skips them.
+        queryset = self.get_queryset()
+        if request.query_params.get('archived') not in ('0', 'false'):
+            queryset = LogHistory(queryset, self._log_filter())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """Stream every log matching the list filters as CSV (default) or NDJSON (?file_format=ndjson)."""
+        file_format = str(request.query_params.get('file_format') or 'csv').lower()
+        if file_format not in CONTENT_TYPES:
+            return Response({'error': 'file_format must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.get_queryset()
+        history = None
+        if request.query_params.get('archived') not in ('0', 'false'):
+            history = LogHistory(queryset, self._log_filter())
+        response = StreamingHttpResponse(
+            export_lines(iter_export_rows(queryset, history), file_format),
+            content_type=CONTENT_TYPES[file_format],
+        )
+        stamp = timezone.localtime().strftime('%Y%m%d-%H%M%S')
+        response['Content-Disposition'] = f'attachment; filename="approval-logs-{stamp}.{file_format}"'
+        response['Cache-Control'] = 'no-store'
+        return response
 
     def paginate_queryset(self, queryset):
         if self.request.query_params.get('entry_ids'):
@@ -3162,56 +3181,59 @@ class DashboardSummaryView(APIView):
         if not year:
             return Response({'error': 'year parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        entries = BudgetEntry.objects.filter(year=year, supplemental_round=round_no).select_related('subject', 'organization')
-        entries = _scope_queryset_by_org(entries, request, org_field='organization_id')
-        if not entries.exists():
+        try:
+            year = int(year)
+            round_no = int(round_no or 0)
+        except (TypeError, ValueError):
+            return Response({'error': 'year and round must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        allowed_org_ids = _scope_org_ids_for_user(request)
+        rows = list(
+            rollup_queryset(year, round_no, allowed_org_ids)
+            .values('organization_id', 'status', 'subject_type', 'entry_count', 'total_amount')
+        )
+        if not rows:
             return Response({
                 'year': year, 'round': round_no, 'total_income': 0, 'total_expense': 0,
                 'status_counts': {}, 'org_progress': []
             })
-        
-        # Detail aggregation
-        summary_query = BudgetDetail.objects.filter(entry__year=year, entry__supplemental_round=round_no)
-        summary_query = _scope_queryset_by_org(summary_query, request, org_field='entry__organization_id')
-        
-        income_normal = summary_query.filter(entry__subject__subject_type='income', is_rate=False).aggregate(
-            total=Sum(F('price') * F('qty') * F('freq'))
-        )['total'] or 0
-        income_rate = sum(d.total_price for d in summary_query.filter(entry__subject__subject_type='income', is_rate=True))
-        total_income = income_normal + income_rate
-        
-        expense_normal = summary_query.filter(entry__subject__subject_type='expense', is_rate=False).aggregate(
-            total=Sum(F('price') * F('qty') * F('freq'))
-        )['total'] or 0
-        expense_rate = sum(d.total_price for d in summary_query.filter(entry__subject__subject_type='expense', is_rate=True))
-        total_expense = expense_normal + expense_rate
 
-        from collections import Counter
-        status_counts = dict(Counter(entries.values_list('status', flat=True)))
+        total_income = sum(r['total_amount'] for r in rows if r['subject_type'] == 'income')
+        total_expense = sum(r['total_amount'] for r in rows if r['subject_type'] == 'expense')
+
+        status_counts = {}
+        per_org = {}
+        for r in rows:
+            status_counts[r['status']] = status_counts.get(r['status'], 0) + r['entry_count']
+            counts = per_org.setdefault(r['organization_id'], [0, 0])
+            counts[0] += r['entry_count']
+            if r['status'] == 'FINALIZED':
+                counts[1] += r['entry_count']
+
+        # Organization-wise progress (for departments, nested teams included)
+        tree = get_org_tree()
+        dept_totals = {}
+        for org_id, counts in per_org.items():
+            if org_id not in tree:
+                continue
+            for dept_id in (org_id,) + tree.ancestors(org_id):
+                acc = dept_totals.setdefault(dept_id, [0, 0])
+                acc[0] += counts[0]
+                acc[1] += counts[1]
 
-        # Organization-wise progress (for departments)
-        org_stats = []
-        depts = Organization.objects.filter(org_type='dept')
-        allowed_org_ids = _scope_org_ids_for_user(request)
+        allowed_dept_ids = None
         if allowed_org_ids is not None:
-            allowed_dept_ids = set()
-            for org in Organization.objects.filter(id__in=allowed_org_ids).only('id', 'parent_id', 'org_type'):
-                if _is_team_organization(org):
-                    if org.parent_id:
-                        allowed_dept_ids.add(org.parent_id)
-                else:
-                    allowed_dept_ids.add(org.id)
-            depts = depts.filter(id__in=allowed_dept_ids)
-        for org in depts:
-            # Include child teams in the count
-            team_ids = list(Organization.objects.filter(parent=org).values_list('id', flat=True))
-            scope_ids = [org.id] + team_ids
-            
-            org_entries = entries.filter(organization_id__in=scope_ids)
-            if not org_entries.exists(): continue
-            
-            e_count = org_entries.count()
-            f_count = org_entries.filter(status='FINALIZED').count()
+            allowed_dept_ids = {tree.department_id(org_id) for org_id in allowed_org_ids} - {None}
+
+        org_stats = []
+        for org in tree.nodes.values():
+            if org.org_type != 'dept':
+                continue
+            if allowed_dept_ids is not None and org.id not in allowed_dept_ids:
+                continue
+            e_count, f_count = dept_totals.get(org.id, (0, 0))
+            if not e_count:
+                continue
             org_stats.append({
                 'id': org.id,
                 'name': org.name,
@@ -3231,11 +3253,34 @@ class DashboardSummaryView(APIView):
 
 class BudgetBulkUpsertView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    chunk_size = 1000
 
-    @transaction.atomic
+    @staticmethod
+    def _parse_detail(d):
+        # 유효성 검사: price/qty/freq는 숫자, name은 문자열
+        if not isinstance(d, dict):
+            return None
+        try:
+            price = int(d.get('price', 0))
+            qty = float(d.get('qty', 1))
+            freq = int(d.get('freq', 1))
+        except (TypeError, ValueError):
+            return None  # 잘못된 숫자 형식은 건너뜀
+        return {
+            'name': str(d.get('name', 'Bulk Item'))[:200],  # 최대 200자
+            'price': price,
+            'qty': qty,
+            'freq': max(freq, 1),
+            'unit': str(d.get('unit', '식'))[:20],
+            'source': str(d.get('source', 'SELF'))[:50],
+        }
+
+    @deferred_totals()
     def post(self, request):
         """
         Expects: { "year": 2026, "round": 0, "entries": [ { "subject_code": "...", "org_code": "...", "details": [...] } ] }
+        Returns counts plus a per-row manifest (created/updated/skipped with reason).
+        Entries are keyed by (year, round, subject, org) without an entrusted project.
         """
         denied = _require_roles_response(
             request,
@@ -3244,71 +3289,257 @@ class BudgetBulkUpsertView(APIView):
         )
         if denied is not None:
             return denied
+        if _wants_background(request):
+            return _deferred_response(request)
         year = request.data.get('year')
         round_no = request.data.get('round', 0)
         entry_list = request.data.get('entries', [])
-        
-        if not year or not entry_list:
+
+        if not year or not entry_list or not isinstance(entry_list, list):
             return Response({'error': 'year and entries list required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            year = int(year)
+            round_no = int(round_no or 0)
+        except (TypeError, ValueError):
+            return Response({'error': 'year and round must be integers'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Pre-cache orgs and subjects for speed
-        org_map = {o.code: o for o in Organization.objects.all()}
-        sub_map = {s.code: s for s in BudgetSubject.objects.filter(level=4)}
+        items = [item if isinstance(item, dict) else {} for item in entry_list]
+        org_map = {
+            o.code: o.id
+            for o in Organization.objects.filter(code__in={str(i.get('org_code')) for i in items if i.get('org_code')})
+        }
+        sub_map = {
+            s.code: s.id
+            for s in BudgetSubject.objects.filter(level=4, code__in={str(i.get('subject_code')) for i in items if i.get('subject_code')})
+        }
         allowed_org_ids = _scope_org_ids_for_user(request)
 
-        created_count = 0
-        updated_count = 0
-        
-        for item in entry_list:
+        # 1) Classify rows; a later row with the same key supersedes earlier ones.
+        manifest = []
+        row_by_key = {}
+        for index, item in enumerate(items):
             sc = item.get('subject_code')
             oc = item.get('org_code')
-            if sc not in sub_map or oc not in org_map:
-                continue
-            if allowed_org_ids is not None and org_map[oc].id not in allowed_org_ids:
-                continue
-
-            entry, created = BudgetEntry.objects.get_or_create(
+            row = {'index': index, 'subject_code': sc, 'org_code': oc, 'status': 'skipped', 'entry_id': None}
+            manifest.append(row)
+            if not item:
+                row['reason'] = 'invalid_row'
+            elif sc not in sub_map:
+                row['reason'] = 'unknown_subject'
+            elif oc not in org_map:
+                row['reason'] = 'unknown_org'
+            elif allowed_org_ids is not None and org_map[oc] not in allowed_org_ids:
+                row['reason'] = 'out_of_scope'
+            else:
+                key = (sub_map[sc], org_map[oc])
+                previous = row_by_key.get(key)
+                if previous is not None:
+                    previous['reason'] = f'superseded_by_row_{index}'
+                row_by_key[key] = row
+
+        # 2) Resolve existing entries in one query, bulk-create the missing ones.
+        existing = {}
+        if row_by_key:
+            subject_ids = {key[0] for key in row_by_key}
+            org_ids = {key[1] for key in row_by_key}
+            existing_qs = BudgetEntry.objects.select_for_update().filter(
                 year=year,
                 supplemental_round=round_no,
-                subject=sub_map[sc],
-                organization=org_map[oc],
-                defaults={'status': 'DRAFT'}
-            )
-            if created: created_count += 1
-            else: updated_count += 1
-
-            # If details provided, replace them
-            details_data = item.get('details')
-            if isinstance(details_data, list):
-                entry.details.all().delete()
-                for d in details_data:
-                    # 유효성 검사: price/qty/freq는 숫자, name은 문자열
-                    try:
-                        price = int(d.get('price', 0))
-                        qty = float(d.get('qty', 1))
-                        freq = int(d.get('freq', 1))
-                    except (TypeError, ValueError):
-                        continue  # 잘못된 숫자 형식은 건너뜀
-                    name = str(d.get('name', 'Bulk Item'))[:200]  # 최대 200자
-                    if freq < 1:
-                        freq = 1
-                    BudgetDetail.objects.create(
-                        entry=entry,
-                        name=name,
-                        price=price,
-                        qty=qty,
-                        freq=freq,
-                        unit=str(d.get('unit', '식'))[:20],
-                        source=str(d.get('source', 'SELF'))[:50],
-                    )
-        
+                entrusted_project__isnull=True,
+                subject_id__in=subject_ids,
+                organization_id__in=org_ids,
+            ).values_list('subject_id', 'organization_id', 'id')
+            for subject_id, org_id, entry_id in existing_qs:
+                existing.setdefault((subject_id, org_id), entry_id)
+
+        missing_keys = [key for key in row_by_key if key not in existing]
+        created_entries = BudgetEntry.objects.bulk_create(
+            [
+                BudgetEntry(year=year, supplemental_round=round_no, subject_id=sid, organization_id=oid, status='DRAFT')
+                for sid, oid in missing_keys
+            ],
+            batch_size=self.chunk_size,
+        )
+        created_map = {(e.subject_id, e.organization_id): e.pk for e in created_entries}
+
+        # 3) Replace details (chunked delete + bulk_create) for rows that carry a list.
+        replace_entry_ids = []
+        new_details = []
+        for key, row in row_by_key.items():
+            is_created = key in created_map
+            entry_id = created_map[key] if is_created else existing[key]
+            row['status'] = 'created' if is_created else 'updated'
+            row['entry_id'] = entry_id
+            row.pop('reason', None)
+            details_data = items[row['index']].get('details')
+            if not isinstance(details_data, list):
+                continue
+            replace_entry_ids.append(entry_id)
+            parsed = [self._parse_detail(d) for d in details_data]
+            valid = [d for d in parsed if d is not None]
+            row['details'] = len(valid)
+            if len(valid) != len(parsed):
+                row['skipped_details'] = len(parsed) - len(valid)
+            new_details.extend(BudgetDetail(entry_id=entry_id, **d) for d in valid)
+
+        for start in range(0, len(replace_entry_ids), self.chunk_size):
+            BudgetDetail.objects.filter(entry_id__in=replace_entry_ids[start:start + self.chunk_size]).delete()
+        BudgetDetail.objects.bulk_create(new_details, batch_size=self.chunk_size)
+        mark_entries_dirty(replace_entry_ids)
+        mark_rollup_entries(row['entry_id'] for row in row_by_key.values())
+
+        created_count = sum(1 for row in manifest if row['status'] == 'created')
+        updated_count = sum(1 for row in manifest if row['status'] == 'updated')
         return Response({
             'status': 'ok',
             'created': created_count,
-            'updated': updated_count
+            'updated': updated_count,
+            'skipped': len(manifest) - created_count - updated_count,
+            'rows': manifest,
         })
 
 
+class BudgetImportViewSet(viewsets.ViewSet):
+    """
+    Streaming NDJSON/CSV import of budget details (export_macro_input_data shape).
+    POST returns 202 with a ``budget_import`` job; GET /api/jobs/{id}/ reports
+    progress and POST /api/jobs/{id}/resume/ continues a failed import.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    upload_chunk_bytes = 64 * 1024
+
+    @staticmethod
+    def _detect_format(value, content_type, filename):
+        value = str(value or '').strip().lower()
+        if value in ('csv', 'ndjson'):
+            return value
+        if 'ndjson' in content_type or 'jsonl' in content_type or filename.lower().endswith(('.ndjson', '.jsonl')):
+            return 'ndjson'
+        if 'csv' in content_type or filename.lower().endswith('.csv'):
+            return 'csv'
+        return None
+
+    def create(self, request, *args, **kwargs):
+        denied = _require_roles_response(
+            request,
+            {'MANAGER', 'ADMIN'},
+            message='Import is allowed only for MANAGER or ADMIN.',
+        )
+        if denied is not None:
+            return denied
+
+        content_type = (request.content_type or '').lower()
+        is_multipart = content_type.startswith('multipart/')
+        params = request.data if is_multipart else request.query_params
+        upload = request.FILES.get('file') if is_multipart else None
+        filename = getattr(upload, 'name', None) or str(params.get('filename') or 'import')
+
+        try:
+            year = int(params.get('year'))
+            round_no = int(params.get('round') or 0)
+            chunk_size = int(params.get('chunk_size') or settings.BUDGET_IMPORT_CHUNK_SIZE)
+        except (TypeError, ValueError):
+            return Response({'error': 'year, round and chunk_size must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        mode = str(params.get('mode') or 'replace').lower()
+        if mode not in ('replace', 'append'):
+            return Response({'error': 'mode must be replace or append'}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = self._detect_format(
+            params.get('file_format'),
+            getattr(upload, 'content_type', '') or content_type,
+            filename,
+        )
+        if file_format is None:
+            return Response({'error': 'file_format must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+        if is_multipart and upload is None:
+            return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        scope = _scope_org_ids_for_user(request)
+        filename = filename[:255]
+        if upload is not None:
+            stored, total_bytes = store_upload(filename, upload)
+        else:
+            # Raw body: copy the request stream to disk without buffering it in memory.
+            with tempfile.TemporaryFile() as tmp:
+                stream = request.stream
+                while stream is not None:
+                    chunk = stream.read(self.upload_chunk_bytes)
+                    if not chunk:
+                        break
+                    tmp.write(chunk)
+                tmp.seek(0)
+                stored, total_bytes = store_upload(filename, File(tmp))
+        if not total_bytes:
+            default_storage.delete(stored)
+            return Response({'error': 'empty upload'}, status=status.HTTP_400_BAD_REQUEST)
+        job = start_import_job(
+            user=request.user,
+            file=stored,
+            filename=filename,
+            total_bytes=total_bytes,
+            year=year,
+            round=round_no,
+            file_format=file_format,
+            mode=mode,
+            chunk_size=max(1, chunk_size),
+            scope_org_ids=sorted(scope) if scope is not None else None,
+        )
+        return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Background jobs (?background=1 on heavy endpoints, processed by `manage.py run_jobs`).
+    GET /api/jobs/{id}/ reports status and progress; results with a file are under artifact/.
+    """
+    serializer_class = JobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        qs = Job.objects.all()
+        if not _is_admin(self.request):
+            qs = qs.filter(created_by=self.request.user)
+        kind = self.request.query_params.get('kind')
+        if kind:
+            qs = qs.filter(kind=kind)
+        job_status = self.request.query_params.get('status')
+        if job_status:
+            qs = qs.filter(status=job_status.upper())
+        return qs
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Cancel a queued job; a running job stops at its next progress checkpoint."""
+        job = self.get_object()
+        if not cancel_job(job):
+            return Response({'error': f'Job is {job.status}.'}, status=status.HTTP_409_CONFLICT)
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        """Resume a failed or cancelled job from its checkpoint (?force=1 for a RUNNING job with a stale heartbeat)."""
+        job = self.get_object()
+        if not is_resumable(job.kind):
+            return Response({'error': f'{job.kind} jobs cannot be resumed.'}, status=status.HTTP_400_BAD_REQUEST)
+        force = str(request.query_params.get('force') or '').lower() in ('1', 'true', 'yes')
+        resumed = resume_job(job, force=force)
+        if resumed is None:
+            job.refresh_from_db()
+            return Response({'error': f'Job is {job.status}.'}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(resumed).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def artifact(self, request, pk=None):
+        job = self.get_object()
+        if job.status != 'SUCCEEDED' or not job.artifact:
+            return Response({'error': 'No artifact for this job.'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(
+            job.artifact.open('rb'),
+            as_attachment=True,
+            filename=job.artifact_name or Path(job.artifact.name).name,
+            content_type=job.artifact_content_type or 'application/octet-stream',
+        )
+
 
 class ERPNextViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
@@ -3365,6 +3596,8 @@ class ERPNextViewSet(viewsets.ViewSet):
         config_error = self._config_or_error()
         if config_error:
             return config_error
+        if _wants_background(request):
+            return _deferred_response(request)
 
         year = request.data.get('year') or request.query_params.get('year')
         if not year:
@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -203,7 +204,7 @@ else:
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'budget_mgmt.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -220,6 +221,34 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': _env_int('DRF_PAGE_SIZE', 200),
 }
 
+# Cache (shared across workers when REDIS_URL is set)
+REDIS_URL = os.environ.get('REDIS_URL', '').strip()
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Per-device API tokens: lifetime (seconds, 0 = no expiry), resolved-session cache (seconds)
+# and active tokens kept per user (oldest revoked first, 0 = unlimited)
+AUTH_TOKEN_TTL = _env_int('AUTH_TOKEN_TTL', 14 * 24 * 3600)
+AUTH_TOKEN_CACHE_TIMEOUT = _env_int('AUTH_TOKEN_CACHE_TIMEOUT', 300)
+AUTH_TOKEN_MAX_PER_USER = _env_int('AUTH_TOKEN_MAX_PER_USER', 10)
+# Organization scope cache (seconds), invalidated on hierarchy changes
+ORG_SCOPE_CACHE_TIMEOUT = _env_int('ORG_SCOPE_CACHE_TIMEOUT', 300)
+# Process-wide organization tree index, rebuilt at least this often (seconds)
+ORG_TREE_MAX_AGE = _env_int('ORG_TREE_MAX_AGE', 300)
+# Process-wide budget subject tree index, rebuilt at least this often (seconds)
+SUBJECT_TREE_MAX_AGE = _env_int('SUBJECT_TREE_MAX_AGE', 300)
+
 # ERPNext integration
 ERPNEXT_BASE_URL = os.environ.get('ERPNEXT_BASE_URL', '').rstrip('/')
 ERPNEXT_API_KEY = os.environ.get('ERPNEXT_API_KEY', '')
@@ -232,3 +261,52 @@ ERPNEXT_VERIFY_TLS = os.environ.get('ERPNEXT_VERIFY_TLS', 'true').lower() in ('1
 
 # Official budget book template (.xlsx)
 BUDGET_BOOK_TEMPLATE_PATH = os.environ.get('BUDGET_BOOK_TEMPLATE_PATH', '').strip()
+# Keep a parsed copy of the template per process; optionally parse it at startup
+BUDGET_BOOK_TEMPLATE_CACHE = _env_bool('BUDGET_BOOK_TEMPLATE_CACHE', True)
+BUDGET_BOOK_TEMPLATE_WARMUP = _env_bool('BUDGET_BOOK_TEMPLATE_WARMUP', False)
+# Exported budget books cached by data fingerprint, LRU-evicted above this size
+BUDGET_BOOK_CACHE_DIR = os.environ.get('BUDGET_BOOK_CACHE_DIR', '').strip() or str(BASE_DIR / 'cache' / 'budget_book')
+BUDGET_BOOK_CACHE_MAX_BYTES = _env_int('BUDGET_BOOK_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+
+# Streaming budget detail import (/api/imports/)
+BUDGET_IMPORT_CHUNK_SIZE = _env_int('BUDGET_IMPORT_CHUNK_SIZE', 500)
+
+# Set-based version cloning (create_next_round / clone_from_previous)
+BUDGET_CLONE_CHUNK_SIZE = _env_int('BUDGET_CLONE_CHUNK_SIZE', 1000)
+
+# Local job queue (/api/jobs/). Off: jobs run inline.
+BUDGET_JOBS_ASYNC = _env_bool('BUDGET_JOBS_ASYNC', True)
+# Set when a `manage.py run_jobs` worker is deployed; otherwise each web process
+# drains the queue in a background thread after enqueueing.
+BUDGET_JOBS_EXTERNAL_WORKER = _env_bool('BUDGET_JOBS_EXTERNAL_WORKER', False)
+BUDGET_JOBS_WORKERS = _env_int('BUDGET_JOBS_WORKERS', 2)
+BUDGET_JOBS_POLL_INTERVAL = _env_int('BUDGET_JOBS_POLL_INTERVAL', 2)
+# RUNNING jobs without a heartbeat for this long (seconds) are requeued
+BUDGET_JOBS_STALE_AFTER = _env_int('BUDGET_JOBS_STALE_AFTER', 600)
+
+# Buffered request audit log (budget_mgmt.audit_writer). Off under `manage.py test`,
+# where logs are written synchronously in the request transaction.
+TESTING = sys.argv[1:2] == ['test']
+AUDIT_LOG_ASYNC = _env_bool('AUDIT_LOG_ASYNC', not TESTING)
+AUDIT_LOG_BATCH_SIZE = _env_int('AUDIT_LOG_BATCH_SIZE', 200)
+AUDIT_LOG_FLUSH_INTERVAL = _env_int('AUDIT_LOG_FLUSH_INTERVAL', 1)
+# Buffered records per process before callers block, then fall back to a direct write
+AUDIT_LOG_MAX_BUFFER = _env_int('AUDIT_LOG_MAX_BUFFER', 5000)
+AUDIT_LOG_BLOCK_TIMEOUT = _env_int('AUDIT_LOG_BLOCK_TIMEOUT', 1)
+# Crash-safe spool segments; leftovers are replayed by the flusher and `manage.py flush_audit_spool`
+AUDIT_LOG_SPOOL_DIR = os.environ.get('AUDIT_LOG_SPOOL_DIR', '').strip() or str(BASE_DIR / 'spool' / 'audit')
+AUDIT_LOG_REPLAY_INTERVAL = _env_int('AUDIT_LOG_REPLAY_INTERVAL', 30)
+
+# ApprovalLog archival (`manage.py archive_audit_logs`): months older than AUDIT_LOG_HOT_MONTHS
+# move to gzip files; /api/logs/ reads both transparently.
+AUDIT_LOG_ARCHIVE_DIR = os.environ.get('AUDIT_LOG_ARCHIVE_DIR', '').strip() or str(BASE_DIR / 'archive' / 'audit_logs')
+AUDIT_LOG_HOT_MONTHS = _env_int('AUDIT_LOG_HOT_MONTHS', 3)
+# Per-log_type retention in months, e.g. "AUTH=12,SYSTEM=12,CRUD=36"; unlisted types are kept forever,
+# as are logs bound to a budget entry (like archival, purging skips them)
+AUDIT_LOG_RETENTION_MONTHS = {
+    key.strip().upper(): int(value)
+    for key, _, value in (item.partition('=') for item in _env_csv('AUDIT_LOG_RETENTION_MONTHS'))
+    if value.strip().isdigit()
+}
+# Rows fetched per round trip by the streaming /api/logs/export/
+AUDIT_LOG_EXPORT_CHUNK_SIZE = _env_int('AUDIT_LOG_EXPORT_CHUNK_SIZE', 2000)
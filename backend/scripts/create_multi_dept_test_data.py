@@ -26,6 +26,7 @@ from budget_mgmt.models import (  # noqa: E402
     Organization,
     UserProfile,
 )
+from budget_mgmt.totals import deferred_totals  # noqa: E402
 
 
 @dataclass
@@ -274,15 +275,16 @@ def main() -> None:
     )
 
     # All members participate in each dept entry (two details each entry).
-    create_detail(c_a, entry_id=e1, org_id=org_a.id, name="Infra Maintenance", price=300_000, qty=2)
-    create_detail(c_b, entry_id=e1, org_id=org_a.id, name="Security Audit", price=150_000, qty=4)
-    create_detail(c_b, entry_id=e2, org_id=org_a.id, name="Workspace Upgrade", price=500_000, qty=1)
-    create_detail(c_a, entry_id=e2, org_id=org_a.id, name="Training Program", price=200_000, qty=3)
-
-    create_detail(c_d, entry_id=e3, org_id=org_b.id, name="Cloud Service", price=400_000, qty=2)
-    create_detail(c_e, entry_id=e3, org_id=org_b.id, name="Endpoint Protection", price=120_000, qty=5)
-    create_detail(c_e, entry_id=e4, org_id=org_b.id, name="Office Supplies", price=250_000, qty=2)
-    create_detail(c_d, entry_id=e4, org_id=org_b.id, name="Team Workshop", price=100_000, qty=3)
+    with deferred_totals():
+        create_detail(c_a, entry_id=e1, org_id=org_a.id, name="Infra Maintenance", price=300_000, qty=2)
+        create_detail(c_b, entry_id=e1, org_id=org_a.id, name="Security Audit", price=150_000, qty=4)
+        create_detail(c_b, entry_id=e2, org_id=org_a.id, name="Workspace Upgrade", price=500_000, qty=1)
+        create_detail(c_a, entry_id=e2, org_id=org_a.id, name="Training Program", price=200_000, qty=3)
+
+        create_detail(c_d, entry_id=e3, org_id=org_b.id, name="Cloud Service", price=400_000, qty=2)
+        create_detail(c_e, entry_id=e3, org_id=org_b.id, name="Endpoint Protection", price=120_000, qty=5)
+        create_detail(c_e, entry_id=e4, org_id=org_b.id, name="Office Supplies", price=250_000, qty=2)
+        create_detail(c_d, entry_id=e4, org_id=org_b.id, name="Team Workshop", price=100_000, qty=3)
 
     # Submit by creators.
     submit_entry(c_a, e1)
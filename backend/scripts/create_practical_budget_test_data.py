@@ -26,6 +26,7 @@ from budget_mgmt.models import (  # noqa: E402
     BudgetVersion,
     Organization,
 )
+from budget_mgmt.totals import deferred_totals, detail_amount_sum  # noqa: E402
 
 
 def expect(condition: bool, label: str, detail: str = "") -> None:
@@ -272,23 +273,24 @@ def main() -> None:
         )
         created_entry_ids.append(entry_id)
 
-        for idx, detail in enumerate(spec.details):
-            create_detail(
-                creator,
-                {
-                    "entry": entry_id,
-                    "name": detail.name,
-                    "price": detail.price,
-                    "qty": detail.qty,
-                    "freq": detail.freq,
-                    "currency_unit": "KRW",
-                    "unit": "EA",
-                    "freq_unit": "TIME",
-                    "source": detail.source,
-                    "organization": org.id,
-                    "sort_order": idx,
-                },
-            )
+        with deferred_totals():
+            for idx, detail in enumerate(spec.details):
+                create_detail(
+                    creator,
+                    {
+                        "entry": entry_id,
+                        "name": detail.name,
+                        "price": detail.price,
+                        "qty": detail.qty,
+                        "freq": detail.freq,
+                        "currency_unit": "KRW",
+                        "unit": "EA",
+                        "freq_unit": "TIME",
+                        "source": detail.source,
+                        "organization": org.id,
+                        "sort_order": idx,
+                    },
+                )
 
         # Workflow to target state.
         if spec.status_target in ("PENDING", "REVIEWING", "FINALIZED"):
@@ -314,7 +316,7 @@ def main() -> None:
 
         # DB-level checks per entry.
         entry = BudgetEntry.objects.get(id=entry_id)
-        detail_total = sum(int(d.total_price or 0) for d in entry.details.all())
+        detail_total = entry.details.aggregate(total=detail_amount_sum())["total"]
         execution_total = sum(int(e.amount or 0) for e in BudgetExecution.objects.filter(entry_id=entry_id))
         expect(int(entry.total_amount or 0) == detail_total, "entry total synced", f"entry={entry_id}")
         expect(int(entry.executed_amount or 0) == execution_total, "entry executed synced", f"entry={entry_id}")
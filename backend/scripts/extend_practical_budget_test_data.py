@@ -27,6 +27,7 @@ from budget_mgmt.models import (  # noqa: E402
     BudgetVersion,
     Organization,
 )
+from budget_mgmt.totals import deferred_totals, detail_amount_sum  # noqa: E402
 
 
 def expect(condition: bool, label: str, detail: str = "") -> None:
@@ -195,23 +196,24 @@ def main() -> None:
         )
         created_income_entry_ids.append(entry_id)
 
-        for idx, d in enumerate(spec.details):
-            create_detail(
-                creator,
-                {
-                    "entry": entry_id,
-                    "name": d.name,
-                    "price": d.price,
-                    "qty": d.qty,
-                    "freq": d.freq,
-                    "currency_unit": "KRW",
-                    "unit": "EA",
-                    "freq_unit": "TIME",
-                    "source": d.source,
-                    "organization": org.id,
-                    "sort_order": idx,
-                },
-            )
+        with deferred_totals():
+            for idx, d in enumerate(spec.details):
+                create_detail(
+                    creator,
+                    {
+                        "entry": entry_id,
+                        "name": d.name,
+                        "price": d.price,
+                        "qty": d.qty,
+                        "freq": d.freq,
+                        "currency_unit": "KRW",
+                        "unit": "EA",
+                        "freq_unit": "TIME",
+                        "source": d.source,
+                        "organization": org.id,
+                        "sort_order": idx,
+                    },
+                )
 
         if spec.status_target in ("PENDING", "REVIEWING", "FINALIZED"):
             transition_entry(entry_id, "PENDING", creator_user, "seed submit")
@@ -270,7 +272,7 @@ def main() -> None:
     # Sync checks.
     for entry_id in all_pattern_entry_ids:
         entry = BudgetEntry.objects.get(id=entry_id)
-        detail_total = sum(int(d.total_price or 0) for d in entry.details.all())
+        detail_total = entry.details.aggregate(total=detail_amount_sum())["total"]
         execution_total = sum(int(e.amount or 0) for e in entry.executions.all())
         expect(int(entry.total_amount or 0) == detail_total, "entry total sync", f"entry={entry_id}")
         expect(int(entry.executed_amount or 0) == execution_total, "entry executed sync", f"entry={entry_id}")
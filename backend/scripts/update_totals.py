@@ -10,23 +10,13 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'budget_project.settings')
 django.setup()
 
 from budget_mgmt.models import BudgetEntry
+from budget_mgmt.totals import recompute_entry_totals
 
 def update_all_entries():
-    entries = BudgetEntry.objects.all()
-    count = entries.count()
-    print(f"Updating {count} entries...")
-    
-    updated = 0
-    for entry in entries:
-        try:
-            # We call update_totals which calculates and saves
-            entry.update_totals()
-            updated += 1
-            if updated % 100 == 0:
-                print(f"Updated {updated}/{count}")
-        except Exception as e:
-            print(f"Error updating entry {entry.id}: {e}")
-
+    entry_ids = list(BudgetEntry.objects.values_list('id', flat=True))
+    print(f"Updating {len(entry_ids)} entries...")
+    # One aggregate UPDATE per batch instead of entry.update_totals() per row
+    updated = recompute_entry_totals(entry_ids)
     print(f"Done. Updated {updated} entries.")
 
 if __name__ == "__main__":